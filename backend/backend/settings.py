@@ -1,7 +1,10 @@
+import importlib.util
 import os
 from pathlib import Path
 from datetime import timedelta
 
+from corsheaders.defaults import default_headers
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 # ---------------- SECURITY ----------------
@@ -30,6 +33,8 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Added for static files
+    # Below WhiteNoise, which serves its own precompressed static files
+    'menu_app.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -68,6 +73,23 @@ DATABASES = {
     }
 }
 
+# ---------------- CACHE ----------------
+# Required with more than one worker: membership caching, claims-only JWT revocation,
+# throttles and request coalescing need a cache every worker shares (needs the `redis`
+# package; `manage.py check --deploy` fails without it). Without it each worker has its
+# own LocMemCache and memberships are read from the database on every request.
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+# An identical availability check or STK push already running in another worker is
+# waited for this long before the request does the work itself
+SINGLEFLIGHT_WAIT_SECONDS = float(os.environ.get("SINGLEFLIGHT_WAIT_SECONDS", "25"))
+
 # ---------------- PASSWORD VALIDATION ----------------
 AUTH_PASSWORD_VALIDATORS = []
 
@@ -91,16 +113,47 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 # ---------------- MEDIA FILES ----------------
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Browser cache lifetime for images saved before content-hash names (hashed ones are immutable)
+MEDIA_CACHE_SECONDS = int(os.environ.get("MEDIA_CACHE_SECONDS", "3600"))
+# Let the front server send the bytes: an nginx `internal` location mapped to MEDIA_ROOT
+# (e.g. "/protected-media/"), or X-Sendfile for Apache/lighttpd
+MEDIA_ACCEL_REDIRECT = os.environ.get("MEDIA_ACCEL_REDIRECT") or None
+MEDIA_SENDFILE = os.environ.get("MEDIA_SENDFILE", "False") == "True"
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # ---------------- REST FRAMEWORK ----------------
+# Authorise from access-token claims (user id, staff flag, hotel memberships)
+# instead of loading the User row on every request.
+JWT_STATELESS_AUTH = os.environ.get('JWT_STATELESS_AUTH', 'False') == 'True'
+
+# MessagePack (Accept: application/msgpack) is offered only when the optional package is installed
+MSGPACK_ENABLED = importlib.util.find_spec('msgpack') is not None
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        'menu_app.authentication.ClaimsJWTAuthentication'
+        if JWT_STATELESS_AUTH else
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': [
+        'menu_app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ] + (['menu_app.renderers.MessagePackRenderer'] if MSGPACK_ENABLED else []),
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ] + (['menu_app.renderers.MessagePackParser'] if MSGPACK_ENABLED else []),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # Rates for the public endpoints (menu_app.throttling): requests per sliding period
+    'DEFAULT_THROTTLE_RATES': {
+        'stk_push': os.environ.get('THROTTLE_STK_PUSH', '5/min'),
+        'availability': os.environ.get('THROTTLE_AVAILABILITY', '60/min'),
+    },
+    # Reverse proxies in front of the app; throttles only read X-Forwarded-For when this is set
+    'NUM_PROXIES': int(os.environ['NUM_PROXIES']) if os.environ.get('NUM_PROXIES') else None,
 }
 
 # ---------------- SIMPLE JWT ----------------
@@ -108,10 +161,13 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'menu_app.authentication.HotelTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'menu_app.authentication.HotelTokenRefreshSerializer',
 }
 
 # ---------------- CORS ----------------
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
 
 # ---------------- M-PESA CONFIG ----------------
 MPESA_CONSUMER_KEY = os.environ.get("MPESA_CONSUMER_KEY", "your_sandbox_consumer_key")
@@ -123,6 +179,60 @@ MPESA_CALLBACK_URL = os.environ.get(
     "https://your-domain.com/api/mpesa/callback/"
 )
 MPESA_ENVIRONMENT = os.environ.get("MPESA_ENVIRONMENT", "sandbox")
+# Appended to MPESA_CALLBACK_URL as ?token=...; callbacks without it are rejected. Set it in production
+MPESA_CALLBACK_TOKEN = os.environ.get("MPESA_CALLBACK_TOKEN", "")
+# Comma-separated Safaricom addresses allowed to call back (REMOTE_ADDR); empty allows any
+MPESA_CALLBACK_IPS = [ip.strip() for ip in os.environ.get("MPESA_CALLBACK_IPS", "").split(",") if ip.strip()]
+# Successful STK pushes are replayed to identical retries within this window
+MPESA_STK_DEDUP_SECONDS = int(os.environ.get("MPESA_STK_DEDUP_SECONDS", "30"))
+
+# ---------------- IDEMPOTENCY KEYS ----------------
+# Stored responses are replayed to retries with the same Idempotency-Key for this long
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+# How long a duplicate waits for the first request before answering 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# A claim that never finished (worker died) can be taken over after this many seconds
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "120"))
+
+# ---------------- OUTBOX (webhook relay) ----------------
+OUTBOX_TIMEOUT_SECONDS = float(os.environ.get("OUTBOX_TIMEOUT_SECONDS", "10"))
+# Retries double from OUTBOX_BACKOFF_SECONDS up to OUTBOX_BACKOFF_MAX_SECONDS; after
+# OUTBOX_MAX_ATTEMPTS attempts a message is marked failed
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "12"))
+OUTBOX_BACKOFF_SECONDS = int(os.environ.get("OUTBOX_BACKOFF_SECONDS", "30"))
+OUTBOX_BACKOFF_MAX_SECONDS = int(os.environ.get("OUTBOX_BACKOFF_MAX_SECONDS", "21600"))
+# A claimed batch not finished within this time (relay died) is delivered again; a batch stops
+# sending OUTBOX_TIMEOUT_SECONDS before it, so keep it well above the timeout
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", "300"))
+
+# ---------------- COMPRESSION ----------------
+# Responses smaller than this are sent as is (streams are read ahead up to it)
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+# Used when the optional `brotli` package is installed and the client accepts br
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "5"))
+
+# ---------------- STARTUP ----------------
+# Worker boot budget checked by `manage.py profile_startup` and the boot-time test
+BOOT_TIME_BUDGET_MS = int(os.environ.get("BOOT_TIME_BUDGET_MS", "2000"))
+
+# ---------------- CURRENCY ----------------
+# Prices are normalised into this currency (Product.price_base) for comparison and filtering
+BASE_CURRENCY = os.environ.get("BASE_CURRENCY", "KES")
+# Longest stay that can be quoted or booked (pricing builds a nightly calendar per room)
+MAX_QUOTE_NIGHTS = int(os.environ.get("MAX_QUOTE_NIGHTS", "365"))
+
+# ---------------- LIVE EVENTS (SSE) ----------------
+# Directory for per-worker unix sockets used to fan events out across workers.
+# Leave unset for single-process deployments.
+EVENTS_SOCKET_DIR = os.environ.get("EVENTS_SOCKET_DIR") or None
+
+# ---------------- CATALOG SNAPSHOT ----------------
+# Directory (shared by the workers of one host, e.g. on tmpfs) for the memory-mapped
+# catalog snapshot that product listings are served from. Leave unset to always query the database.
+CATALOG_SNAPSHOT_DIR = os.environ.get("CATALOG_SNAPSHOT_DIR") or None
+# Minimum seconds between rebuilds; listings fall back to the database while the snapshot is stale
+CATALOG_SNAPSHOT_REBUILD_SECONDS = float(os.environ.get("CATALOG_SNAPSHOT_REBUILD_SECONDS", "5"))
 
 # ---------------- JAZZMIN CONFIG ----------------
 JAZZMIN_SETTINGS = {
@@ -2,10 +2,10 @@ from django.contrib import admin
 from django.urls import path, include, re_path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.conf import settings
-from django.conf.urls.static import static
-from django.views.generic import TemplateView
-from django.views.static import serve as static_serve
-import os
+from django.http import Http404
+from django.template import TemplateDoesNotExist
+from django.template.response import TemplateResponse
+from menu_app.media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -16,19 +16,25 @@ urlpatterns = [
     path('api/', include('menu_app.urls')),
 ]
 
-# Serve media files in development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Serve media files (conditional/Range requests, long-lived caching, optional X-Accel-Redirect offload)
+urlpatterns += [
+    re_path(rf"^{settings.MEDIA_URL.strip('/')}/(?P<path>.+)$", serve_media, name='media'),
+]
 
 # -------------------------------
 # FRONTEND (React) SERVING
 # -------------------------------
 
-# Path to index.html inside frontend_build
-index_file = os.path.join(settings.BASE_DIR, "frontend_build", "index.html")
+def frontend_index(request):
+    """Serve the React index.html; 404 when no frontend build is deployed (checked per request, not at import)."""
+    response = TemplateResponse(request, "index.html")
+    try:
+        return response.render()
+    except TemplateDoesNotExist:
+        raise Http404("Frontend build not found")
+
 
-if os.path.exists(index_file):
-    # Serve the React index.html for any non-API route
-    urlpatterns += [
-        re_path(r"^(?!api/|admin/).*", TemplateView.as_view(template_name="index.html")),
-    ]
+# Serve the React index.html for any non-API route
+urlpatterns += [
+    re_path(r"^(?!api/|admin/).*", frontend_index),
+]
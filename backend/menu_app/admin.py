@@ -1,6 +1,102 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Hotel, Product, Category, HotelUser, CanonicalProduct, Booking
+from .models import (
+    Hotel, Product, Category, HotelUser, CanonicalProduct, Booking, ExchangeRate, RatePlan, Order, OrderItem,
+    WebhookEndpoint, OutboxMessage,
+)
+from .currency import recompute_base_prices
+from .lookups import type_choice_ids
+from .bulk import bulk_update_products
+from .orders import set_order_status
+
+# Below this many rows an exact COUNT(*) is cheap enough
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+# ADMIN HELPERS (large changelists)
+class EstimatedCountPaginator(Paginator):
+    """
+    Use PostgreSQL's planner estimate instead of COUNT(*) for unfiltered
+    changelists of big tables; other databases and filtered lists count exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATED_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
+
+
+class SlugInputFilter(admin.SimpleListFilter):
+    """Free-text filter on a related slug, instead of listing every related row in the sidebar."""
+    template = 'admin/menu_app/input_filter.html'
+    lookup = None
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        return []
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.lookup: self.value().strip()})
+        return queryset
+
+
+class HotelSlugFilter(SlugInputFilter):
+    title = 'hotel slug'
+    parameter_name = 'hotel_slug'
+    lookup = 'hotel__slug'
+
+
+class CategorySlugFilter(SlugInputFilter):
+    title = 'category slug'
+    parameter_name = 'category_slug'
+    lookup = 'category__slug'
+
+
+class ProductTypeAutocomplete(AutocompleteSelect):
+    """Autocomplete widget whose search requests carry the product_type being edited."""
+
+    def __init__(self, field, admin_site, product_type, **kwargs):
+        super().__init__(field, admin_site, **kwargs)
+        self.product_type = product_type
+
+    def get_url(self):
+        return f'{super().get_url()}?product_type={self.product_type}'
+
+
+class ProductTypeScopedAdmin(admin.ModelAdmin):
+    """Limits autocomplete results from the product form to rows already used by that product type."""
+    search_fields = ('name',)
+
+    def get_search_results(self, request, queryset, search_term):
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        product_type = request.GET.get('product_type')
+        field_name = request.GET.get('field_name')
+        if product_type and request.GET.get('model_name') == 'product' and field_name in ('canonical', 'category'):
+            queryset = queryset.filter(pk__in=type_choice_ids(product_type)[field_name])
+        return queryset, may_have_duplicates
 
 # HOTEL ADMIN 
 @admin.register(Hotel)
@@ -9,12 +105,15 @@ class HotelAdmin(admin.ModelAdmin):
     search_fields = ('name', 'slug', 'city')
     list_filter = ('city',)
     
-    readonly_fields = ('image_preview',)
+    readonly_fields = ('image_preview', 'geohash')
 
     fieldsets = (
         (None, {
             'fields': ('name', 'slug', 'address', 'city', 'timezone', 'image', 'image_preview')
         }),
+        ('Location', {
+            'fields': ('latitude', 'longitude', 'geohash')
+        }),
     )
 
     def image_preview(self, obj):
@@ -36,6 +135,57 @@ class HotelAdmin(admin.ModelAdmin):
     image_tag.short_description = 'Image'
 
 
+# RATE PLANS (inline on room products)
+class RatePlanInline(admin.TabularInline):
+    model = RatePlan
+    extra = 0
+    fields = ('name', 'nightly_price', 'start_date', 'end_date', 'weekdays', 'min_nights', 'priority', 'is_active')
+
+
+# BULK EDIT (intermediate page of the "Bulk edit" product action)
+class ProductBulkEditForm(forms.Form):
+    PRICE_MODES = (
+        ('', 'Keep prices'),
+        ('price_percent', 'Change by percent'),
+        ('price_delta', 'Change by amount'),
+        ('price', 'Set to'),
+    )
+    TRI_STATE = (('', 'Keep'), ('1', 'Yes'), ('0', 'No'))
+
+    price_mode = forms.ChoiceField(choices=PRICE_MODES, required=False)
+    price_value = forms.DecimalField(max_digits=10, decimal_places=2, required=False)
+    available = forms.ChoiceField(choices=TRI_STATE, required=False)
+    is_archived = forms.ChoiceField(choices=TRI_STATE, required=False, label='Archived')
+    category = forms.ModelChoiceField(Category.objects.order_by('name'), required=False, label='Move to category')
+    clear_category = forms.BooleanField(required=False)
+
+    def clean(self):
+        data = super().clean()
+        mode, value = data.get('price_mode'), data.get('price_value')
+        if mode and value is None:
+            self.add_error('price_value', 'Enter the price change.')
+        if mode == 'price_percent' and value is not None and value < -100:
+            self.add_error('price_value', 'A price cannot drop by more than 100%.')
+        if mode == 'price' and value is not None and value < 0:
+            self.add_error('price_value', 'Prices cannot be negative.')
+        return data
+
+    def changes(self):
+        """The change set for bulk.bulk_update_products()."""
+        data = self.cleaned_data
+        changes = {}
+        if data['price_mode']:
+            changes[data['price_mode']] = data['price_value']
+        for field in ('available', 'is_archived'):
+            if data[field]:
+                changes[field] = data[field] == '1'
+        if data['clear_category']:
+            changes['category'] = None
+        elif data['category']:
+            changes['category'] = data['category']
+        return changes
+
+
 # PRODUCT ADMIN (ROOM + FOOD)
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -43,8 +193,13 @@ class ProductAdmin(admin.ModelAdmin):
         'name', 'hotel', 'product_type', 'price', 'currency',
         'total_rooms', 'available_rooms', 'available', 'image_tag'
     )
-    list_filter = ('hotel', 'category', 'available', 'product_type')
+    list_filter = (HotelSlugFilter, CategorySlugFilter, 'available', 'product_type')
     search_fields = ('name', 'sku')
+    list_select_related = ('hotel',)
+    autocomplete_fields = ('hotel', 'canonical', 'category')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('bulk_edit', 'mark_available', 'mark_unavailable', 'archive_products', 'unarchive_products')
 
     readonly_fields = ('image_preview',)
 
@@ -74,35 +229,80 @@ class ProductAdmin(admin.ModelAdmin):
             fields += ['total_rooms', 'available_rooms', 'available']
         return fields
 
+    def get_inlines(self, request, obj):
+        if obj and obj.product_type == 'room':
+            return [RatePlanInline]
+        return []
+
+    def get_form(self, request, obj=None, **kwargs):
+        # Remember the type for formfield_for_foreignkey instead of fetching the product again
+        request._product_type = obj.product_type if obj else request.GET.get('product_type')
+        return super().get_form(request, obj, **kwargs)
+
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         """
         Filter Canonical and Category options based on product_type.
         Works for both adding and editing.
         """
-        product_type = None
-
-        
-        obj_id = request.resolver_match.kwargs.get('object_id')
-        if obj_id:
-            try:
-                product = Product.objects.get(pk=obj_id)
-                product_type = product.product_type
-            except Product.DoesNotExist:
-                pass
-        
-        elif request.GET.get('product_type'):
-            product_type = request.GET.get('product_type')
-
-        if db_field.name == "canonical" and product_type:
-            kwargs["queryset"] = CanonicalProduct.objects.filter(
-                variants__product_type=product_type
-            ).distinct()
-        if db_field.name == "category" and product_type:
-            kwargs["queryset"] = Category.objects.filter(
-                product__product_type=product_type
-            ).distinct()
+        product_type = getattr(request, '_product_type', None)
+        if db_field.name in ('canonical', 'category') and product_type:
+            ids = type_choice_ids(product_type)[db_field.name]
+            kwargs["queryset"] = db_field.related_model.objects.filter(pk__in=ids)
+            kwargs["widget"] = ProductTypeAutocomplete(
+                db_field, self.admin_site, product_type, using=kwargs.get('using')
+            )
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
+    # BULK ACTIONS (single UPDATE per action, no Product.save())
+    def _apply(self, request, queryset, changes):
+        per_hotel = bulk_update_products(queryset, changes)
+        self.message_user(
+            request,
+            f"Updated {sum(per_hotel.values())} product(s) in {len(per_hotel)} hotel(s).",
+            messages.SUCCESS,
+        )
+
+    @admin.action(description='Bulk edit price, availability, archive or category')
+    def bulk_edit(self, request, queryset):
+        if 'apply' in request.POST:
+            form = ProductBulkEditForm(request.POST)
+            if form.is_valid():
+                changes = form.changes()
+                if not changes:
+                    self.message_user(request, "Nothing to change.", messages.WARNING)
+                    return None
+                self._apply(request, queryset, changes)
+                return None
+        else:
+            form = ProductBulkEditForm()
+
+        return TemplateResponse(request, 'admin/menu_app/product/bulk_edit.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Bulk edit products',
+            'opts': self.model._meta,
+            'form': form,
+            'count': queryset.count(),
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
+    @admin.action(description='Mark selected products available')
+    def mark_available(self, request, queryset):
+        self._apply(request, queryset, {'available': True})
+
+    @admin.action(description='Mark selected products unavailable')
+    def mark_unavailable(self, request, queryset):
+        self._apply(request, queryset, {'available': False})
+
+    @admin.action(description='Archive selected products')
+    def archive_products(self, request, queryset):
+        self._apply(request, queryset, {'is_archived': True})
+
+    @admin.action(description='Unarchive selected products')
+    def unarchive_products(self, request, queryset):
+        self._apply(request, queryset, {'is_archived': False})
+
     def image_preview(self, obj):
         if obj.image:
             return format_html(
@@ -122,8 +322,121 @@ class ProductAdmin(admin.ModelAdmin):
     image_tag.short_description = 'Image'
 
 
-# OTHER MODELS 
-admin.site.register(Category)
-admin.site.register(HotelUser)
-admin.site.register(CanonicalProduct)
-admin.site.register(Booking)
+# EXCHANGE RATE ADMIN
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'rate_to_base', 'updated_at')
+    search_fields = ('currency',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recompute_base_prices([obj.currency])
+
+    def delete_model(self, request, obj):
+        currency = obj.currency
+        super().delete_model(request, obj)
+        recompute_base_prices([currency])
+
+
+# CATEGORY / CANONICAL ADMIN (searchable for the product autocompletes)
+@admin.register(Category)
+class CategoryAdmin(ProductTypeScopedAdmin):
+    list_display = ('name', 'slug')
+    search_fields = ('name', 'slug')
+    ordering = ('name',)
+
+
+@admin.register(CanonicalProduct)
+class CanonicalProductAdmin(ProductTypeScopedAdmin):
+    list_display = ('name', 'sku')
+    search_fields = ('name', 'normalized_name', 'sku')
+    ordering = ('normalized_name',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+# BOOKING ADMIN
+@admin.register(Booking)
+class BookingAdmin(admin.ModelAdmin):
+    list_display = ('id', 'product', 'guest_name', 'check_in', 'check_out', 'status', 'total_price')
+    list_filter = ('status',)
+    search_fields = ('guest_name',)
+    list_select_related = ('product__hotel',)
+    autocomplete_fields = ('product', 'user')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+# FOOD ORDER ADMIN
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    fields = ('product', 'product_name', 'quantity', 'unit_price', 'currency', 'note')
+    readonly_fields = fields
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'hotel', 'table', 'guest_name', 'status', 'total_price', 'created_at')
+    list_filter = ('status', HotelSlugFilter)
+    search_fields = ('guest_name', 'table')
+    list_select_related = ('hotel',)
+    autocomplete_fields = ('hotel', 'user')
+    inlines = [OrderItemInline]
+    readonly_fields = ('total_price',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['mark_preparing', 'mark_ready', 'mark_served', 'mark_cancelled']
+
+    def _set_status(self, request, queryset, status):
+        # One UPDATE, and the kitchen displays hear about it (save() would not publish)
+        updated = set_order_status(queryset, status)
+        self.message_user(request, f"{updated} order(s) marked {status}.", messages.SUCCESS)
+
+    @admin.action(description='Mark selected orders preparing')
+    def mark_preparing(self, request, queryset):
+        self._set_status(request, queryset, 'preparing')
+
+    @admin.action(description='Mark selected orders ready')
+    def mark_ready(self, request, queryset):
+        self._set_status(request, queryset, 'ready')
+
+    @admin.action(description='Mark selected orders served')
+    def mark_served(self, request, queryset):
+        self._set_status(request, queryset, 'served')
+
+    @admin.action(description='Mark selected orders cancelled')
+    def mark_cancelled(self, request, queryset):
+        self._set_status(request, queryset, 'cancelled')
+
+
+# WEBHOOK ADMIN
+@admin.register(WebhookEndpoint)
+class WebhookEndpointAdmin(admin.ModelAdmin):
+    list_display = ('name', 'url', 'hotel', 'max_concurrency', 'is_active')
+    list_filter = ('is_active',)
+    autocomplete_fields = ('hotel',)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'endpoint', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    list_filter = ('status', 'event_type')
+    list_select_related = ('endpoint',)
+    readonly_fields = [f.name for f in OutboxMessage._meta.fields]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected messages now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='delivered').update(status='pending', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f"{updated} message(s) queued for delivery.", messages.SUCCESS)
+
+
+# HOTEL MEMBERSHIP ADMIN
+@admin.register(HotelUser)
+class HotelUserAdmin(admin.ModelAdmin):
+    list_display = ('user', 'hotel', 'is_manager', 'created_at')
+    list_select_related = ('user', 'hotel')
+    autocomplete_fields = ('user', 'hotel')
@@ -2,3 +2,7 @@ from django.apps import AppConfig
 class MenuAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'menu_app'
+
+    def ready(self):
+        from . import permissions  # noqa: F401  registers membership cache invalidation signals
+        from . import checks  # noqa: F401  registers system checks
@@ -0,0 +1,83 @@
+"""
+Moving finished bookings out of the live Booking table.
+
+Rows are copied into ArchivedBooking and deleted from Booking in small
+batches, each in its own short transaction, so the live table is never
+locked for long. The delete is a plain SQL DELETE rather than
+QuerySet.delete(): archiving is not a cancellation, so the Booking
+post_delete handlers (stats rollups, booking.deleted webhook events) must
+not run, and no other table references Booking, so there is nothing to
+cascade.
+"""
+from django.db import connections, transaction
+
+# Stays in these statuses are over once check_out has passed; 'pending' ones are left for follow-up
+ARCHIVE_STATUSES = ('confirmed', 'completed', 'cancelled')
+
+
+def _archived_copy(booking):
+    from .models import ArchivedBooking
+
+    product = booking.product
+    return ArchivedBooking(
+        id=booking.pk,
+        product_id=booking.product_id,
+        hotel_id=product.hotel_id,
+        product_name=product.name,
+        user_id=booking.user_id,
+        guest_name=booking.guest_name,
+        check_in=booking.check_in,
+        check_out=booking.check_out,
+        pax=booking.pax,
+        total_price=booking.total_price,
+        created_at=booking.created_at,
+        status=booking.status,
+    )
+
+
+def archive_batch(ids):
+    """Copy the bookings with these ids into the archive and remove them. Returns rows moved."""
+    from .models import ArchivedBooking, Booking
+
+    with transaction.atomic():
+        bookings = list(
+            Booking.objects.select_for_update().filter(pk__in=ids)
+            .select_related('product').only(
+                'id', 'product_id', 'product__hotel_id', 'product__name', 'user_id', 'guest_name',
+                'check_in', 'check_out', 'pax', 'total_price', 'created_at', 'status',
+            )
+        )
+        # ignore_conflicts makes a batch that was copied but not deleted (crash) safe to rerun
+        ArchivedBooking.objects.bulk_create([_archived_copy(b) for b in bookings], ignore_conflicts=True)
+        if not bookings:
+            return 0
+        # No signals on purpose (see the module docstring); rollups and availability stay as they are
+        connection = connections[Booking.objects.db]
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(Booking._meta.db_table)} WHERE {quote(Booking._meta.pk.column)} IN '
+                f'({", ".join(["%s"] * len(bookings))})',
+                [b.pk for b in bookings],
+            )
+            return cursor.rowcount
+
+
+def archive_bookings(before, statuses=ARCHIVE_STATUSES, batch_size=500, dry_run=False):
+    """
+    Archive bookings whose check_out is before `before` and whose status is in `statuses`.
+    Returns the number of bookings moved (or that would be moved, with dry_run).
+    """
+    from .models import Booking
+
+    candidates = Booking.objects.filter(check_out__lt=before, status__in=statuses)
+    if dry_run:
+        return candidates.count()
+
+    moved, last_id = 0, 0
+    while True:
+        ids = list(candidates.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return moved
+        moved += archive_batch(ids)
+        last_id = ids[-1]
@@ -0,0 +1,72 @@
+"""
+JWT helpers: access tokens carry the claims our permissions need (user id,
+staff flag, hotel memberships) so that, with settings.JWT_STATELESS_AUTH on,
+requests are authorised from the token alone without loading the User row.
+
+Revocation is a short per-user "not before" timestamp kept in the Django cache
+for one access-token lifetime: tokens issued before it, or in the same second
+(`iat` has whole-second resolution), are rejected. The cache must be shared by
+all workers for that to reach them; checks.py refuses JWT_STATELESS_AUTH otherwise.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import HotelUser
+
+
+def _revocation_key(user_id):
+    return f'jwt_revoked_before:{user_id}'
+
+
+def revoke_user_tokens(user_id):
+    """Reject every token for `user_id` issued before now (until the tokens would have expired anyway)."""
+    lifetime = settings.SIMPLE_JWT.get('ACCESS_TOKEN_LIFETIME')
+    timeout = int(lifetime.total_seconds()) if lifetime else 3600
+    cache.set(_revocation_key(user_id), int(time.time()), timeout)
+
+
+def is_revoked(token):
+    revoked_before = cache.get(_revocation_key(token.get(api_settings.USER_ID_CLAIM)))
+    return revoked_before is not None and token.get('iat', 0) <= revoked_before
+
+
+def add_user_claims(token, user):
+    token['is_staff'] = user.is_staff
+    token['is_superuser'] = user.is_superuser
+    token['hotel_ids'] = sorted(HotelUser.objects.filter(user=user).values_list('hotel_id', flat=True))
+    return token
+
+
+class HotelTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class HotelTokenRefreshSerializer(TokenRefreshSerializer):
+    """Re-read memberships on refresh so a refreshed access token never carries stale hotel_ids."""
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data['access'])
+        user = get_user_model().objects.get(**{api_settings.USER_ID_FIELD: access[api_settings.USER_ID_CLAIM]})
+        data['access'] = str(add_user_claims(access, user))
+        return data
+
+
+class ClaimsJWTAuthentication(JWTStatelessUserAuthentication):
+    """Authenticate from token claims only; request.user is a TokenUser exposing .hotel_ids/.is_staff."""
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token):
+            raise AuthenticationFailed('Token has been revoked.', code='token_revoked')
+        return token
@@ -0,0 +1,115 @@
+"""
+Group reservations: allocate rooms across many products in one transaction.
+
+Inventory is locked and checked up front, decremented with a single UPDATE
+for all products, and bookings are inserted with bulk_create, so the query
+count depends on the number of distinct products and stay dates rather
+than on the number of rooms booked. Bulk rows skip Booking.save() and its
+post_save decrement, so nothing is decremented twice.
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, F, Value, BooleanField, PositiveIntegerField
+
+from .models import Product, Booking, products_changed
+from .outbox import booking_payload, record_events
+from .pricing import quote_products
+from .rollups import booking_deltas, booking_state, apply_deltas
+
+
+class AllocationError(Exception):
+    def __init__(self, results):
+        super().__init__("Bulk booking rejected")
+        self.results = results
+
+
+def allocate_bulk(items, user=None):
+    """
+    `items` are validated dicts: product (id), check_in, check_out, pax, guest_name, quantity.
+    Returns the created bookings in item order, or raises AllocationError carrying
+    per-item results when any item cannot be satisfied (nothing is written then).
+    """
+    demand = Counter()
+    for item in items:
+        demand[item['product']] += item['quantity']
+
+    with transaction.atomic():
+        products = Product.objects.select_for_update().in_bulk(list(demand))
+
+        errors = {}
+        for index, item in enumerate(items):
+            product = products.get(item['product'])
+            if product is None or product.is_archived:
+                errors[index] = "Product not found."
+            elif product.product_type != 'room':
+                errors[index] = "Only rooms can be booked."
+            elif (item['check_out'] - item['check_in']).days > settings.MAX_QUOTE_NIGHTS:
+                # Checked here too: pricing and the rollups below work per night
+                errors[index] = f"Stays can be at most {settings.MAX_QUOTE_NIGHTS} nights."
+            elif (product.available_rooms or 0) < demand[product.pk]:
+                errors[index] = (
+                    f"Only {product.available_rooms or 0} room(s) left for {product.name}; "
+                    f"{demand[product.pk]} requested."
+                )
+        if errors:
+            raise AllocationError([
+                {'index': i, 'status': 'error', 'error': errors[i]} if i in errors
+                else {'index': i, 'status': 'ok'}
+                for i in range(len(items))
+            ])
+
+        # One UPDATE decrements every product; the row locks above make the counts safe
+        Product.objects.filter(pk__in=demand).update(
+            available_rooms=Case(
+                *[When(pk=pk, then=F('available_rooms') - n) for pk, n in demand.items()],
+                default=F('available_rooms'),
+                output_field=PositiveIntegerField(),
+            ),
+            available=Case(
+                *[When(pk=pk, then=Value(False)) for pk, n in demand.items()
+                  if products[pk].available_rooms == n],
+                default=F('available'),
+                output_field=BooleanField(),
+            ),
+        )
+        for pk, n in demand.items():
+            product = products[pk]
+            product.available_rooms -= n
+            if product.available_rooms == 0:
+                product.available = False
+
+        # Price each distinct stay window once for all its products
+        by_stay = defaultdict(set)
+        for item in items:
+            by_stay[(item['check_in'], item['check_out'])].add(item['product'])
+        totals = {}
+        for (check_in, check_out), product_ids in by_stay.items():
+            quotes = quote_products([products[pk] for pk in product_ids], check_in, check_out)
+            for pk, (total, _) in quotes.items():
+                totals[(pk, check_in, check_out)] = total
+
+        bookings = []
+        for item in items:
+            for _ in range(item['quantity']):
+                bookings.append(Booking(
+                    product=products[item['product']],
+                    user_id=getattr(user, 'pk', None),
+                    guest_name=item.get('guest_name', ''),
+                    check_in=item['check_in'],
+                    check_out=item['check_out'],
+                    pax=item.get('pax', 1),
+                    total_price=totals[(item['product'], item['check_in'], item['check_out'])],
+                ))
+        Booking.objects.bulk_create(bookings)
+        products_changed(products[pk] for pk in demand)
+        record_events(('booking.created', booking_payload(b), b.product.hotel_id) for b in bookings)
+
+        deltas = None
+        for booking in bookings:
+            booking._rollup_state = booking_state(booking)
+            deltas = booking_deltas(None, booking._rollup_state, deltas)
+        apply_deltas(deltas)
+
+    return bookings
@@ -0,0 +1,103 @@
+"""
+Bulk catalog edits: price, availability, archive and category changes for
+many products at once.
+
+Each edit is a single UPDATE with F() expressions, so Product.save() (and
+its image rewrite) never runs. price_base is recomputed in the same
+statement from the FX rates. Change-log rows are bulk inserted, and live
+subscribers get one 'bulk' event per hotel instead of one per product,
+which tells them to resync through /api/sync/; hotel summaries are
+likewise recomputed once per hotel.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, When, F, Value, DecimalField, ExpressionWrapper
+from django.db.models.functions import Greatest, Round
+from django.utils import timezone
+
+from .currency import get_rates
+from .events import broker
+from .lookups import clear_type_choices
+from .summaries import schedule_refresh
+from .models import Product, CatalogChange
+
+PRICE_CHANGES = ('price_percent', 'price_delta', 'price')
+# Every other key of a change set is copied onto the rows as is
+FIELD_CHANGES = ('available', 'is_archived', 'category')
+
+
+def _money(expression, max_digits=10):
+    return ExpressionWrapper(Round(expression, 2), output_field=DecimalField(max_digits=max_digits, decimal_places=2))
+
+
+def price_expression(changes):
+    """The new price as an expression over the current row, or None when the price is unchanged."""
+    if changes.get('price') is not None:
+        return Value(changes['price'], output_field=DecimalField(max_digits=10, decimal_places=2))
+    if changes.get('price_percent') is not None:
+        new_price = F('price') * (1 + changes['price_percent'] / 100)
+    elif changes.get('price_delta') is not None:
+        new_price = F('price') + changes['price_delta']
+    else:
+        return None
+    # Never let a cut push a price below zero
+    return Greatest(_money(new_price), Value(0, output_field=DecimalField(max_digits=10, decimal_places=2)))
+
+
+def base_price_expression(new_price):
+    """price_base for `new_price`, per currency, matching currency.to_base(); unknown currencies get NULL."""
+    whens = [
+        When(currency__iexact=code, then=_money(new_price * rate, max_digits=14))
+        for code, rate in get_rates().items()
+    ]
+    if not whens:
+        return Value(None, output_field=DecimalField(max_digits=14, decimal_places=2))
+    return Case(*whens, default=None, output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def bulk_update_products(queryset, changes):
+    """
+    Apply `changes` to every product in `queryset` with one UPDATE.
+    `changes` holds at most one of price_percent/price_delta/price, plus any of
+    available, is_archived and category (a Category or None).
+    Returns {hotel_id: number of products updated}.
+    """
+    updates = {field: changes[field] for field in FIELD_CHANGES if field in changes}
+    new_price = price_expression(changes)
+    if new_price is not None:
+        updates['price'] = new_price
+        updates['price_base'] = base_price_expression(new_price)
+    if not updates:
+        return {}
+    updates['updated_at'] = timezone.now()
+
+    with transaction.atomic():
+        queryset = queryset.order_by()
+        rows = list(queryset.select_for_update().values_list('pk', 'hotel_id', 'is_archived'))
+        if not rows:
+            return {}
+        # A subquery keeps this one statement however many products are selected
+        Product.objects.filter(pk__in=queryset.values('pk')).update(**updates)
+
+        archived = changes.get('is_archived')
+        CatalogChange.objects.bulk_create([
+            CatalogChange(
+                entity='product', object_id=pk, hotel_id=hotel_id,
+                action='archive' if (was_archived if archived is None else archived) else 'upsert',
+            )
+            for pk, hotel_id, was_archived in rows
+        ])
+
+        per_hotel = Counter(hotel_id for _, hotel_id, _ in rows)
+
+        def publish():
+            for hotel_id, count in per_hotel.items():
+                broker.publish(hotel_id, {'bulk': True, 'count': count})
+
+        transaction.on_commit(publish)
+        schedule_refresh(*per_hotel)
+
+    if 'category' in updates:
+        clear_type_choices()
+    return dict(per_hotel)
@@ -0,0 +1,13 @@
+"""
+Whether the default cache is shared by every worker.
+
+LocMemCache (Django's default, used when REDIS_URL is unset) lives in one
+process: an entry deleted there is still served by the other workers, so
+state whose invalidation matters across workers must not be cached in it.
+"""
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def cache_is_shared(alias='default'):
+    return not isinstance(caches[alias], LocMemCache)
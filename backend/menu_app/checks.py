@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from .caching import cache_is_shared
+
+
+@register()
+def stateless_auth_needs_shared_cache(app_configs, **kwargs):
+    """Claims-only JWTs are revoked through the cache; a per-process cache would revoke them in one worker only."""
+    if getattr(settings, 'JWT_STATELESS_AUTH', False) and not cache_is_shared():
+        return [Error(
+            "JWT_STATELESS_AUTH requires a cache shared by all workers.",
+            hint="Set REDIS_URL (or configure CACHES) so token revocations reach every worker.",
+            id='menu_app.E001',
+        )]
+    return []
+
+
+@register(Tags.caches, deploy=True)
+def throttles_need_shared_cache(app_configs, **kwargs):
+    """Throttle counters and single-flight locks only see requests of other workers through a shared cache."""
+    if not cache_is_shared():
+        return [Error(
+            "Throttles and request coalescing require a cache shared by all workers.",
+            hint="Set REDIS_URL (or configure CACHES) so every worker counts and coalesces the same requests.",
+            id='menu_app.E002',
+        )]
+    return []
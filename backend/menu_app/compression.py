@@ -0,0 +1,157 @@
+"""
+Response compression (brotli or gzip) for API responses.
+
+Unlike django.middleware.gzip, this picks brotli when the client accepts it
+and the optional `brotli` package is installed, honours q=0 in
+Accept-Encoding, only touches textual content types (images are already
+compressed; SSE must not be buffered) and applies a size threshold to
+streaming responses too: the first chunks are read ahead until the
+threshold is reached, and a stream that ends before it is sent as is.
+"""
+import gzip
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/msgpack',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+    'text/',
+)
+# Buffered by the compressor; a live event stream would stall
+UNCOMPRESSED_TYPES = ('text/event-stream',)
+
+_brotli = None
+
+
+def brotli_module():
+    """The `brotli` module, or False when it is not installed (imported on first use)."""
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+        except ImportError:
+            brotli = False
+        _brotli = brotli
+    return _brotli
+
+
+def accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = accepted_encodings(header)
+    wildcard = accepted.get('*', 0.0)
+    if accepted.get('br', wildcard) > 0 and brotli_module():
+        return 'br'
+    if accepted.get('gzip', wildcard) > 0:
+        return 'gzip'
+    return None
+
+
+def is_compressible(content_type):
+    content_type = content_type.split(';')[0].strip().lower()
+    if content_type in UNCOMPRESSED_TYPES:
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress_bytes(data, encoding):
+    if encoding == 'br':
+        return brotli_module().compress(data, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def compress_chunks(chunks, encoding):
+    """Compress an iterable of byte chunks into a stream, yielding output as the compressor produces it."""
+    if encoding == 'br':
+        compressor = brotli_module().Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        process, finish = compressor.process, compressor.finish
+    else:
+        # wbits 16 + MAX_WBITS writes a gzip header and trailer
+        compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def read_ahead(iterator, min_bytes):
+    """Pull chunks until `min_bytes` are buffered. Returns (chunks, exhausted)."""
+    chunks, size = [], 0
+    for chunk in iterator:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= min_bytes:
+            return chunks, False
+    return chunks, True
+
+
+def _chain(head, iterator):
+    yield from head
+    yield from iterator
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code == 206:
+            return response
+        if not is_compressible(response.get('Content-Type', '')):
+            return response
+        min_bytes = settings.COMPRESSION_MIN_BYTES
+        if not response.streaming and len(response.content) < min_bytes:
+            return response
+        # Async streams here are SSE connections; they are not compressed
+        if response.streaming and response.is_async:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            iterator = iter(response.streaming_content)
+            head, exhausted = read_ahead(iterator, min_bytes)
+            if exhausted:
+                response.streaming_content = head
+                return response
+            response.streaming_content = compress_chunks(_chain(head, iterator), encoding)
+            del response.headers['Content-Length']
+        else:
+            compressed = compress_bytes(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The body changed, so a strong validator must become weak (RFC 9110 8.8.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,97 @@
+"""
+FX conversion into settings.BASE_CURRENCY.
+
+Rates live in the ExchangeRate table and are cached per process; the cache is
+dropped whenever a rate is saved (see signals in models.py) and otherwise
+expires after FX_CACHE_SECONDS so other workers pick up changes.
+Product.price_base holds the converted price so compare/ordering/price filters
+run against an indexed column instead of converting per row.
+"""
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db.models import F, Q, DecimalField, ExpressionWrapper
+from django.db.models.functions import Round
+
+from .summaries import refresh_hotel_summaries
+
+FX_CACHE_SECONDS = 300
+TWO_PLACES = Decimal('0.01')
+
+_cache = {'rates': None, 'loaded_at': 0.0}
+_lock = threading.Lock()
+
+
+def base_currency():
+    return getattr(settings, 'BASE_CURRENCY', 'KES').upper()
+
+
+def normalize_currency(code):
+    return (code or '').strip().upper()
+
+
+def get_rates():
+    """Return {currency: rate_to_base}, always including the base currency at 1."""
+    rates = _cache['rates']
+    if rates is not None and time.monotonic() - _cache['loaded_at'] < FX_CACHE_SECONDS:
+        return rates
+
+    from .models import ExchangeRate
+
+    with _lock:
+        rates = dict(ExchangeRate.objects.values_list('currency', 'rate_to_base'))
+        rates[base_currency()] = Decimal('1')
+        _cache['rates'], _cache['loaded_at'] = rates, time.monotonic()
+    return rates
+
+
+def clear_rate_cache():
+    _cache['rates'] = None
+
+
+def to_base(amount, currency):
+    """Convert `amount` in `currency` to the base currency, or None if no rate is known."""
+    if amount is None:
+        return None
+    rate = get_rates().get(normalize_currency(currency))
+    if rate is None:
+        return None
+    return (Decimal(amount) * rate).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+
+def recompute_base_prices(currencies=None):
+    """
+    Refresh Product.price_base with one UPDATE per currency, then the hotel
+    price summaries built from it. Pass `currencies` to limit the work to
+    rates that actually changed. Returns the number of rows updated.
+    """
+    from .models import Product
+
+    clear_rate_cache()
+    rates = get_rates()
+    if currencies is not None:
+        currencies = {normalize_currency(c) for c in currencies}
+    else:
+        currencies = set(rates)
+        # Currencies without a rate get NULL so they sort last and fall out of price filters
+        known = Q()
+        for code in currencies:
+            known |= Q(currency__iexact=code)
+        Product.objects.exclude(known).exclude(price_base=None).update(price_base=None)
+
+    updated = 0
+    for code in currencies:
+        rate = rates.get(code)
+        rows = Product.objects.filter(currency__iexact=code)
+        if rate is None:
+            updated += rows.update(price_base=None)
+            continue
+        # Rounded half up to cents in SQL, as to_base() does, so both paths store the same value
+        updated += rows.update(price_base=ExpressionWrapper(
+            Round(F('price') * rate, 2), output_field=DecimalField(max_digits=14, decimal_places=2)
+        ))
+    if updated:
+        refresh_hotel_summaries()
+    return updated
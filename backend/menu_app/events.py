@@ -0,0 +1,138 @@
+"""
+Lightweight in-process pub/sub for live hotel events (room availability, price changes).
+
+Subscribers are asyncio queues owned by the ASGI event loop serving an SSE
+connection; an idle connection costs one queue and one suspended coroutine.
+Publishers are ordinary sync code (model signals) and may run on any thread.
+
+When settings.EVENTS_SOCKET_DIR is set, every process also binds a unix
+datagram socket in that directory and publishes are fanned out to the
+sockets of the other workers on the same host.
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def _offer(queue, event):
+    # Runs on the subscriber's loop; a slow consumer loses events rather than blocking publishers
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        pass
+
+
+class EventBroker:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_path = None
+        self._sender = None
+
+    # SUBSCRIBE
+    def subscribe(self, hotel_id):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[hotel_id].add((loop, queue))
+        self._ensure_listener(loop)
+        return queue
+
+    def unsubscribe(self, hotel_id, queue):
+        with self._lock:
+            subs = self._subscribers.get(hotel_id, set())
+            subs.difference_update({s for s in subs if s[1] is queue})
+            if not subs:
+                self._subscribers.pop(hotel_id, None)
+
+    def subscriber_count(self, hotel_id=None):
+        with self._lock:
+            if hotel_id is not None:
+                return len(self._subscribers.get(hotel_id, ()))
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    # PUBLISH
+    def publish(self, hotel_id, event):
+        self._deliver_local(hotel_id, event)
+        self._fanout(hotel_id, event)
+
+    def _deliver_local(self, hotel_id, event):
+        with self._lock:
+            subs = list(self._subscribers.get(hotel_id, ()))
+        for loop, queue in subs:
+            if loop.is_closed():
+                self.unsubscribe(hotel_id, queue)
+                continue
+            loop.call_soon_threadsafe(_offer, queue, event)
+
+    # CROSS-WORKER FAN-OUT (optional)
+    def _socket_dir(self):
+        return getattr(settings, 'EVENTS_SOCKET_DIR', None)
+
+    def _fanout(self, hotel_id, event):
+        socket_dir = self._socket_dir()
+        if not socket_dir:
+            return
+        payload = json.dumps({'hotel_id': hotel_id, 'event': event}, default=str).encode()
+        if self._sender is None:
+            self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sender.setblocking(False)
+        for path in glob.glob(os.path.join(socket_dir, '*.sock')):
+            if path == self._listener_path:
+                continue
+            try:
+                self._sender.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket left behind by a dead worker
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError as exc:
+                logger.debug("event fan-out to %s failed: %s", path, exc)
+
+    def _ensure_listener(self, loop):
+        socket_dir = self._socket_dir()
+        if not socket_dir or self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            os.makedirs(socket_dir, exist_ok=True)
+            path = os.path.join(socket_dir, f'{os.getpid()}.sock')
+            if os.path.exists(path):
+                os.unlink(path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+            sock.setblocking(False)
+            loop.add_reader(sock.fileno(), self._on_datagram, sock)
+            self._listener, self._listener_path = sock, path
+
+    def _on_datagram(self, sock):
+        try:
+            data = sock.recv(65536)
+            message = json.loads(data)
+        except (BlockingIOError, ValueError):
+            return
+        self._deliver_local(message['hotel_id'], message['event'])
+
+
+broker = EventBroker()
+
+
+def format_sse(event, data, event_id=None):
+    # An `id:` line makes the browser resend it as Last-Event-ID when it reconnects
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
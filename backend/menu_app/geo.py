@@ -0,0 +1,84 @@
+"""
+Geohash grid for nearby-hotel search without PostGIS.
+
+Each hotel stores the geohash of its coordinates (Hotel.geohash, indexed).
+A radius search picks the finest geohash precision whose cells are at least
+as large as the radius, takes the cell containing the point plus its eight
+neighbours (which always cover the search circle), fetches hotels whose
+geohash falls in those cells with index range scans, and only then computes
+exact haversine distances.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 2 * math.pi * EARTH_RADIUS_KM / 360
+# Sorts after every base32 character: prefix + CELL_END bounds a cell's range
+CELL_END = '~'
+
+
+def encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(lat_degrees, lng_degrees) spanned by a geohash cell of `precision` characters."""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlmb = phi2 - phi1, math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def covering_cells(lat, lng, radius_km):
+    """
+    Geohash prefixes whose cells together cover the circle, or None when the
+    circle is too large (or too close to a pole) for any grid to prune.
+    """
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    # A degree of longitude is shortest at the circle's poleward edge, so measure the width there
+    cos_edge = math.cos(math.radians(min(abs(lat) + dlat, 90.0)))
+    if cos_edge < 1e-6:
+        return None
+    dlng = radius_km / (KM_PER_DEGREE_LAT * cos_edge)
+
+    precision = 0
+    for p in range(GEOHASH_PRECISION, 0, -1):
+        lat_span, lng_span = cell_size(p)
+        if lat_span >= dlat and lng_span >= dlng:
+            precision = p
+            break
+    if not precision:
+        return None
+
+    lat_span, lng_span = cell_size(precision)
+    cells = set()
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            y = min(max(lat + dy * lat_span, -90.0), 90.0)
+            x = (lng + dx * lng_span + 180.0) % 360.0 - 180.0
+            cells.add(encode(y, x, precision))
+    return sorted(cells)
@@ -0,0 +1,153 @@
+"""
+Idempotency-Key support for POSTs that must not run twice (bookings, M-Pesa checkout).
+
+A request sent with `Idempotency-Key: <client-chosen id>` first claims the
+key by inserting an IdempotencyKey row for (scope, principal, key). The
+insert commits on its own and the unique constraint lets exactly one
+concurrent request win. The winner runs the view and stores its status and
+body. A retry with the same key gets that response back, marked
+`Idempotent-Replayed: true`, without the view running again. A duplicate
+that arrives while the first request is still running polls the row until
+it finishes, up to IDEMPOTENCY_WAIT_SECONDS, and then answers 409 with
+Retry-After.
+
+Only finished outcomes are stored. An exception or a 5xx response releases
+the key so the client can retry. Reusing a key with a different body is
+rejected (422). Rows expire after IDEMPOTENCY_KEY_TTL_HOURS and an expired
+key is reclaimed when it is used again. `manage.py purge_idempotency_keys`
+deletes expired rows. A claim older than IDEMPOTENCY_LOCK_SECONDS that
+never finished (its worker died) can be taken over.
+"""
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .throttling import client_ip
+
+HEADER = 'Idempotency-Key'
+KEY_MAX_LENGTH = 255
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _claim(scope, principal, key, request_hash):
+    """(row, True) when this request now owns the key, else (the existing row, False)."""
+    from .models import IdempotencyKey
+
+    while True:
+        now = timezone.now()
+        expires_at = now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    scope=scope, principal=principal, key=key, request_hash=request_hash,
+                    locked_at=now, expires_at=expires_at,
+                ), True
+        except IntegrityError:
+            pass
+
+        row = IdempotencyKey.objects.filter(scope=scope, principal=principal, key=key).first()
+        if row is None:
+            continue  # released or purged in between
+        abandoned = row.status_code is None and row.locked_at <= now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+        if row.expires_at > now and not abandoned:
+            return row, False
+        # Conditional on locked_at, so only one of several takers wins
+        taken = IdempotencyKey.objects.filter(pk=row.pk, locked_at=row.locked_at).update(
+            request_hash=request_hash, status_code=None, response_body=None, locked_at=now, expires_at=expires_at,
+        )
+        if taken:
+            row.refresh_from_db()
+            return row, True
+
+
+def replay(row):
+    return Response(row.response_body, status=row.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(scope):
+    """
+    Decorate a DRF view function or viewset method so requests carrying an
+    Idempotency-Key run at most once per (scope, user or anonymous client IP, key). Requests without
+    the header are unaffected.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            from .models import IdempotencyKey
+
+            request = args[0] if isinstance(args[0], Request) else args[1]
+            key = request.headers.get(HEADER)
+            if key is None:
+                return view(*args, **kwargs)
+            key = key.strip()
+            if not key or len(key) > KEY_MAX_LENGTH:
+                return Response({"detail": f"{HEADER} must be 1-{KEY_MAX_LENGTH} characters."}, status=400)
+
+            # Anonymous clients are told apart by address, so one cannot replay another's response
+            principal = f'user:{request.user.pk}' if request.user.is_authenticated else f'anon:{client_ip(request)}'
+            request_hash = request_fingerprint(request)
+            deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+            delay = 0.05
+            while True:
+                row, owned = _claim(scope, principal, key, request_hash)
+                if owned:
+                    break
+                if row.request_hash != request_hash:
+                    return Response(
+                        {"detail": f"This {HEADER} was already used for a different request."},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                if row.status_code is not None:
+                    return replay(row)
+                if time.monotonic() >= deadline:
+                    return Response(
+                        {"detail": f"A request with this {HEADER} is still in progress."},
+                        status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'},
+                    )
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+
+            try:
+                response = view(*args, **kwargs)
+            except BaseException:
+                IdempotencyKey.objects.filter(pk=row.pk).delete()
+                raise
+            if response.status_code >= 500:
+                IdempotencyKey.objects.filter(pk=row.pk).delete()
+            else:
+                IdempotencyKey.objects.filter(pk=row.pk).update(
+                    status_code=response.status_code, response_body=response.data,
+                )
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_expired(batch_size=1000):
+    """Delete expired keys in batches. Returns the number deleted."""
+    from .models import IdempotencyKey
+
+    now = timezone.now()
+    deleted = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,43 @@
+"""
+Cached product_type -> canonical/category lookup for the admin.
+
+The product form limits the Canonical and Category choices to those already
+used by products of the same type. Computing that means scanning the
+Product table, so the id sets are cached per type and dropped whenever a
+product is saved or deleted.
+"""
+from django.core.cache import cache
+
+# Backstop for changes made with queryset.update(), which sends no signals
+TYPE_CHOICES_CACHE_SECONDS = 600
+
+
+def _cache_key(product_type):
+    return f'type_choices:{product_type}'
+
+
+def type_choice_ids(product_type):
+    """Return {'canonical': frozenset(ids), 'category': frozenset(ids)} used by products of `product_type`."""
+    from .models import Product
+
+    if product_type not in dict(Product.PRODUCT_TYPE_CHOICES):
+        return {'canonical': frozenset(), 'category': frozenset()}
+    key = _cache_key(product_type)
+    choices = cache.get(key)
+    if choices is None:
+        products = Product.objects.filter(product_type=product_type)
+        choices = {
+            field: frozenset(
+                products.filter(**{f'{field}__isnull': False})
+                .order_by().values_list(f'{field}_id', flat=True).distinct()
+            )
+            for field in ('canonical', 'category')
+        }
+        cache.set(key, choices, TYPE_CHOICES_CACHE_SECONDS)
+    return choices
+
+
+def clear_type_choices():
+    from .models import Product
+
+    cache.delete_many([_cache_key(value) for value, _ in Product.PRODUCT_TYPE_CHOICES])
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from menu_app.archive import ARCHIVE_STATUSES, archive_bookings
+
+
+class Command(BaseCommand):
+    help = 'Move finished bookings that checked out before a date into the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True, help='Archive stays that checked out before this date (YYYY-MM-DD)')
+        parser.add_argument(
+            '--status', default=','.join(ARCHIVE_STATUSES),
+            help='Comma-separated booking statuses to archive (default: %(default)s)',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the bookings that would be archived')
+
+    def handle(self, *args, **options):
+        try:
+            before = parse_date(options['before'])
+        except ValueError:
+            before = None
+        if before is None:
+            raise CommandError('--before must be a date in YYYY-MM-DD format')
+        statuses = [s.strip() for s in options['status'].split(',') if s.strip()]
+        if not statuses:
+            raise CommandError('--status must name at least one status')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        count = archive_bookings(
+            before, statuses=statuses, batch_size=options['batch_size'], dry_run=options['dry_run'],
+        )
+        if options['dry_run']:
+            self.stdout.write(f"{count} booking(s) would be archived.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Archived {count} booking(s) that checked out before {before}."))
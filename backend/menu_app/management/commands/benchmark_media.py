@@ -0,0 +1,76 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.views.static import serve
+
+from menu_app.media import serve_media
+
+
+def _consume(response):
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    response.close()
+    return size
+
+
+class Command(BaseCommand):
+    help = 'Compare media serving throughput per worker: django.views.static.serve vs serve_media'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--size-kb', type=int, default=200, help='Size of the test image')
+
+    def run(self, label, view, path, media_root, headers=None, **overrides):
+        factory = RequestFactory()
+        total_bytes = 0
+        with override_settings(MEDIA_ROOT=media_root, **overrides):
+            start = time.perf_counter()
+            for _ in range(self.requests):
+                request = factory.get(f'/media/{path}', headers=headers or {})
+                if view is serve:
+                    response = serve(request, path, document_root=media_root)
+                else:
+                    response = view(request, path)
+                total_bytes += _consume(response)
+            elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{label:<42} {self.requests / elapsed:10.0f} req/s {total_bytes / elapsed / 1e6:10.1f} MB/s through Python"
+        )
+
+    def handle(self, *args, **options):
+        self.requests = options['requests']
+        media_root = tempfile.mkdtemp()
+        try:
+            data = os.urandom(options['size_kb'] * 1024)
+            digest = hashlib.sha256(data).hexdigest()
+            path = f'product_images/{digest[:2]}/{digest}.jpg'
+            os.makedirs(os.path.join(media_root, os.path.dirname(path)))
+            with open(os.path.join(media_root, path), 'wb') as f:
+                f.write(data)
+
+            factory = RequestFactory()
+            with override_settings(MEDIA_ROOT=media_root, MEDIA_ACCEL_REDIRECT=None, MEDIA_SENDFILE=False):
+                etag = serve_media(factory.get(f'/media/{path}'), path)['ETag']
+
+            self.stdout.write(f"{self.requests} requests for a {options['size_kb']} KB image")
+            self.run('before: django.views.static.serve', serve, path, media_root)
+            self.run('after: serve_media (full body)', serve_media, path, media_root,
+                     MEDIA_ACCEL_REDIRECT=None, MEDIA_SENDFILE=False)
+            self.run('after: serve_media (If-None-Match -> 304)', serve_media, path, media_root,
+                     headers={'If-None-Match': etag}, MEDIA_ACCEL_REDIRECT=None, MEDIA_SENDFILE=False)
+            self.run('after: serve_media (X-Accel-Redirect)', serve_media, path, media_root,
+                     MEDIA_ACCEL_REDIRECT='/protected-media/')
+            self.stdout.write(
+                "Full-body responses go through the WSGI file_wrapper (sendfile) in production servers; "
+                "with X-Accel-Redirect the bytes never pass through the worker, and browsers stop asking "
+                "for hashed (immutable) URLs altogether."
+            )
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
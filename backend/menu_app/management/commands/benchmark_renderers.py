@@ -0,0 +1,75 @@
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from menu_app.compression import brotli_module, compress_bytes
+from menu_app.models import Category, Hotel, Product
+from menu_app.renderers import FastJSONRenderer, MessagePackRenderer
+from menu_app.serializers import MenuItemSerializer, ProductSerializer
+
+
+def _products(count):
+    """Unsaved products shaped like a real menu page (no database needed)."""
+    hotel = Hotel(pk=1, name='Benchmark Hotel', slug='benchmark-hotel', city='Nairobi', timezone='Africa/Nairobi')
+    categories = [Category(pk=i, name=f'Category {i}', slug=f'category-{i}') for i in range(1, 6)]
+    now = timezone.now()
+    return [
+        Product(
+            pk=i, hotel=hotel, category=categories[i % 5], product_type='food' if i % 4 else 'room',
+            name=f'Menu item {i}', sku=f'SKU-{i:05d}', normalized_name=f'menu item {i}',
+            description='Served with kachumbari and a choice of chapati or rice.',
+            price=Decimal(f'{150 + i * 7 % 900}.00'), currency='KES', price_base=Decimal(f'{150 + i * 7 % 900}.00'),
+            total_rooms=10, available_rooms=4, available=True, extra_meta={'spicy': i % 3 == 0},
+            created_at=now, updated_at=now,
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Report serialize/encode time and wire bytes (raw, gzip, brotli) of typical menu pages per renderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def timed(self, fn):
+        fn()  # warm up caches (field construction, imports) outside the measurement
+        start = time.perf_counter()
+        for _ in range(self.iterations):
+            result = fn()
+        return (time.perf_counter() - start) / self.iterations * 1000, result
+
+    def handle(self, *args, **options):
+        self.iterations = options['iterations']
+        # DRF's own field mapping, as the serializers had before PriceModelSerializer
+        baseline = {'serializer_field_mapping': serializers.ModelSerializer.serializer_field_mapping}
+        pages = [
+            ('product list page (20)', ProductSerializer, 20),
+            ('hotel menu (200)', MenuItemSerializer, 200),
+        ]
+        renderers = [('json (drf)', JSONRenderer()), ('json (fast)', FastJSONRenderer())]
+        if settings.MSGPACK_ENABLED:
+            renderers.append(('msgpack', MessagePackRenderer()))
+        encodings = ['gzip'] + (['br'] if brotli_module() else [])
+
+        for label, serializer_class, count in pages:
+            products = _products(count)
+            old_class = type('Baseline' + serializer_class.__name__, (serializer_class,), baseline)
+            old_ms, _ = self.timed(lambda: old_class(products, many=True).data)
+            new_ms, data = self.timed(lambda: serializer_class(products, many=True).data)
+            self.stdout.write(f"\n{label}: serialize {old_ms:.2f} ms with DecimalField, {new_ms:.2f} ms with PriceField")
+
+            header = f"{'renderer':<12} {'encode ms':>10} {'raw bytes':>10}" + ''.join(f" {e + ' bytes':>11}" for e in encodings)
+            self.stdout.write(header)
+            for name, renderer in renderers:
+                encode_ms, body = self.timed(lambda: renderer.render(data))
+                sizes = ''.join(f" {len(compress_bytes(body, e)):>11}" for e in encodings)
+                self.stdout.write(f"{name:<12} {encode_ms:>10.3f} {len(body):>10}{sizes}")
+
+        if not settings.MSGPACK_ENABLED:
+            self.stdout.write("\nInstall `msgpack` to include MessagePack; install `brotli` for br sizes.")
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from menu_app.snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write the memory-mapped catalog snapshot that product listings are served from'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Snapshot directory (default: settings.CATALOG_SNAPSHOT_DIR)')
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or settings.CATALOG_SNAPSHOT_DIR
+        if not directory:
+            raise CommandError("Set CATALOG_SNAPSHOT_DIR or pass --dir")
+        count = build_snapshot(directory)
+        self.stdout.write(self.style.SUCCESS(f"Wrote a snapshot of {count} product(s) to {directory}."))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from menu_app.models import Hotel, Product
+from menu_app.snapshot import catalog_changed
+from menu_app.storage import content_hash, hashed_name, is_hashed_name
+
+
+class Command(BaseCommand):
+    help = 'Move hotel and product images saved under their upload names onto content-hash names, collapsing duplicates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        totals = {'files': 0, 'duplicates': 0, 'bytes': 0, 'missing': 0}
+
+        for model in (Hotel, Product):
+            storage = model._meta.get_field('image').storage
+            names = (
+                model.objects.exclude(image='').exclude(image__isnull=True)
+                .order_by().values_list('image', flat=True).distinct()
+            )
+            for name in names.iterator():
+                if is_hashed_name(name):
+                    continue
+                if not storage.exists(name):
+                    totals['missing'] += 1
+                    self.stderr.write(f"Missing file for {model.__name__} image: {name}")
+                    continue
+
+                with storage.open(name) as content:
+                    target = hashed_name(name, content_hash(content))
+                    duplicate = storage.exists(target)
+                    if not dry_run and not duplicate:
+                        # Stored as is: legacy product images were already resized in place
+                        storage._save(target, content)
+                size = storage.size(name)
+
+                totals['files'] += 1
+                if duplicate:
+                    totals['duplicates'] += 1
+                    totals['bytes'] += size
+                if dry_run:
+                    continue
+                model.objects.filter(image=name).update(image=target)
+                # The old name is unreferenced now, so the reference-counted delete removes it
+                storage.delete(name)
+
+        if not dry_run and totals['files']:
+            # Hotel.objects.update() bypasses the signals that mark the catalog snapshot stale
+            catalog_changed()
+
+        prefix = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {totals['files']} file(s); {totals['duplicates']} duplicate(s), "
+            f"{totals['bytes']} byte(s) reclaimed; {totals['missing']} missing."
+        ))
@@ -0,0 +1,64 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from menu_app.currency import base_currency, normalize_currency, recompute_base_prices
+from menu_app.models import ExchangeRate
+
+
+class Command(BaseCommand):
+    help = 'Load FX rates (units of base currency per 1 unit) and recompute Product.price_base in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pairs', nargs='*', help='Rates as CUR=RATE, e.g. USD=129.5 EUR=140.2')
+        parser.add_argument('--file', help='JSON ({"USD": 129.5} or {"rates": {...}}) or CSV (currency,rate) file')
+
+    def handle(self, *args, **options):
+        rates = {}
+        if options['file']:
+            rates.update(self._read_file(options['file']))
+        for pair in options['pairs']:
+            code, sep, value = pair.partition('=')
+            if not sep:
+                raise CommandError(f"Expected CUR=RATE, got '{pair}'")
+            rates[code] = value
+        if not rates:
+            raise CommandError('Provide rates as CUR=RATE arguments or with --file')
+
+        parsed = {}
+        for code, value in rates.items():
+            code = normalize_currency(code)
+            try:
+                rate = Decimal(str(value))
+            except InvalidOperation:
+                raise CommandError(f"Invalid rate for {code}: {value}")
+            if rate <= 0:
+                raise CommandError(f"Rate for {code} must be positive")
+            if code != base_currency():
+                parsed[code] = rate
+
+        existing = dict(ExchangeRate.objects.filter(currency__in=parsed).values_list('currency', 'rate_to_base'))
+        changed = [code for code, rate in parsed.items() if existing.get(code) != rate]
+
+        with transaction.atomic():
+            for code in changed:
+                ExchangeRate.objects.update_or_create(currency=code, defaults={'rate_to_base': parsed[code]})
+            updated = recompute_base_prices(changed) if changed else 0
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(changed)} rate(s) changed, {len(parsed) - len(changed)} unchanged; "
+            f"recomputed price_base for {updated} product(s)."
+        ))
+
+    def _read_file(self, path):
+        try:
+            with open(path, newline='') as fh:
+                if path.lower().endswith('.json'):
+                    data = json.load(fh)
+                    return data.get('rates', data)
+                return {row['currency']: row['rate'] for row in csv.DictReader(fh)}
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Could not read rates from {path}: {exc}")
@@ -0,0 +1,67 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: what a gunicorn worker does before it can serve
+BOOT_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({'boot_ms': (time.perf_counter() - start) * 1000, 'modules': sorted(sys.modules)}))
+"""
+
+
+def measure_boot(importtime=False):
+    """
+    Boot the project in a subprocess and return (result, importtime_rows).
+    result is {'boot_ms': float, 'modules': [...]}; rows are (self_us, cumulative_us, module)
+    parsed from `python -X importtime` when requested.
+    """
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-c', BOOT_SCRIPT]
+    proc = subprocess.run(cmd, cwd=settings.BASE_DIR, capture_output=True, text=True, env=os.environ.copy())
+    if proc.returncode != 0:
+        raise CommandError(f"Boot failed:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return json.loads(proc.stdout.strip().splitlines()[-1]), rows
+
+
+class Command(BaseCommand):
+    help = 'Report worker boot time and the slowest module imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=25, help='Number of modules to list')
+        parser.add_argument('--sort', choices=['self', 'cumulative'], default='cumulative')
+        parser.add_argument('--budget-ms', type=float, default=None,
+                            help='Fail when boot time exceeds this (default: settings.BOOT_TIME_BUDGET_MS)')
+
+    def handle(self, *args, **options):
+        result, rows = measure_boot(importtime=True)
+
+        key = 0 if options['sort'] == 'self' else 1
+        self.stdout.write(f"{'self ms':>9} {'cumul ms':>9}  module")
+        for row in sorted(rows, key=lambda r: r[key], reverse=True)[:options['top']]:
+            self.stdout.write(f"{row[0] / 1000:9.1f} {row[1] / 1000:9.1f}  {row[2]}")
+
+        # -X importtime itself adds overhead, so judge the budget on a clean run
+        boot_ms = measure_boot()[0]['boot_ms']
+        budget = options['budget_ms'] or getattr(settings, 'BOOT_TIME_BUDGET_MS', None)
+        self.stdout.write(f"\nBoot time: {boot_ms:.0f} ms" + (f" (budget {budget:.0f} ms)" if budget else ""))
+        if budget and boot_ms > budget:
+            raise CommandError(f"Boot time {boot_ms:.0f} ms exceeds budget of {budget:.0f} ms")
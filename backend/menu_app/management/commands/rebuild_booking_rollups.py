@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from menu_app.models import Hotel
+from menu_app.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily booking rollups used by the hotel stats endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hotel', help='Only rebuild this hotel (slug)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        hotels = [None]
+        if options['hotel']:
+            hotel = Hotel.objects.filter(slug=options['hotel']).first()
+            if not hotel:
+                raise CommandError(f"Hotel '{options['hotel']}' not found")
+            hotels = [hotel]
+
+        for hotel in hotels:
+            with transaction.atomic():
+                rows = rebuild_rollups(hotel=hotel, batch_size=options['batch_size'])
+            label = hotel.slug if hotel else 'all hotels'
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup row(s) for {label}."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from menu_app.models import Hotel
+from menu_app.summaries import refresh_hotel_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute the catalog summary columns (counts, min prices, available rooms) shown in the hotel list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hotel', help='Only refresh this hotel (slug)')
+
+    def handle(self, *args, **options):
+        hotel_ids = None
+        if options['hotel']:
+            hotel = Hotel.objects.filter(slug=options['hotel']).first()
+            if not hotel:
+                raise CommandError(f"Hotel '{options['hotel']}' not found")
+            hotel_ids = [hotel.pk]
+
+        updated = refresh_hotel_summaries(hotel_ids)
+        self.stdout.write(self.style.SUCCESS(f"Updated the summary of {updated} hotel(s)."))
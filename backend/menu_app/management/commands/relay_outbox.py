@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from menu_app.outbox import claim_batch, relay_batch
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbox messages to their webhook endpoints (runs until stopped unless --once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent requests across all endpoints')
+        parser.add_argument('--interval', type=float, default=2, help='Seconds to sleep when nothing is due')
+        parser.add_argument('--once', action='store_true', help='Exit when no message is due')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be positive')
+
+        while True:
+            close_old_connections()
+            messages = claim_batch(options['batch_size'])
+            if messages:
+                counts = relay_batch(messages, workers=options['workers'])
+                self.stdout.write(
+                    f"Delivered {counts['delivered']}, will retry {counts['retry']}, failed {counts['failed']}."
+                    + (f" Released {counts['released']} not sent before the lease ran out." if counts['released'] else '')
+                )
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['interval'])
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from menu_app.models import CanonicalProduct, CatalogChange, Product
+from menu_app.text import normalize_name
+
+MODELS = {'product': Product, 'canonical': CanonicalProduct}
+
+
+class Command(BaseCommand):
+    help = 'Recompute normalized_name for products and canonical products with the current normalization rules'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--model', choices=['all', *MODELS], default='all')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would change')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+        models = MODELS.values() if options['model'] == 'all' else [MODELS[options['model']]]
+
+        for model in models:
+            changed = self.renormalize(model, batch_size, options['dry_run'])
+            verb = 'would change' if options['dry_run'] else 'updated'
+            self.stdout.write(self.style.SUCCESS(f"{model.__name__}: {changed} row(s) {verb}."))
+
+    def renormalize(self, model, batch_size, dry_run):
+        """Walk the table in primary-key order, one short transaction per chunk. Returns rows changed."""
+        fields = ['pk', 'name', 'normalized_name'] + (['hotel_id', 'is_archived'] if model is Product else [])
+        changed, last_pk = 0, 0
+        while True:
+            rows = list(
+                model.objects.filter(pk__gt=last_pk).order_by('pk').values_list(*fields)[:batch_size]
+            )
+            if not rows:
+                return changed
+            last_pk = rows[-1][0]
+
+            stale = []
+            for pk, name, current, *rest in rows:
+                value = normalize_name(name)
+                if value != current:
+                    stale.append((model(pk=pk, normalized_name=value), rest))
+            changed += len(stale)
+            if dry_run or not stale:
+                continue
+
+            with transaction.atomic():
+                model.objects.bulk_update([obj for obj, _ in stale], ['normalized_name'], batch_size=batch_size)
+                if model is Product:
+                    # Offline clients pick the new lookup keys up through /api/sync/
+                    CatalogChange.objects.bulk_create([
+                        CatalogChange(
+                            entity='product', object_id=obj.pk, hotel_id=hotel_id,
+                            action='archive' if is_archived else 'upsert',
+                        )
+                        for obj, (hotel_id, is_archived) in stale
+                    ])
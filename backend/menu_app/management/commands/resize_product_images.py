@@ -1,26 +1,30 @@
+import io
 import os
 import shutil
+from django.core.files.base import ContentFile
 from django.core.management.base import BaseCommand
 from PIL import Image
 from menu_app.models import Product  # fix the app name
+from menu_app.storage import content_hash, hashed_name
 
 class Command(BaseCommand):
     help = 'Resize all product images to square (1:1) and backup originals'
 
     def handle(self, *args, **options):
-        backup_dir = os.path.join('media', 'product_images_backup')
+        storage = Product._meta.get_field('image').storage
+        backup_dir = os.path.join(storage.location, 'product_images_backup')
         os.makedirs(backup_dir, exist_ok=True)
 
-        products = Product.objects.exclude(image='').all()
-        total = products.count()
+        # Files are shared between products (content-addressed storage): crop each one once
+        names = list(
+            Product.objects.exclude(image='').exclude(image__isnull=True)
+            .order_by().values_list('image', flat=True).distinct()
+        )
+        total = len(names)
         processed = 0
 
-        for product in products:
-            img_field = product.image
-            if not img_field:
-                continue
-
-            img_path = img_field.path
+        for name in names:
+            img_path = storage.path(name)
             filename = os.path.basename(img_path)
 
             # Backup original
@@ -30,6 +34,7 @@ class Command(BaseCommand):
 
             # Open image
             with Image.open(img_path) as img:
+                img_format = img.format
                 # Determine square size based on shortest side
                 min_side = min(img.width, img.height)
 
@@ -45,7 +50,17 @@ class Command(BaseCommand):
                 img_final = img_cropped.resize((800, 800), Image.Resampling.LANCZOS)
 
                 # Save optimized
-                img_final.save(img_path, optimize=True, quality=85)
+                buffer = io.BytesIO()
+                img_final.save(buffer, format=img_format, optimize=True, quality=85)
+
+            # New bytes get a new content-hash name; repoint the rows and release the old file
+            content = ContentFile(buffer.getvalue(), filename)
+            new_name = hashed_name(name, content_hash(content))
+            if new_name != name:
+                if not storage.exists(new_name):
+                    storage._save(new_name, content)
+                Product.objects.filter(image=name).update(image=new_name)
+                storage.delete(name)
 
             processed += 1
             self.stdout.write(f"[{processed}/{total}] Processed: {filename}")
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:08
+
+from django.db import migrations, models
+
+
+def seed_change_log(apps, schema_editor):
+    """Log the existing catalog once so clients syncing from cursor 0 receive everything."""
+    Hotel = apps.get_model('menu_app', 'Hotel')
+    Category = apps.get_model('menu_app', 'Category')
+    Product = apps.get_model('menu_app', 'Product')
+    CatalogChange = apps.get_model('menu_app', 'CatalogChange')
+
+    changes = [CatalogChange(entity='hotel', object_id=pk, hotel_id=pk)
+               for pk in Hotel.objects.values_list('pk', flat=True)]
+    changes += [CatalogChange(entity='category', object_id=pk)
+                for pk in Category.objects.values_list('pk', flat=True)]
+    changes += [
+        CatalogChange(entity='product', object_id=pk, hotel_id=hotel_id,
+                      action='archive' if archived else 'upsert')
+        for pk, hotel_id, archived in Product.objects.values_list('pk', 'hotel_id', 'is_archived')
+    ]
+    CatalogChange.objects.bulk_create(changes, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu_app', '0005_product_product_type_alter_product_available_rooms_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(choices=[('hotel', 'Hotel'), ('category', 'Category'), ('product', 'Product')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('upsert', 'Created or updated'), ('archive', 'Archived'), ('delete', 'Deleted')], default='upsert', max_length=16)),
+                ('hotel_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hotel_id', 'id'], name='menu_app_ca_hotel_i_d3dc64_idx')],
+            },
+        ),
+        migrations.RunPython(seed_change_log, migrations.RunPython.noop),
+    ]
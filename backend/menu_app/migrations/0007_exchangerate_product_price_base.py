@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_base_prices(apps, schema_editor):
+    # No rates exist yet, so only products already priced in the base currency can be filled
+    Product = apps.get_model('menu_app', 'Product')
+    base = getattr(settings, 'BASE_CURRENCY', 'KES')
+    Product.objects.filter(currency__iexact=base).update(price_base=models.F('price'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu_app', '0006_catalogchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=8, unique=True)),
+                ('rate_to_base', models.DecimalField(decimal_places=8, max_digits=18)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='price_base',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.RunPython(fill_base_prices, migrations.RunPython.noop),
+    ]
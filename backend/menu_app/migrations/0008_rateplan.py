@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu_app', '0007_exchangerate_product_price_base'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatePlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('nightly_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('weekdays', models.CharField(blank=True, max_length=20)),
+                ('min_nights', models.PositiveIntegerField(default=1)),
+                ('priority', models.IntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rate_plans', to='menu_app.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'is_active'], name='menu_app_ra_product_96e773_idx')],
+            },
+        ),
+    ]
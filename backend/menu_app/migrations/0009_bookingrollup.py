@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu_app', '0008_rateplan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bookings', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cancellations', models.IntegerField(default=0)),
+                ('room_nights', models.IntegerField(default=0)),
+                ('hotel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_rollups', to='menu_app.hotel')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_rollups', to='menu_app.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hotel', 'day'], name='menu_app_bo_hotel_i_42ed36_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'day'), name='unique_rollup_product_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu_app', '0009_bookingrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('product_name', models.CharField(blank=True, max_length=255)),
+                ('guest_name', models.CharField(blank=True, max_length=200)),
+                ('check_in', models.DateField()),
+                ('check_out', models.DateField()),
+                ('pax', models.IntegerField(default=1)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('created_at', models.DateTimeField()),
+                ('status', models.CharField(max_length=32)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('hotel', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='menu_app.hotel')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='menu_app.product')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hotel', 'check_in'], name='menu_app_ar_hotel_i_501b4c_idx'), models.Index(fields=['user', 'check_in'], name='menu_app_ar_user_id_1b2ca4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:29
+
+import django.core.validators
+import menu_app.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu_app', '0010_archivedbooking'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='hotel',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=menu_app.storage.hotel_image_storage, upload_to='hotels/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'])]),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=menu_app.storage.product_image_storage, upload_to='product_images/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'])]),
+        ),
+    ]
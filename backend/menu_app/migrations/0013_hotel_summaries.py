@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:39
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Q, Sum
+
+
+def fill_summaries(apps, schema_editor):
+    Hotel = apps.get_model('menu_app', 'Hotel')
+    Product = apps.get_model('menu_app', 'Product')
+    hotels = {}
+    rows = (
+        Product.objects.filter(is_archived=False).order_by().values('hotel_id', 'product_type')
+        .annotate(count=Count('id'), min_price=Min('price_base'), rooms=Sum('available_rooms', filter=Q(available=True)))
+    )
+    for row in rows:
+        hotel = hotels.setdefault(row['hotel_id'], Hotel(pk=row['hotel_id']))
+        if row['product_type'] == 'room':
+            hotel.room_count, hotel.min_room_price, hotel.rooms_available = row['count'], row['min_price'], row['rooms'] or 0
+        elif row['product_type'] == 'food':
+            hotel.food_count, hotel.min_food_price = row['count'], row['min_price']
+    Hotel.objects.bulk_update(
+        hotels.values(), ['room_count', 'food_count', 'rooms_available', 'min_room_price', 'min_food_price'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu_app', '0012_hotel_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotel',
+            name='food_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='min_food_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='min_room_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='room_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='rooms_available',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
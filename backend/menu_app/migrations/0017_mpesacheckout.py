@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu_app', '0016_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MpesaCheckout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checkout_request_id', models.CharField(max_length=64, unique=True)),
+                ('phone', models.CharField(max_length=20)),
+                ('amount', models.PositiveIntegerField()),
+                ('booking_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('result_code', models.IntegerField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
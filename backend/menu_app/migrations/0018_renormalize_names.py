@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:02
+
+from django.db import migrations
+
+from menu_app.text import normalize_name
+
+BATCH_SIZE = 5000
+
+
+def renormalize(apps, schema_editor):
+    # Rows written before normalize_name() got its current rules would otherwise miss name lookups
+    CatalogChange = apps.get_model('menu_app', 'CatalogChange')
+    for model_name in ('CanonicalProduct', 'Product'):
+        model = apps.get_model('menu_app', model_name)
+        last_pk = 0
+        while True:
+            rows = list(model.objects.filter(pk__gt=last_pk).order_by('pk')[:BATCH_SIZE])
+            if not rows:
+                break
+            last_pk = rows[-1].pk
+            stale = [row for row in rows if row.normalized_name != normalize_name(row.name)]
+            for row in stale:
+                row.normalized_name = normalize_name(row.name)
+            model.objects.bulk_update(stale, ['normalized_name'])
+            if model_name == 'Product':
+                # Offline clients pick the new lookup keys up through /api/sync/
+                CatalogChange.objects.bulk_create([
+                    CatalogChange(
+                        entity='product', object_id=row.pk, hotel_id=row.hotel_id,
+                        action='archive' if row.is_archived else 'upsert',
+                    )
+                    for row in stale
+                ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu_app', '0017_mpesacheckout'),
+    ]
+
+    operations = [
+        migrations.RunPython(renormalize, migrations.RunPython.noop),
+    ]
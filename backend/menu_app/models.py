@@ -1,9 +1,25 @@
-from django.db import models
+import uuid
+
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import FileExtensionValidator
-from PIL import Image
-from django.db.models.signals import post_save
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.signals import post_save, post_delete, post_init
 from django.dispatch import receiver
+from django.utils import timezone
+from .events import broker
+from .currency import to_base, clear_rate_cache
+from .pricing import quote_stay
+from .rollups import booking_state, record_booking_change
+from .lookups import clear_type_choices
+from .storage import hotel_image_storage, product_image_storage
+from .text import normalize_name
+from .geo import encode as geohash_encode
+from .summaries import schedule_refresh
+from .snapshot import catalog_changed
+from .outbox import record_event, booking_payload
 
 User = get_user_model()
 
@@ -15,13 +31,32 @@ class Hotel(models.Model):
     address = models.TextField(blank=True)
     city = models.CharField(max_length=100, blank=True, null=True)
     timezone = models.CharField(max_length=50, default='UTC')
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Derived from latitude/longitude in save(); range-scanned by the nearby search (see geo.py)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+    # Catalog summary for the hotel listing, maintained by summaries.py (prices in settings.BASE_CURRENCY)
+    room_count = models.PositiveIntegerField(default=0, editable=False)
+    food_count = models.PositiveIntegerField(default=0, editable=False)
+    rooms_available = models.PositiveIntegerField(default=0, editable=False)
+    min_room_price = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, editable=False)
+    min_food_price = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, editable=False)
     image = models.ImageField(
         upload_to='hotels/',
+        storage=hotel_image_storage,
         blank=True,
         null=True,
+        db_index=True,
         validators=[FileExtensionValidator(['jpg', 'jpeg', 'png'])]
     )
 
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geohash_encode(float(self.latitude), float(self.longitude))
+        else:
+            self.geohash = ''
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.name} ({self.city})" if self.city else self.name
 
@@ -35,17 +70,45 @@ class Category(models.Model):
         return self.name
 
 
+# NORMALIZED NAMES: kept in step with `name` by save(), bulk_create(), bulk_update() and update(name=...)
+class NormalizedNameQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.normalized_name = normalize_name(obj.name)
+        catalog_changed()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs, fields = list(objs), list(fields)
+        if 'name' in fields:
+            for obj in objs:
+                obj.normalized_name = normalize_name(obj.name)
+            if 'normalized_name' not in fields:
+                fields.append('normalized_name')
+        catalog_changed()
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        if 'name' in kwargs and 'normalized_name' not in kwargs:
+            if not isinstance(kwargs['name'], str):
+                # normalized_name cannot be computed from an expression in SQL
+                raise TypeError("update(name=...) takes a plain string; save() or bulk_update() the objects instead.")
+            kwargs['normalized_name'] = normalize_name(kwargs['name'])
+        catalog_changed()
+        return super().update(**kwargs)
+
+
 # CANONICAL PRODUCT
 class CanonicalProduct(models.Model):
     name = models.CharField(max_length=255)
     sku = models.CharField(max_length=128, blank=True, null=True, db_index=True)
     normalized_name = models.CharField(max_length=255, blank=True, db_index=True)
 
+    objects = NormalizedNameQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
-        if not self.normalized_name:
-            self.normalized_name = ''.join(
-                e for e in (self.name or '').lower() if e.isalnum() or e.isspace()
-            ).strip()
+        self.normalized_name = normalize_name(self.name)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -73,16 +136,21 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=8, default='KES')
+    # price converted to settings.BASE_CURRENCY; maintained by save() and currency.recompute_base_prices()
+    price_base = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, db_index=True)
 
     # Room-specific fields
     total_rooms = models.PositiveIntegerField(default=1, null=True, blank=True)
     available_rooms = models.PositiveIntegerField(default=1, null=True, blank=True)
     available = models.BooleanField(default=True)
 
+    # Content-addressed: identical uploads share one file, resized once on first write
     image = models.ImageField(
         upload_to='product_images/',
+        storage=product_image_storage,
         null=True,
         blank=True,
+        db_index=True,
         validators=[FileExtensionValidator(['jpg', 'jpeg', 'png'])]
     )
     extra_meta = models.JSONField(blank=True, default=dict)
@@ -90,6 +158,8 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_archived = models.BooleanField(default=False)
 
+    objects = NormalizedNameQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=['normalized_name']),
@@ -97,20 +167,12 @@ class Product(models.Model):
         ]
 
     def save(self, *args, **kwargs):
-        if not self.normalized_name:
-            self.normalized_name = ''.join(
-                e for e in self.name.lower() if e.isalnum() or e.isspace()
-            ).strip()
+        # Recomputed on every save so a rename never leaves a stale lookup key
+        self.normalized_name = normalize_name(self.name)
+        self.price_base = to_base(self.price, self.currency)
+        # New images are resized by the storage when their first copy is written
         super().save(*args, **kwargs)
 
-        # Resize image safely
-        if self.image:
-            img_path = self.image.path
-            img = Image.open(img_path)
-            max_size = (1200, 1200)
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            img.save(img_path, optimize=True, quality=85)
-
     def decrease_rooms(self, number=1):
         if self.product_type != 'room':
             return
@@ -124,6 +186,64 @@ class Product(models.Model):
         return f"{self.name} — {self.hotel} ({self.product_type})"
 
 
+# RATE PLAN (seasonal / weekend / length-of-stay nightly prices for rooms)
+class RatePlan(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='rate_plans')
+    name = models.CharField(max_length=100)
+    nightly_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Inclusive date window; leave empty for open-ended
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    # Comma separated weekdays the plan applies to (Mon=0 ... Sun=6), e.g. "4,5" for Fri/Sat nights
+    weekdays = models.CharField(max_length=20, blank=True)
+    # Only applies to stays of at least this many nights
+    min_nights = models.PositiveIntegerField(default=1)
+    # Highest priority wins when several plans match the same night
+    priority = models.IntegerField(default=0)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'is_active']),
+        ]
+
+    def clean(self):
+        try:
+            days = self.weekday_set()
+        except ValueError:
+            raise ValidationError({'weekdays': 'Use comma separated numbers 0 (Mon) to 6 (Sun).'})
+        if any(d < 0 or d > 6 for d in days):
+            raise ValidationError({'weekdays': 'Use comma separated numbers 0 (Mon) to 6 (Sun).'})
+        if self.start_date and self.end_date and self.start_date > self.end_date:
+            raise ValidationError({'end_date': 'End date must be on or after start date.'})
+
+    def weekday_set(self):
+        return {int(d) for d in self.weekdays.split(',') if d.strip()}
+
+    def __str__(self):
+        return f"{self.name} ({self.product.name})"
+
+
+# EXCHANGE RATE (1 unit of `currency` = rate_to_base units of settings.BASE_CURRENCY)
+class ExchangeRate(models.Model):
+    currency = models.CharField(max_length=8, unique=True)
+    rate_to_base = models.DecimalField(max_digits=18, decimal_places=8)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def save(self, *args, **kwargs):
+        self.currency = self.currency.strip().upper()
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.currency} = {self.rate_to_base}"
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def reset_rate_cache(sender, **kwargs):
+    clear_rate_cache()
+
+
 # HOTEL USER
 class HotelUser(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='hotel_memberships')
@@ -147,12 +267,52 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=32, default='pending')
 
+    def clean(self):
+        super().clean()
+        self.check_stay()
+
+    def check_stay(self):
+        """Pricing and the stats rollups both work per night, so a stay's length is capped at MAX_QUOTE_NIGHTS."""
+        if self.check_in is None or self.check_out is None:
+            return
+        if self.check_out < self.check_in:
+            raise ValidationError({'check_out': 'Check-out must not be before check-in.'})
+        if (self.check_out - self.check_in).days > settings.MAX_QUOTE_NIGHTS:
+            raise ValidationError({'check_out': f'Stays can be at most {settings.MAX_QUOTE_NIGHTS} nights.'})
+
     def save(self, *args, **kwargs):
-        # Only calculate price for rooms
-        if self.product.product_type == 'room' and not self.total_price:
-            nights = (self.check_out - self.check_in).days or 1
-            self.total_price = self.product.price * nights
-        super().save(*args, **kwargs)
+        # Before pricing and the rollup signal each touch every night
+        self.check_stay()
+        # Only calculate price for rooms; nightly rates come from the product's rate plans
+        if not self.total_price and self.product.product_type == 'room':
+            self.total_price = quote_stay(self.product, self.check_in, self.check_out)
+        # The post_save signals (inventory, rollups, outbox event) commit with the booking or not at all
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+# ARCHIVED BOOKING (finished stays moved out of the live table by `manage.py archive_bookings`)
+class ArchivedBooking(models.Model):
+    # Keeps the original Booking id
+    id = models.BigIntegerField(primary_key=True)
+    product = models.ForeignKey(Product, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    hotel = models.ForeignKey(Hotel, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    product_name = models.CharField(max_length=255, blank=True)
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    guest_name = models.CharField(max_length=200, blank=True)
+    check_in = models.DateField()
+    check_out = models.DateField()
+    pax = models.IntegerField(default=1)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    created_at = models.DateTimeField()
+    status = models.CharField(max_length=32)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['hotel', 'check_in']),
+            models.Index(fields=['user', 'check_in']),
+        ]
 
 
 # SIGNAL: Reduce room availability when a new booking is created
@@ -160,3 +320,392 @@ class Booking(models.Model):
 def reduce_room_availability(sender, instance, created, **kwargs):
     if created and instance.status == "pending":
         instance.product.decrease_rooms()
+
+
+# BOOKING ROLLUP (daily per-product stats, maintained incrementally)
+class BookingRollup(models.Model):
+    day = models.DateField()
+    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, related_name='booking_rollups')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='booking_rollups')
+    # Bookings made on `day` (and their value), counted by creation date
+    bookings = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cancellations = models.IntegerField(default=0)
+    # Rooms occupied on the night of `day`
+    room_nights = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='unique_rollup_product_day'),
+        ]
+        indexes = [
+            models.Index(fields=['hotel', 'day']),
+        ]
+
+
+@receiver(post_init, sender=Booking)
+def remember_booking_state(sender, instance, **kwargs):
+    # What the stored row contributes; the hotel is looked up on save if the product was not loaded
+    instance._rollup_state = booking_state(instance, with_hotel=False) if instance.pk else None
+
+
+@receiver(post_save, sender=Booking)
+def update_booking_rollups(sender, instance, created, **kwargs):
+    previous = None if created else instance._rollup_state
+    record_booking_change(previous, instance)
+    instance._rollup_state = booking_state(instance)
+
+
+@receiver(post_delete, sender=Booking)
+def remove_booking_rollups(sender, instance, **kwargs):
+    record_booking_change(instance._rollup_state, None)
+
+
+# OUTBOX: booking events are written in the booking's transaction (Booking.save and delete are atomic)
+@receiver(post_save, sender=Booking)
+def record_booking_event(sender, instance, created, **kwargs):
+    record_event('booking.created' if created else 'booking.updated', booking_payload(instance), instance.product.hotel_id)
+
+
+@receiver(post_delete, sender=Booking)
+def record_booking_delete(sender, instance, **kwargs):
+    record_event('booking.deleted', booking_payload(instance), instance.product.hotel_id)
+
+
+# FOOD ORDER (placed from a table, prepared from the kitchen display feed)
+class Order(models.Model):
+    STATUS_CHOICES = (
+        ('new', 'New'),
+        ('preparing', 'Preparing'),
+        ('ready', 'Ready'),
+        ('served', 'Served'),
+        ('cancelled', 'Cancelled'),
+    )
+    OPEN_STATUSES = ('new', 'preparing', 'ready')
+
+    # The auto-increment id is the kitchen feed cursor
+    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, related_name='orders')
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    table = models.CharField(max_length=32, blank=True)
+    guest_name = models.CharField(max_length=200, blank=True)
+    note = models.CharField(max_length=500, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='new')
+    # Sum of the items' price_base at order time, in settings.BASE_CURRENCY
+    total_price = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['hotel', 'id']),
+            models.Index(fields=['hotel', 'status']),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.pk} — {self.hotel} ({self.status})"
+
+
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, null=True, blank=True, on_delete=models.SET_NULL, related_name='order_items')
+    # Snapshot of the menu item when ordered, so later edits don't rewrite the ticket
+    product_name = models.CharField(max_length=255)
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=8, default='KES')
+    note = models.CharField(max_length=255, blank=True)
+
+
+# M-PESA CHECKOUT (STK pushes we initiated; callbacks for any other CheckoutRequestID are ignored)
+class MpesaCheckout(models.Model):
+    checkout_request_id = models.CharField(max_length=64, unique=True)
+    phone = models.CharField(max_length=20)
+    amount = models.PositiveIntegerField()
+    booking_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by the first callback; Daraja's retries of it find it set and are skipped
+    result_code = models.IntegerField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.checkout_request_id
+
+
+# IDEMPOTENCY KEYS (stored responses of POSTs sent with an Idempotency-Key header; see idempotency.py)
+class IdempotencyKey(models.Model):
+    scope = models.CharField(max_length=32)
+    # 'user:<id>' or 'anon:<client ip>', so one client cannot replay another's response
+    principal = models.CharField(max_length=64)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    # Null while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    locked_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'principal', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
+
+
+# WEBHOOKS: outbound endpoints and the transactional outbox delivered by `manage.py relay_outbox`
+class WebhookEndpoint(models.Model):
+    name = models.CharField(max_length=100)
+    url = models.URLField(max_length=500)
+    # When set, bodies are signed: X-Signature: sha256=<hex HMAC of the body>
+    secret = models.CharField(max_length=255, blank=True)
+    # Event types to receive, e.g. ["booking.created"]; empty receives every event
+    event_types = models.JSONField(default=list, blank=True)
+    # Only this hotel's events; hotel-less endpoints receive every hotel's (and payment) events
+    hotel = models.ForeignKey(Hotel, null=True, blank=True, on_delete=models.CASCADE, related_name='webhook_endpoints')
+    max_concurrency = models.PositiveSmallIntegerField(default=2)
+    is_active = models.BooleanField(default=True)
+
+    def accepts(self, event_type):
+        return not self.event_types or event_type in self.event_types
+
+    def __str__(self):
+        return self.name
+
+
+class OutboxMessage(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('delivered', 'Delivered'),
+        ('failed', 'Failed'),
+    )
+
+    endpoint = models.ForeignKey(WebhookEndpoint, on_delete=models.CASCADE, related_name='messages')
+    # Shared by the messages of one event (one per endpoint); sent as the Idempotency-Key
+    event_id = models.UUIDField(default=uuid.uuid4)
+    event_type = models.CharField(max_length=64)
+    hotel_id = models.BigIntegerField(null=True, blank=True)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Token of the relay run delivering the message (see outbox.claim_batch)
+    claim = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['claim']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} -> {self.endpoint_id}"
+
+
+# CATALOG CHANGE LOG (feeds the delta-sync API)
+class CatalogChange(models.Model):
+    ENTITY_CHOICES = (
+        ('hotel', 'Hotel'),
+        ('category', 'Category'),
+        ('product', 'Product'),
+    )
+    ACTION_CHOICES = (
+        ('upsert', 'Created or updated'),
+        ('archive', 'Archived'),
+        ('delete', 'Deleted'),
+    )
+
+    # The auto-increment id is the sync cursor handed to clients
+    entity = models.CharField(max_length=16, choices=ENTITY_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=16, choices=ACTION_CHOICES, default='upsert')
+    hotel_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['hotel_id', 'id']),
+        ]
+
+    @classmethod
+    def record(cls, entity, object_id, action='upsert', hotel_id=None):
+        return cls.objects.create(entity=entity, object_id=object_id, action=action, hotel_id=hotel_id)
+
+
+@receiver(post_save, sender=Hotel)
+def log_hotel_change(sender, instance, **kwargs):
+    CatalogChange.record('hotel', instance.pk, hotel_id=instance.pk)
+
+
+@receiver(post_delete, sender=Hotel)
+def log_hotel_delete(sender, instance, **kwargs):
+    CatalogChange.record('hotel', instance.pk, action='delete', hotel_id=instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def log_category_change(sender, instance, **kwargs):
+    CatalogChange.record('category', instance.pk)
+
+
+@receiver(post_delete, sender=Category)
+def log_category_delete(sender, instance, **kwargs):
+    CatalogChange.record('category', instance.pk, action='delete')
+
+
+@receiver(post_init, sender=Product)
+def remember_saved_hotel(sender, instance, **kwargs):
+    # The hotel the stored row belongs to, until forget_saved_hotel (registered last) moves it on
+    instance._saved_hotel_id = instance.__dict__.get('hotel_id')
+
+
+@receiver(post_save, sender=Product)
+def log_product_change(sender, instance, created, **kwargs):
+    previous = instance._saved_hotel_id
+    if not created and previous is not None and previous != instance.hotel_id:
+        # Moved: clients syncing the old hotel get a tombstone (logged first, so a full sync keeps the upsert)
+        CatalogChange.record('product', instance.pk, action='delete', hotel_id=previous)
+    action = 'archive' if instance.is_archived else 'upsert'
+    CatalogChange.record('product', instance.pk, action=action, hotel_id=instance.hotel_id)
+
+
+@receiver(post_delete, sender=Product)
+def log_product_delete(sender, instance, **kwargs):
+    CatalogChange.record('product', instance.pk, action='delete', hotel_id=instance.hotel_id)
+
+
+# MEDIA: release replaced or orphaned images (the storage keeps files other rows still share)
+def _stored_image_name(instance):
+    value = instance.__dict__.get('image')
+    return getattr(value, 'name', value) or None
+
+
+@receiver(post_init, sender=Hotel)
+@receiver(post_init, sender=Product)
+def remember_image_name(sender, instance, **kwargs):
+    instance._image_name = _stored_image_name(instance)
+
+
+def _release_image(field, name):
+    transaction.on_commit(lambda: field.storage.delete(name))
+
+
+@receiver(post_save, sender=Hotel)
+@receiver(post_save, sender=Product)
+def release_replaced_image(sender, instance, **kwargs):
+    previous, current = instance._image_name, _stored_image_name(instance)
+    if previous and previous != current:
+        _release_image(sender._meta.get_field('image'), previous)
+    instance._image_name = current
+
+
+@receiver(post_delete, sender=Hotel)
+@receiver(post_delete, sender=Product)
+def release_deleted_image(sender, instance, **kwargs):
+    if instance._image_name:
+        _release_image(sender._meta.get_field('image'), instance._image_name)
+
+
+# HOTEL SUMMARIES: recompute the hotel's catalog summary after the write commits
+@receiver(post_init, sender=Product)
+def remember_summary_hotel(sender, instance, **kwargs):
+    instance._summary_hotel_id = instance.__dict__.get('hotel_id')
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def refresh_summary_on_product_change(sender, instance, **kwargs):
+    # A product moved to another hotel leaves the old one to update as well
+    schedule_refresh(instance.hotel_id, instance._summary_hotel_id)
+    instance._summary_hotel_id = instance.hotel_id
+
+
+# CATALOG SNAPSHOT: any catalog write makes the shared snapshot stale (queryset writes: see NormalizedNameQuerySet)
+@receiver(post_save, sender=Hotel)
+@receiver(post_delete, sender=Hotel)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=CanonicalProduct)
+@receiver(post_delete, sender=CanonicalProduct)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog_snapshot(sender, **kwargs):
+    catalog_changed()
+
+
+# ADMIN LOOKUPS: the product_type -> canonical/category choices follow product changes
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def reset_type_choices(sender, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not {'product_type', 'canonical', 'category'} & set(update_fields):
+        return
+    clear_type_choices()
+
+
+# LIVE EVENTS: push availability and price changes to SSE subscribers after commit
+def product_event(product, deleted=False):
+    if deleted:
+        return {'id': product.pk, 'deleted': True}
+    return {
+        'id': product.pk,
+        'product_type': product.product_type,
+        'price': str(product.price),
+        'currency': product.currency,
+        'available': product.available,
+        'available_rooms': product.available_rooms,
+        'total_rooms': product.total_rooms,
+        'is_archived': product.is_archived,
+    }
+
+
+@receiver(post_save, sender=Product)
+def publish_product_change(sender, instance, created, **kwargs):
+    event, hotel_id, previous = product_event(instance), instance.hotel_id, instance._saved_hotel_id
+    moved = not created and previous is not None and previous != hotel_id
+
+    def publish():
+        if moved:
+            # Subscribers of the old hotel see the product leave
+            broker.publish(previous, product_event(instance, deleted=True))
+        broker.publish(hotel_id, event)
+
+    transaction.on_commit(publish)
+
+
+@receiver(post_delete, sender=Product)
+def publish_product_delete(sender, instance, **kwargs):
+    event = product_event(instance, deleted=True)
+    transaction.on_commit(lambda: broker.publish(instance.hotel_id, event))
+
+
+def products_changed(products):
+    """
+    Record change-log rows and publish live events for products written with
+    queryset.update()/bulk operations, which bypass the save signals above.
+    `products` must already hold the new field values.
+    """
+    products = list(products)
+    CatalogChange.objects.bulk_create([
+        CatalogChange(
+            entity='product', object_id=p.pk, hotel_id=p.hotel_id,
+            action='archive' if p.is_archived else 'upsert'
+        )
+        for p in products
+    ])
+    events = [(p.hotel_id, product_event(p)) for p in products]
+    schedule_refresh(*{p.hotel_id for p in products})
+
+    def publish():
+        for hotel_id, event in events:
+            broker.publish(hotel_id, event)
+
+    transaction.on_commit(publish)
+
+
+# Registered after every other Product post_save handler, which all see the pre-save hotel
+@receiver(post_save, sender=Product)
+def forget_saved_hotel(sender, instance, **kwargs):
+    instance._saved_hotel_id = instance.hotel_id
@@ -1,12 +1,95 @@
+"""
+Safaricom Daraja (M-Pesa) client.
+`requests` is imported inside the functions so workers that never take a
+payment don't pay for loading it at boot.
+"""
 import base64
-import requests
-from django.utils import timezone
+from urllib.parse import urlencode
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+
+MPESA_TOKEN_CACHE_KEY = 'mpesa_access_token'
+MPESA_TOKEN_CACHE_SECONDS = 50 * 60  # Daraja tokens live for an hour
+
 
 def generate_password(shortcode, passkey, timestamp):
     data = f"{shortcode}{passkey}{timestamp}"
     return base64.b64encode(data.encode()).decode()
 
-def get_access_token(consumer_key, consumer_secret):
+
+def get_mpesa_access_token():
+    consumer_key = getattr(settings, "MPESA_CONSUMER_KEY", None)
+    consumer_secret = getattr(settings, "MPESA_CONSUMER_SECRET", None)
+
+    if not consumer_key or not consumer_secret:
+        return None
+
+    token = cache.get(MPESA_TOKEN_CACHE_KEY)
+    if token:
+        return token
+
+    import requests
+
     url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-    response = requests.get(url, auth=(consumer_key, consumer_secret))
-    return response.json().get("access_token")
+    try:
+        response = requests.get(url, auth=(consumer_key, consumer_secret), timeout=10)
+        response.raise_for_status()
+        token = response.json().get("access_token")
+    except requests.RequestException:
+        return None
+
+    if token:
+        cache.set(MPESA_TOKEN_CACHE_KEY, token, MPESA_TOKEN_CACHE_SECONDS)
+    return token
+
+
+def send_stk_push(phone, amount, reference):
+    """Call Daraja and return (payload, http_status) so the result can be shared between callers."""
+    access_token = get_mpesa_access_token()
+    if not access_token:
+        return {"detail": "Could not get access token"}, 500
+
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+
+    shortcode = getattr(settings, "MPESA_SHORTCODE", None)
+    passkey = getattr(settings, "MPESA_PASSKEY", None)
+    callback_url = getattr(settings, "MPESA_CALLBACK_URL", None)
+
+    if not (shortcode and passkey and callback_url):
+        return {"detail": "M-Pesa configuration incomplete"}, 500
+
+    password = generate_password(shortcode, passkey, timestamp)
+    token = getattr(settings, "MPESA_CALLBACK_TOKEN", "")
+    if token:
+        # Daraja calls back exactly this URL; the callback view checks the token
+        callback_url += ('&' if '?' in callback_url else '?') + urlencode({'token': token})
+
+    stk_url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
+
+    payload = {
+        "BusinessShortCode": shortcode,
+        "Password": password,
+        "Timestamp": timestamp,
+        "TransactionType": "CustomerPayBillOnline",
+        "Amount": amount,
+        "PartyA": phone,
+        "PartyB": shortcode,
+        "PhoneNumber": phone,
+        "CallBackURL": callback_url,
+        "AccountReference": reference,
+        "TransactionDesc": "Hotel Booking"
+    }
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    import requests
+
+    try:
+        response = requests.post(stk_url, json=payload, headers=headers, timeout=10)
+        response.raise_for_status()
+        return response.json(), 200
+    except requests.RequestException as exc:
+        # Return useful info for debugging
+        return {"detail": "M-Pesa request failed", "error": str(exc)}, 502
@@ -0,0 +1,136 @@
+"""
+Food order intake and the kitchen display feed.
+
+An order is validated against the menu with one query for all of its items
+(the client may send the price it displayed; a stale price rejects the order
+rather than charging something else), then written as one Order INSERT and
+one bulk OrderItem INSERT, so the cost of an order does not grow with its
+number of lines.
+
+After commit the order id is published on the hotel's kitchen channel. The
+feed does not forward individual orders: a wake-up waits a short window for
+the rest of the rush, then loads everything past its cursor with one query
+(plus one for the items) and sends it as a single batch.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from .events import broker
+from .models import Order, OrderItem, Product
+
+KITCHEN_BATCH_SIZE = 200
+# Seconds a wake-up waits so a burst of orders goes out as one batch
+KITCHEN_BATCH_WINDOW = 0.25
+
+
+class OrderError(Exception):
+    def __init__(self, results):
+        super().__init__("Order rejected")
+        self.results = results
+
+
+def kitchen_channel(hotel_id):
+    return f'kitchen:{hotel_id}'
+
+
+def publish_kitchen_event(hotel_id, event):
+    transaction.on_commit(lambda: broker.publish(kitchen_channel(hotel_id), event))
+
+
+def place_order(hotel_slug, items, user=None, table='', guest_name='', note=''):
+    """
+    `items` are validated dicts: product (id), quantity, optional price and note.
+    Returns the saved Order, or raises OrderError carrying per-item results
+    when any item cannot be ordered (nothing is written then).
+    """
+    products = Product.objects.filter(
+        pk__in={item['product'] for item in items}, hotel__slug=hotel_slug
+    ).only(
+        'id', 'hotel_id', 'name', 'product_type', 'price', 'currency', 'price_base', 'available', 'is_archived'
+    ).in_bulk()
+
+    errors = {}
+    for index, item in enumerate(items):
+        product = products.get(item['product'])
+        if product is None or product.is_archived:
+            errors[index] = "Product not found."
+        elif product.product_type != 'food':
+            errors[index] = "Only food items can be ordered."
+        elif not product.available:
+            errors[index] = f"{product.name} is not available."
+        elif product.price_base is None:
+            errors[index] = f"{product.name} has no price in the base currency."
+        elif item.get('price') is not None and item['price'] != product.price:
+            errors[index] = f"The price of {product.name} is now {product.price} {product.currency}."
+    if errors:
+        raise OrderError([
+            {'index': i, 'status': 'error', 'error': errors[i]} if i in errors
+            else {'index': i, 'status': 'ok'}
+            for i in range(len(items))
+        ])
+
+    quantities = Counter()
+    for item in items:
+        quantities[item['product']] += item['quantity']
+    hotel_id = next(iter(products.values())).hotel_id
+
+    with transaction.atomic():
+        order = Order.objects.create(
+            hotel_id=hotel_id,
+            user_id=getattr(user, 'pk', None),
+            table=table,
+            guest_name=guest_name,
+            note=note,
+            total_price=sum(products[pk].price_base * n for pk, n in quantities.items()),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=item['product'],
+                product_name=products[item['product']].name,
+                quantity=item['quantity'],
+                unit_price=products[item['product']].price,
+                currency=products[item['product']].currency,
+                note=item.get('note', ''),
+            )
+            for item in items
+        ])
+        publish_kitchen_event(hotel_id, {'order': order.pk})
+    return order
+
+
+def set_order_status(orders, status):
+    """Move `orders` (a queryset) to `status` with one UPDATE; kitchen displays get one event per hotel."""
+    rows = list(orders.values_list('pk', 'hotel_id'))
+    if not rows:
+        return 0
+    with transaction.atomic():
+        updated = Order.objects.filter(pk__in=[pk for pk, _ in rows]).update(status=status, updated_at=timezone.now())
+        by_hotel = {}
+        for pk, hotel_id in rows:
+            by_hotel.setdefault(hotel_id, []).append(pk)
+        for hotel_id, ids in by_hotel.items():
+            publish_kitchen_event(hotel_id, {'status': status, 'ids': ids})
+    return updated
+
+
+async def ticket_batches(hotel_id, after, until=None, open_only=False):
+    """
+    Yield the hotel's orders with id in (after, until], oldest first, in lists
+    of up to KITCHEN_BATCH_SIZE with their items prefetched (two queries a batch).
+    """
+    while True:
+        orders = Order.objects.filter(hotel_id=hotel_id, id__gt=after)
+        if until is not None:
+            orders = orders.filter(id__lte=until)
+        if open_only:
+            orders = orders.filter(status__in=Order.OPEN_STATUSES)
+        batch = [order async for order in orders.prefetch_related('items').order_by('id')[:KITCHEN_BATCH_SIZE]]
+        if not batch:
+            return
+        yield batch
+        if len(batch) < KITCHEN_BATCH_SIZE:
+            return
+        after = batch[-1].pk
@@ -0,0 +1,196 @@
+"""
+Transactional outbox for outbound webhooks (channel managers, SMS/email gateways).
+
+Side effects of a booking or payment are not run inline: record_event()
+writes one OutboxMessage per matching WebhookEndpoint in the caller's
+transaction, so the event exists exactly when the change it describes was
+committed, and the guest's request does not wait on third parties.
+
+`manage.py relay_outbox` delivers them. Each batch claims due messages with
+a conditional UPDATE (so several relays never send the same batch), posts
+them with at most `endpoint.max_concurrency` requests in flight per
+endpoint, and records the outcomes with one bulk UPDATE limited to the rows
+it still holds the claim on. Failures are retried with exponential backoff
+(honouring Retry-After) until OUTBOX_MAX_ATTEMPTS, then marked failed. A
+relay that dies mid-batch leaves its messages to be claimed again after
+OUTBOX_LEASE_SECONDS; a slow batch stops sending one timeout before its
+lease runs out and hands the rest back. Delivery is at least once:
+receivers dedupe on the Idempotency-Key header (the event id).
+"""
+import hashlib
+import hmac
+import json
+import random
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+
+
+def booking_payload(booking):
+    return {
+        'id': booking.pk,
+        'product': booking.product_id,
+        'hotel': booking.product.hotel_id,
+        'user': booking.user_id,
+        'guest_name': booking.guest_name,
+        'check_in': booking.check_in,
+        'check_out': booking.check_out,
+        'pax': booking.pax,
+        'total_price': booking.total_price,
+        'status': booking.status,
+    }
+
+
+def record_events(events):
+    """
+    Queue (event_type, payload, hotel_id[, event_id]) events for every active
+    endpoint that wants them. Call inside the transaction that makes the change.
+    A caller that may record the same event twice passes a stable event_id.
+    """
+    from .models import OutboxMessage, WebhookEndpoint
+
+    events = [tuple(event) + (None,) * (4 - len(event)) for event in events]
+    hotel_ids = {hotel_id for _, _, hotel_id, _ in events if hotel_id is not None}
+    endpoints = list(WebhookEndpoint.objects.filter(is_active=True).filter(
+        Q(hotel__isnull=True) | Q(hotel_id__in=hotel_ids)
+    ))
+    messages = []
+    for event_type, payload, hotel_id, event_id in events:
+        event_id = event_id or uuid.uuid4()
+        messages.extend(
+            OutboxMessage(endpoint=endpoint, event_id=event_id, event_type=event_type, hotel_id=hotel_id, payload=payload)
+            for endpoint in endpoints
+            if endpoint.accepts(event_type) and endpoint.hotel_id in (None, hotel_id)
+        )
+    OutboxMessage.objects.bulk_create(messages)
+    return messages
+
+
+def record_event(event_type, payload, hotel_id=None, event_id=None):
+    return record_events([(event_type, payload, hotel_id, event_id)])
+
+
+# RELAY
+def backoff(attempts):
+    """Seconds before retry number `attempts`: doubling from OUTBOX_BACKOFF_SECONDS, capped, with jitter."""
+    delay = min(settings.OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.OUTBOX_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_batch(batch_size):
+    """Claim up to `batch_size` due messages for this relay run and return them."""
+    from .models import OutboxMessage
+
+    now = timezone.now()
+    due = OutboxMessage.objects.filter(status='pending', next_attempt_at__lte=now, endpoint__is_active=True)
+    ids = list(due.order_by('next_attempt_at', 'id').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # Pushing next_attempt_at past the lease hides them from other relays until this run records the outcome
+    OutboxMessage.objects.filter(pk__in=ids, status='pending', next_attempt_at__lte=now).update(
+        claim=token, next_attempt_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS),
+    )
+    return list(OutboxMessage.objects.filter(claim=token).select_related('endpoint').order_by('id'))
+
+
+def message_body(message):
+    return json.dumps({
+        'id': str(message.event_id),
+        'type': message.event_type,
+        'created_at': message.created_at,
+        'data': message.payload,
+    }, cls=DjangoJSONEncoder).encode()
+
+
+def deliver(session, message):
+    """POST one message. Returns (delivered, error, retry_after_seconds)."""
+    import requests
+
+    body = message_body(message)
+    headers = {
+        'Content-Type': 'application/json',
+        'X-Event-Type': message.event_type,
+        'Idempotency-Key': str(message.event_id),
+    }
+    secret = message.endpoint.secret
+    if secret:
+        headers['X-Signature'] = 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    try:
+        response = session.post(message.endpoint.url, data=body, headers=headers, timeout=settings.OUTBOX_TIMEOUT_SECONDS)
+    except requests.RequestException as exc:
+        return False, str(exc)[:500], None
+    if 200 <= response.status_code < 300:
+        return True, '', None
+    retry_after = response.headers.get('Retry-After', '')
+    return False, f"HTTP {response.status_code}: {response.text[:200]}", int(retry_after) if retry_after.isdigit() else None
+
+
+def _deliver_lane(lane, deadline):
+    import requests
+
+    # One connection per lane, reused for its messages; none is sent once the lease may run out mid-request
+    outcomes = []
+    with requests.Session() as session:
+        for message in lane:
+            if timezone.now() >= deadline:
+                break
+            outcomes.append((message, deliver(session, message)))
+    return outcomes
+
+
+def relay_batch(messages, workers=8):
+    """
+    Deliver claimed `messages` and store the outcomes.
+    Returns {'delivered': n, 'retry': n, 'failed': n, 'released': n}.
+    """
+    from .models import OutboxMessage
+
+    token = messages[0].claim
+    deadline = min(m.next_attempt_at for m in messages) - timedelta(seconds=settings.OUTBOX_TIMEOUT_SECONDS)
+    by_endpoint = defaultdict(list)
+    for message in messages:
+        by_endpoint[message.endpoint_id].append(message)
+    # Each endpoint gets at most max_concurrency lanes; a lane sends its messages one after another
+    lanes = []
+    for group in by_endpoint.values():
+        count = max(1, min(group[0].endpoint.max_concurrency, len(group)))
+        lanes.extend(group[i::count] for i in range(count))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(lanes)))) as pool:
+        outcomes = [outcome for lane in pool.map(_deliver_lane, lanes, [deadline] * len(lanes)) for outcome in lane]
+
+    now = timezone.now()
+    counts = {'delivered': 0, 'retry': 0, 'failed': 0, 'released': 0}
+    sent = {message.pk for message, _ in outcomes}
+    for message in messages:
+        if message.pk not in sent:
+            # Not attempted before the deadline: due again at once, without using up an attempt
+            message.claim = ''
+            message.next_attempt_at = now
+            counts['released'] += 1
+    for message, (delivered, error, retry_after) in outcomes:
+        message.attempts += 1
+        message.claim = ''
+        message.last_error = error
+        if delivered:
+            message.status = 'delivered'
+            message.delivered_at = now
+            counts['delivered'] += 1
+        elif message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            message.status = 'failed'
+            counts['failed'] += 1
+        else:
+            message.next_attempt_at = now + timedelta(seconds=max(backoff(message.attempts), retry_after or 0))
+            counts['retry'] += 1
+    # A message whose lease ran out may have been claimed by another relay since; leave its row to that one
+    OutboxMessage.objects.filter(claim=token).bulk_update(
+        messages, ['attempts', 'claim', 'last_error', 'status', 'delivered_at', 'next_attempt_at'],
+    )
+    return counts
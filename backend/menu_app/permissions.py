@@ -0,0 +1,101 @@
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework import permissions
+
+from .models import HotelUser, User
+from .authentication import revoke_user_tokens
+from .caching import cache_is_shared
+
+# Safety net for a missed invalidation; HotelUser changes delete the entry
+MEMBERSHIP_CACHE_SECONDS = 300
+
+
+def _cache_key(user_id):
+    return f'hotel_memberships:{user_id}'
+
+
+def get_hotel_ids(user, request=None):
+    """
+    Return the frozenset of hotel ids `user` belongs to.
+    Memoised on the request and, when the cache is shared by all workers,
+    cached per user across requests; HotelUser saves/deletes drop the cached
+    entry. A per-process cache could not be invalidated in the other workers,
+    so then every request reads the table. A claims-only TokenUser carries
+    the ids in its token and needs no lookup at all.
+    """
+    if not user or not user.is_authenticated:
+        return frozenset()
+    claimed = getattr(user, 'hotel_ids', None)
+    if claimed is not None:
+        return frozenset(claimed)
+    if request is not None and getattr(request, '_hotel_ids', None) is not None:
+        return request._hotel_ids
+
+    shared = cache_is_shared()
+    key = _cache_key(user.pk)
+    hotel_ids = cache.get(key) if shared else None
+    if hotel_ids is None:
+        hotel_ids = frozenset(HotelUser.objects.filter(user_id=user.pk).values_list('hotel_id', flat=True))
+        if shared:
+            cache.set(key, hotel_ids, MEMBERSHIP_CACHE_SECONDS)
+
+    if request is not None:
+        request._hotel_ids = hotel_ids
+    return hotel_ids
+
+
+def is_hotel_member(request, hotel_id):
+    return hotel_id in get_hotel_ids(request.user, request)
+
+
+@receiver(post_save, sender=HotelUser)
+@receiver(post_delete, sender=HotelUser)
+def invalidate_membership_cache(sender, instance, **kwargs):
+    cache.delete(_cache_key(instance.user_id))
+    # Access tokens embed hotel_ids; force clients to refresh and pick up the change
+    revoke_user_tokens(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def revoke_inactive_user_tokens(sender, instance, **kwargs):
+    if not instance.is_active:
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
+
+
+def _object_hotel_id(obj):
+    if hasattr(obj, 'hotel_id'):
+        return obj.hotel_id
+    if hasattr(obj, 'product'):
+        return obj.product.hotel_id
+    return None
+
+
+class IsHotelMember(permissions.BasePermission):
+    """Object-level: the user must belong to the object's hotel (objects with .hotel or .product.hotel)."""
+    message = "You are not a member of that hotel."
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated)
+
+    def has_object_permission(self, request, view, obj):
+        return is_hotel_member(request, _object_hotel_id(obj))
+
+
+class IsHotelMemberOrReadOnly(IsHotelMember):
+    """Anyone may read; writes require membership of the object's hotel."""
+
+    def has_permission(self, request, view):
+        if request.method in permissions.SAFE_METHODS:
+            return True
+        return super().has_permission(request, view)
+
+    def has_object_permission(self, request, view, obj):
+        if request.method in permissions.SAFE_METHODS:
+            return True
+        return super().has_object_permission(request, view, obj)
@@ -0,0 +1,71 @@
+"""
+Night-by-night room pricing from RatePlan rows.
+
+For a date range a product's nightly rates are laid out as a calendar list
+(one Decimal per night, index 0 = check-in night), starting from the base
+price and overwritten by matching plans in ascending priority, so the stay
+total is a plain sum. quote_products() builds the calendars for many products
+from a single RatePlan query, which keeps availability searches flat in
+query count regardless of how many rooms are quoted.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Q
+
+
+def stay_nights(check_in, check_out):
+    # Same-day stays are charged as one night, as before rate plans existed
+    return max((check_out - check_in).days, 1)
+
+
+def _plans_for_range(product_ids, check_in, last_night):
+    from .models import RatePlan
+
+    return (
+        RatePlan.objects.filter(product_id__in=product_ids, is_active=True)
+        .filter(Q(start_date__isnull=True) | Q(start_date__lte=last_night))
+        .filter(Q(end_date__isnull=True) | Q(end_date__gte=check_in))
+        .order_by('priority', 'id')
+        .values_list('product_id', 'nightly_price', 'start_date', 'end_date', 'weekdays', 'min_nights')
+    )
+
+
+def build_calendar(base_price, plans, check_in, nights):
+    """Return the nightly price list for `nights` nights from `check_in`; `plans` must be in priority order."""
+    calendar = [base_price] * nights
+    for nightly_price, start, end, weekdays, min_nights in plans:
+        if nights < min_nights:
+            continue
+        days = {int(d) for d in weekdays.split(',') if d.strip()}
+        first = 0 if start is None else max((start - check_in).days, 0)
+        last = nights - 1 if end is None else min((end - check_in).days, nights - 1)
+        for i in range(first, last + 1):
+            if not days or (check_in + timedelta(days=i)).weekday() in days:
+                calendar[i] = nightly_price
+    return calendar
+
+
+def quote_products(products, check_in, check_out):
+    """
+    Price a stay for many products at once.
+    Returns {product_id: (total, calendar)} using one RatePlan query.
+    """
+    nights = stay_nights(check_in, check_out)
+    last_night = check_in + timedelta(days=nights - 1)
+    products = list(products)
+
+    plans = defaultdict(list)
+    for product_id, *plan in _plans_for_range([p.pk for p in products], check_in, last_night):
+        plans[product_id].append(plan)
+
+    quotes = {}
+    for product in products:
+        calendar = build_calendar(product.price, plans.get(product.pk, ()), check_in, nights)
+        quotes[product.pk] = (sum(calendar), calendar)
+    return quotes
+
+
+def quote_stay(product, check_in, check_out):
+    """Total price of one stay."""
+    return quote_products([product], check_in, check_out)[product.pk][0]
@@ -0,0 +1,76 @@
+"""
+API renderers/parsers: a JSON renderer with a cheaper encoder fallback and
+an optional MessagePack format.
+
+FastJSONEncoder resolves the few non-JSON types our views return (Decimal,
+datetime, date, UUID) with one dict lookup on the exact type instead of
+DRF's isinstance chain; the output is identical. MessagePack is offered
+when the `msgpack` package is installed (see settings.MSGPACK_ENABLED) and
+is chosen with `Accept: application/msgpack` (or ?format=msgpack); request
+bodies may be sent with that Content-Type too.
+"""
+import datetime
+import decimal
+import uuid
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def _datetime(value):
+    representation = value.isoformat()
+    if representation.endswith('+00:00'):
+        representation = representation[:-6] + 'Z'
+    return representation
+
+
+# Same representations as rest_framework.utils.encoders.JSONEncoder
+ENCODERS = {
+    decimal.Decimal: float,
+    datetime.datetime: _datetime,
+    datetime.date: datetime.date.isoformat,
+    uuid.UUID: str,
+}
+
+
+class FastJSONEncoder(JSONEncoder):
+    def default(self, obj):
+        encode = ENCODERS.get(type(obj))
+        if encode is not None:
+            return encode(obj)
+        return super().default(obj)
+
+
+_encode_default = FastJSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    encoder_class = FastJSONEncoder
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        import msgpack
+
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encode_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        import msgpack
+
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
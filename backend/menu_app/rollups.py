@@ -0,0 +1,157 @@
+"""
+Daily booking rollups (BookingRollup) per hotel and product.
+
+Every booking contributes to the row of the day it was made (bookings,
+revenue, cancellations) and to one row per night of the stay (room_nights).
+Changes are applied as deltas with F() updates, so keeping the rollups
+current costs a few queries per booking change and the stats endpoint
+never touches the Booking table.
+"""
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from django.db.models import F
+from django.utils import timezone
+
+CANCELLED_STATUSES = {'cancelled'}
+ROLLUP_FIELDS = ('bookings', 'revenue', 'cancellations', 'room_nights')
+
+
+def _counts(status):
+    # Bookings in any non-cancelled status hold revenue and occupy their nights
+    return status is not None and status not in CANCELLED_STATUSES
+
+
+class BookingState(NamedTuple):
+    """The booking fields its rollup contribution depends on."""
+    product_id: int
+    hotel_id: Optional[int]
+    created_day: date
+    check_in: date
+    check_out: date
+    total_price: Decimal
+    status: str
+
+
+def booking_state(booking, with_hotel=True):
+    """
+    Snapshot `booking`'s contribution. Without `with_hotel` the hotel is only
+    filled in when the product is already loaded, so no query is made.
+    """
+    hotel_id = None
+    if with_hotel or type(booking).product.is_cached(booking):
+        hotel_id = booking.product.hotel_id
+    created_day = timezone.localdate(booking.created_at) if booking.created_at else timezone.localdate()
+    return BookingState(
+        booking.product_id, hotel_id, created_day, booking.check_in, booking.check_out,
+        booking.total_price or 0, booking.status,
+    )
+
+
+def archived_booking_state(archived):
+    """The contribution of an ArchivedBooking, which still counts towards the stats of its days."""
+    return BookingState(
+        archived.product_id, archived.hotel_id, timezone.localdate(archived.created_at), archived.check_in,
+        archived.check_out, archived.total_price or 0, archived.status,
+    )
+
+
+def _add_contribution(state, sign, deltas):
+    def key(day):
+        return (state.product_id, state.hotel_id, day)
+
+    deltas[key(state.created_day)]['bookings'] += sign
+    if state.status in CANCELLED_STATUSES:
+        deltas[key(state.created_day)]['cancellations'] += sign
+    if _counts(state.status):
+        deltas[key(state.created_day)]['revenue'] += sign * state.total_price
+        nights = max((state.check_out - state.check_in).days, 1)
+        for i in range(nights):
+            deltas[key(state.check_in + timedelta(days=i))]['room_nights'] += sign
+
+
+def booking_deltas(previous, current, deltas=None):
+    """
+    Add the rollup changes for a booking going from the BookingState `previous`
+    to `current` (None meaning "did not exist") to `deltas`:
+    {(product_id, hotel_id, day): Counter}. The old contribution is taken
+    back and the new one added, so moving the dates, product or price moves
+    the booking's counts with it.
+    """
+    if deltas is None:
+        deltas = defaultdict(Counter)
+    if previous == current:
+        return deltas
+    if previous is not None:
+        _add_contribution(previous, -1, deltas)
+    if current is not None:
+        _add_contribution(current, 1, deltas)
+    return deltas
+
+
+def apply_deltas(deltas, create_missing=True):
+    """Apply accumulated deltas with one UPDATE per product and distinct change vector."""
+    from .models import BookingRollup
+
+    deltas = {k: v for k, v in deltas.items() if any(v.values())}
+    if not deltas:
+        return
+    if create_missing:
+        # Keys without a hotel come from a previous state, whose rows already exist
+        BookingRollup.objects.bulk_create(
+            [BookingRollup(product_id=p, hotel_id=h, day=d) for p, h, d in deltas if h is not None],
+            ignore_conflicts=True,
+        )
+
+    groups = defaultdict(list)
+    for (product_id, _, day), counter in deltas.items():
+        vector = tuple((f, counter[f]) for f in ROLLUP_FIELDS if counter[f])
+        groups[(product_id, vector)].append(day)
+    for (product_id, vector), days in groups.items():
+        BookingRollup.objects.filter(product_id=product_id, day__in=days).update(
+            **{field: F(field) + amount for field, amount in vector}
+        )
+
+
+def record_booking_change(previous, booking):
+    """Apply the change from the remembered state `previous` to `booking` (None when it was deleted)."""
+    current = booking_state(booking) if booking is not None else None
+    if previous is not None and previous.hotel_id is None and current is not None and previous.product_id == current.product_id:
+        previous = previous._replace(hotel_id=current.hotel_id)
+    # Rows of a deleted booking already exist; never insert while a product may be cascading away
+    apply_deltas(booking_deltas(previous, current), create_missing=current is not None)
+
+
+def rebuild_rollups(hotel=None, batch_size=2000):
+    """
+    Recompute rollups from the Booking and ArchivedBooking tables (optionally
+    for one hotel). Returns rows written.
+    """
+    from .models import ArchivedBooking, Booking, BookingRollup
+
+    bookings = Booking.objects.select_related('product')
+    # Archived stays of deleted products lost their rollup rows with the product
+    archived = ArchivedBooking.objects.filter(product__isnull=False, hotel__isnull=False)
+    rollups = BookingRollup.objects.all()
+    if hotel is not None:
+        bookings = bookings.filter(product__hotel=hotel)
+        archived = archived.filter(hotel=hotel)
+        rollups = rollups.filter(hotel=hotel)
+
+    deltas = defaultdict(Counter)
+    for booking in bookings.iterator(chunk_size=batch_size):
+        booking_deltas(None, booking_state(booking), deltas)
+    for booking in archived.iterator(chunk_size=batch_size):
+        booking_deltas(None, archived_booking_state(booking), deltas)
+
+    rollups.delete()
+    BookingRollup.objects.bulk_create(
+        [
+            BookingRollup(product_id=p, hotel_id=h, day=d, **{f: counter[f] for f in ROLLUP_FIELDS})
+            for (p, h, d), counter in deltas.items()
+        ],
+        batch_size=batch_size,
+    )
+    return len(deltas)
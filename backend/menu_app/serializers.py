@@ -1,37 +1,85 @@
+import decimal
+
+from django.conf import settings
+from django.db import models
 from rest_framework import serializers
-from .models import Hotel, Product, Category, CanonicalProduct, Booking
+from rest_framework.settings import api_settings
+from .currency import base_currency
+from .media import image_url
+from .models import Hotel, Product, Category, CanonicalProduct, Booking, ArchivedBooking, Order, OrderItem
+
+
+class PriceField(serializers.DecimalField):
+    """
+    DecimalField whose output skips quantize() for values that already have
+    `decimal_places` digits, as prices read from the database do; the string is
+    the same, at a fraction of the cost on large menu pages.
+    """
+
+    def to_representation(self, value):
+        places = self.decimal_places
+        if (type(value) is decimal.Decimal and places and not self.localize and not self.normalize_output
+                and getattr(self, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)):
+            text = str(value)
+            if len(text) > places and text[-places - 1] == '.':
+                return text
+        return super().to_representation(value)
+
+
+def validate_stay(check_in, check_out):
+    """Reject stays that end before they start or run past MAX_QUOTE_NIGHTS (pricing builds a calendar per night)."""
+    if check_in is None or check_out is None:
+        return
+    if check_out < check_in:
+        raise serializers.ValidationError("check_out must not be before check_in.")
+    if (check_out - check_in).days > settings.MAX_QUOTE_NIGHTS:
+        raise serializers.ValidationError(f"Stays can be at most {settings.MAX_QUOTE_NIGHTS} nights.")
+
+
+class PriceModelSerializer(serializers.ModelSerializer):
+    """ModelSerializer that maps model DecimalFields to PriceField."""
+    serializer_field_mapping = {**serializers.ModelSerializer.serializer_field_mapping, models.DecimalField: PriceField}
 
 
-class HotelSerializer(serializers.ModelSerializer):
+class HotelSerializer(PriceModelSerializer):
     image = serializers.SerializerMethodField()
+    price_currency = serializers.SerializerMethodField()
 
     class Meta:
         model = Hotel
-        fields = ['id', 'name', 'slug', 'address', 'city', 'timezone', 'image']
+        fields = [
+            'id', 'name', 'slug', 'address', 'city', 'timezone', 'latitude', 'longitude', 'image',
+            'room_count', 'food_count', 'rooms_available', 'min_room_price', 'min_food_price', 'price_currency',
+        ]
+        # Catalog summary columns are maintained by summaries.py
+        read_only_fields = ['room_count', 'food_count', 'rooms_available', 'min_room_price', 'min_food_price']
 
     def get_image(self, obj):
         request = self.context.get('request')
         if obj.image and request:
-            return request.build_absolute_uri(obj.image.url)
+            return image_url(request, obj.image)
         return None
 
+    def get_price_currency(self, obj):
+        return base_currency()
 
 
-class CategorySerializer(serializers.ModelSerializer):
+
+class CategorySerializer(PriceModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug']
 
 
 
-class CanonicalProductSerializer(serializers.ModelSerializer):
+class CanonicalProductSerializer(PriceModelSerializer):
     class Meta:
         model = CanonicalProduct
         fields = ['id', 'name', 'sku', 'normalized_name']
 
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(PriceModelSerializer):
     hotel = HotelSerializer(read_only=True)
     hotel_slug = serializers.CharField(source='hotel.slug', read_only=True)
     hotel_id = serializers.PrimaryKeyRelatedField(
@@ -65,16 +113,16 @@ class ProductSerializer(serializers.ModelSerializer):
             'canonical', 'canonical_id',
             'category', 'category_id',
             'description', 'price',
-            'currency', 'product_type',
+            'currency', 'price_base', 'product_type',
             'total_rooms', 'available_rooms', 'available',
             'extra_meta', 'image'
         ]
-        read_only_fields = ['normalized_name', 'available_rooms', 'available']
+        read_only_fields = ['normalized_name', 'price_base', 'available_rooms', 'available']
 
     def get_image(self, obj):
         request = self.context.get('request')
         if obj.image and request:
-            return request.build_absolute_uri(obj.image.url)
+            return image_url(request, obj.image)
         return None
 
     def get_canonical(self, obj):
@@ -91,7 +139,19 @@ class ProductSerializer(serializers.ModelSerializer):
 
 
 
-class BookingSerializer(serializers.ModelSerializer):
+class MenuItemSerializer(ProductSerializer):
+    """Product row inside a grouped hotel menu; hotel and category are carried by the group."""
+
+    class Meta(ProductSerializer.Meta):
+        fields = [
+            'id', 'name', 'sku', 'normalized_name', 'canonical',
+            'description', 'price', 'currency', 'price_base', 'product_type',
+            'available', 'extra_meta', 'image'
+        ]
+
+
+
+class BookingSerializer(PriceModelSerializer):
     product_details = ProductSerializer(source='product', read_only=True)
 
     class Meta:
@@ -102,17 +162,121 @@ class BookingSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['total_price', 'status', 'created_at']
 
+    def validate(self, attrs):
+        validate_stay(
+            attrs.get('check_in', getattr(self.instance, 'check_in', None)),
+            attrs.get('check_out', getattr(self.instance, 'check_out', None)),
+        )
+        return attrs
+
     def create(self, validated_data):
         product = validated_data['product']
 
       
+        # The room itself is decremented by the Booking post_save signal
         if getattr(product, 'product_type', 'room') == 'room':
             if product.available_rooms <= 0:
                 raise serializers.ValidationError("No rooms available for this type.")
-            
-            product.available_rooms -= 1
-            if product.available_rooms == 0:
-                product.available = False
-            product.save()
 
         return super().create(validated_data)
+
+
+
+class ArchivedBookingSerializer(PriceModelSerializer):
+    """Read-only archived stay; product and hotel may be gone, product_name keeps the label."""
+
+    class Meta:
+        model = ArchivedBooking
+        fields = [
+            'id', 'product', 'hotel', 'product_name', 'user', 'guest_name',
+            'check_in', 'check_out', 'pax', 'total_price', 'status', 'created_at', 'archived_at'
+        ]
+        read_only_fields = fields
+
+
+
+class BookingSummarySerializer(PriceModelSerializer):
+    """Flat booking row without nested product details, for bulk responses."""
+
+    class Meta:
+        model = Booking
+        fields = ['id', 'product', 'guest_name', 'check_in', 'check_out', 'pax', 'total_price', 'status']
+
+
+
+class BulkBookingItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    guest_name = serializers.CharField(max_length=200, required=False, allow_blank=True, default='')
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    pax = serializers.IntegerField(min_value=1, default=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=100, default=1)
+
+    def validate(self, attrs):
+        validate_stay(attrs['check_in'], attrs['check_out'])
+        return attrs
+
+
+
+class BulkBookingSerializer(serializers.Serializer):
+    items = BulkBookingItemSerializer(many=True, allow_empty=False, max_length=500)
+
+
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    """Change set for ProductViewSet.bulk_update; only the keys sent are applied."""
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=10000)
+    price_percent = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=-100, max_value=1000, required=False)
+    price_delta = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    available = serializers.BooleanField(required=False)
+    is_archived = serializers.BooleanField(required=False)
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), allow_null=True, required=False)
+
+    def validate(self, attrs):
+        price_changes = [key for key in ('price_percent', 'price_delta', 'price') if key in attrs]
+        if len(price_changes) > 1:
+            raise serializers.ValidationError("Send only one of price_percent, price_delta or price.")
+        if set(attrs) == {'ids'}:
+            raise serializers.ValidationError("Nothing to update.")
+        return attrs
+
+
+
+class OrderItemSerializer(PriceModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'product', 'product_name', 'quantity', 'unit_price', 'currency', 'note']
+
+
+
+class OrderSerializer(PriceModelSerializer):
+    """Order with its items; also the ticket format of the kitchen feed."""
+    items = OrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'hotel', 'table', 'guest_name', 'note', 'status', 'total_price', 'created_at', 'items']
+
+
+
+class OrderItemInputSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=100, default=1)
+    # The price the guest was shown; the order is rejected if the menu price has changed since
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    note = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+
+
+
+class OrderCreateSerializer(serializers.Serializer):
+    hotel = serializers.SlugField()
+    table = serializers.CharField(max_length=32, required=False, allow_blank=True, default='')
+    guest_name = serializers.CharField(max_length=200, required=False, allow_blank=True, default='')
+    note = serializers.CharField(max_length=500, required=False, allow_blank=True, default='')
+    items = OrderItemInputSerializer(many=True, allow_empty=False, max_length=100)
+
+
+
+class OrderStatusSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
@@ -0,0 +1,469 @@
+"""
+Read-only catalog snapshot shared by every worker through a memory-mapped file.
+
+The live (non-archived) products, with the hotel, category and canonical
+rows they reference, are written to settings.CATALOG_SNAPSHOT_DIR as one
+file of fixed-width columns (array typecodes) and a UTF-8 string blob.
+Each worker maps the file read-only and reads columns through memoryview
+casts, so the operating system keeps one copy in the page cache however
+many workers there are; a worker only holds a few small objects per
+snapshot (the header and a slug -> hotel index dict).
+
+Products are stored ordered by (hotel, product_type, id), so one hotel's
+rooms or food items are a contiguous range, plus two permutations sorted by
+normalized_name and lower-cased sku for the compare lookups.
+
+Freshness: catalog writes (model signals and the raw queryset writes in
+models.py) call catalog_changed(), which writes a new token to the
+generation file immediately and again after commit. A snapshot records the
+token it was built from; a worker whose mapped snapshot carries another
+token treats it as stale and the request falls back to the database while
+a background thread rebuilds it; no request waits on a rebuild. At most one
+worker rebuilds it, and not more often than CATALOG_SNAPSHOT_REBUILD_SECONDS,
+so a burst of writes costs one rebuild instead of one per write. `manage.py build_catalog_snapshot` builds it
+explicitly (e.g. after deploys).
+"""
+import array
+import bisect
+import itertools
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+
+SNAPSHOT_NAME = 'catalog.snapshot'
+GENERATION_NAME = 'catalog.generation'
+LOCK_NAME = 'catalog.lock'
+MAGIC = b'CATSNAP1'
+HEADER = struct.Struct('<8sI')
+NULL = -2 ** 63
+
+_tokens = itertools.count()
+_lock = threading.Lock()
+_state = {'snapshot': None, 'file': None, 'rebuild': None}
+
+
+def snapshot_dir():
+    return settings.CATALOG_SNAPSHOT_DIR
+
+
+# GENERATION: a token rewritten on every catalog change
+def _write_atomic(path, data):
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _bump(directory):
+    os.makedirs(directory, exist_ok=True)
+    token = f'{time.time_ns()}-{os.getpid()}-{next(_tokens)}'
+    _write_atomic(os.path.join(directory, GENERATION_NAME), token.encode())
+    return token
+
+
+def current_generation(directory):
+    try:
+        with open(os.path.join(directory, GENERATION_NAME), 'rb') as f:
+            return f.read().decode()
+    except FileNotFoundError:
+        return None
+
+
+def catalog_changed():
+    """Mark the snapshot stale now and again after commit (a rebuild in between must not pass as current)."""
+    directory = snapshot_dir()
+    if not directory:
+        return
+    _bump(directory)
+    transaction.on_commit(lambda: _bump(directory))
+
+
+# BUILD
+def _cents(value):
+    return NULL if value is None else int(value.scaleb(2))
+
+
+def _optional(value):
+    return -1 if value is None else value
+
+
+class _Writer:
+    def __init__(self):
+        self.sections = {}
+        self.blob = bytearray()
+
+    def column(self, name, typecode, values):
+        self.sections[name] = array.array(typecode, values)
+
+    def strings(self, name, values):
+        offsets = array.array('Q', [len(self.blob)])
+        for value in values:
+            self.blob += value.encode()
+            offsets.append(len(self.blob))
+        self.sections[name] = offsets
+
+    def write(self, path, meta):
+        layout, position = {}, 0
+        for name, values in self.sections.items():
+            layout[name] = [position, values.typecode, len(values)]
+            position += len(values) * values.itemsize
+            position += -position % 8
+        layout['blob'] = [position, 'B', len(self.blob)]
+        header = json.dumps(dict(meta, sections=layout)).encode()
+        base = HEADER.size + len(header)
+        base += -base % 8
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, len(header)) + header)
+                f.write(b'\0' * (base - HEADER.size - len(header)))
+                for name, values in self.sections.items():
+                    data = values.tobytes()
+                    f.write(data + b'\0' * (-len(data) % 8))
+                f.write(self.blob)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+
+def build_snapshot(directory=None):
+    """Write a snapshot of the current catalog. Returns the number of products in it."""
+    from .models import CanonicalProduct, Category, Hotel, Product
+    from .serializers import CanonicalProductSerializer, CategorySerializer, HotelSerializer
+
+    directory = directory or snapshot_dir()
+    os.makedirs(directory, exist_ok=True)
+    # Read before the catalog: a change committed meanwhile leaves this snapshot stale, never wrong
+    token = current_generation(directory) or _bump(directory)
+
+    hotels = list(Hotel.objects.order_by('id'))
+    hotel_index = {hotel.pk: i for i, hotel in enumerate(hotels)}
+    categories = list(Category.objects.order_by('id'))
+    category_index = {c.pk: i for i, c in enumerate(categories)}
+    canonicals = list(CanonicalProduct.objects.order_by('id'))
+    canonical_index = {c.pk: i for i, c in enumerate(canonicals)}
+    rows = list(
+        Product.objects.filter(is_archived=False).order_by('hotel_id', 'product_type', 'id').values_list(
+            'id', 'hotel_id', 'product_type', 'category_id', 'canonical_id', 'price', 'price_base',
+            'total_rooms', 'available_rooms', 'available',
+            'name', 'sku', 'normalized_name', 'description', 'currency', 'extra_meta', 'image',
+        )
+    )
+
+    types = sorted({r[2] for r in rows})
+    type_index = {t: i for i, t in enumerate(types)}
+
+    writer = _Writer()
+    writer.column('id', 'q', (r[0] for r in rows))
+    writer.column('type', 'B', (type_index[r[2]] for r in rows))
+    writer.column('hotel', 'i', (hotel_index[r[1]] for r in rows))
+    writer.column('category', 'i', (category_index.get(r[3], -1) for r in rows))
+    writer.column('canonical', 'i', (canonical_index.get(r[4], -1) for r in rows))
+    writer.column('price', 'q', (_cents(r[5]) for r in rows))
+    writer.column('price_base', 'q', (_cents(r[6]) for r in rows))
+    writer.column('total_rooms', 'q', (_optional(r[7]) for r in rows))
+    writer.column('available_rooms', 'q', (_optional(r[8]) for r in rows))
+    writer.column('available', 'B', (int(r[9]) for r in rows))
+    for position, field in enumerate(('name', 'sku', 'normalized_name', 'description', 'currency'), start=10):
+        writer.strings(field, (r[position] or '' for r in rows))
+    writer.strings('extra_meta', (json.dumps(r[15]) for r in rows))
+    writer.strings('image', (r[16] or '' for r in rows))
+    writer.strings('sku_key', (r[11].lower() for r in rows))
+    writer.column('by_name', 'I', sorted(range(len(rows)), key=lambda i: rows[i][12]))
+    writer.column('by_sku', 'I', sorted(range(len(rows)), key=lambda i: rows[i][11].lower()))
+
+    # Hotels, categories and canonicals are stored as their serialized form; hotel images
+    # are stored by name because their URL depends on the request
+    writer.strings('hotel_json', (json.dumps(dict(HotelSerializer(h).data)) for h in hotels))
+    writer.strings('hotel_image', (h.image.name or '' for h in hotels))
+    writer.strings('category_json', (json.dumps(dict(CategorySerializer(c).data)) for c in categories))
+    writer.strings('canonical_json', (json.dumps(dict(CanonicalProductSerializer(c).data)) for c in canonicals))
+
+    ranges = {}
+    for position, row in enumerate(rows):
+        key = f'{hotel_index[row[1]]}:{row[2]}'
+        ranges.setdefault(key, [position, position])[1] = position + 1
+    writer.write(os.path.join(directory, SNAPSHOT_NAME), {
+        'token': token,
+        'built_at': time.time(),
+        'count': len(rows),
+        'ranges': ranges,
+        'types': types,
+        'hotel_slugs': {h.slug.lower(): i for i, h in enumerate(hotels)},
+    })
+    return len(rows)
+
+
+# READ
+class _SortedKeys:
+    """Sequence view of a string column in permutation order, for bisect."""
+    __slots__ = ('_snapshot', '_order', '_field')
+
+    def __init__(self, snapshot, order, field):
+        self._snapshot, self._order, self._field = snapshot, order, field
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, position):
+        return self._snapshot.string(self._field, self._order[position])
+
+
+class CatalogSnapshot:
+    __slots__ = ('token', 'built_at', 'count', 'ranges', 'types', 'hotel_slugs', 'columns', '_mmap', '_blob', '_cache')
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_size = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        meta = json.loads(self._mmap[HEADER.size:HEADER.size + header_size])
+        base = HEADER.size + header_size
+        base += -base % 8
+        view = memoryview(self._mmap)
+        self.columns = {}
+        for name, (offset, typecode, length) in meta['sections'].items():
+            start = base + offset
+            size = length * array.array(typecode).itemsize
+            self.columns[name] = view[start:start + size].cast(typecode)
+        self._blob = self.columns.pop('blob')
+        self.token = meta['token']
+        self.built_at = meta['built_at']
+        self.count = meta['count']
+        self.ranges = meta['ranges']
+        self.types = meta['types']
+        self.hotel_slugs = meta['hotel_slugs']
+        # Parsed hotel/category/canonical dicts, filled on first use (bounded by those small tables)
+        self._cache = {}
+
+    def string(self, field, i):
+        offsets = self.columns[field]
+        return bytes(self._blob[offsets[i]:offsets[i + 1]]).decode()
+
+    def product(self, i):
+        return SnapshotProduct(self, i)
+
+    def _related(self, field, i):
+        if i < 0:
+            return None
+        key = (field, i)
+        value = self._cache.get(key)
+        if value is None:
+            value = self._cache[key] = json.loads(self.string(field, i))
+        return value
+
+    def hotel_index(self, slug):
+        return self.hotel_slugs.get(slug.lower())
+
+    def hotel_products(self, hotel, product_type):
+        start, end = self.ranges.get(f'{hotel}:{product_type}', (0, 0))
+        return range(start, end)
+
+    def lookup(self, field, value):
+        """Product indexes whose normalized_name ('name') or lower-cased sku ('sku') equals `value`."""
+        order = self.columns['by_name' if field == 'name' else 'by_sku']
+        keys = _SortedKeys(self, order, 'normalized_name' if field == 'name' else 'sku_key')
+        start = bisect.bisect_left(keys, value)
+        end = bisect.bisect_right(keys, value, lo=start)
+        return sorted(order[start:end])
+
+
+class SnapshotProduct:
+    """One product row read straight from the mapped columns."""
+    __slots__ = ('_snapshot', '_i')
+
+    def __init__(self, snapshot, i):
+        self._snapshot, self._i = snapshot, i
+
+    def _column(self, name):
+        return self._snapshot.columns[name][self._i]
+
+    def _decimal(self, name):
+        cents = self._column(name)
+        return None if cents == NULL else Decimal(cents).scaleb(-2)
+
+    def _optional(self, name):
+        value = self._column(name)
+        return None if value == -1 else value
+
+    @property
+    def id(self):
+        return self._column('id')
+
+    @property
+    def price(self):
+        return self._decimal('price')
+
+    @property
+    def price_base(self):
+        return self._decimal('price_base')
+
+    @property
+    def name(self):
+        return self._snapshot.string('name', self._i)
+
+    def hotel(self):
+        snapshot = self._snapshot
+        i = self._column('hotel')
+        return snapshot._related('hotel_json', i), snapshot.string('hotel_image', i)
+
+    def represent(self, request=None):
+        """The ProductSerializer representation of the product."""
+        from .models import Hotel, Product
+
+        snapshot, i = self._snapshot, self._i
+        hotel, hotel_image = self.hotel()
+        hotel = dict(hotel, image=_image_url(request, Hotel, hotel_image))
+        price_base = self.price_base
+        return {
+            'id': self.id,
+            'hotel': hotel,
+            'hotel_slug': hotel['slug'],
+            'name': self.name,
+            'sku': snapshot.string('sku', i),
+            'normalized_name': snapshot.string('normalized_name', i),
+            'canonical': snapshot._related('canonical_json', self._column('canonical')),
+            'category': snapshot._related('category_json', self._column('category')),
+            'description': snapshot.string('description', i),
+            'price': str(self.price),
+            'currency': snapshot.string('currency', i),
+            'price_base': None if price_base is None else str(price_base),
+            'product_type': snapshot.types[self._column('type')],
+            'total_rooms': self._optional('total_rooms'),
+            'available_rooms': self._optional('available_rooms'),
+            'available': bool(self._column('available')),
+            'extra_meta': json.loads(snapshot.string('extra_meta', i)),
+            'image': _image_url(request, Product, snapshot.string('image', i)),
+        }
+
+
+def _image_url(request, model, name):
+    if not name:
+        return None
+    url = model._meta.get_field('image').storage.url(name)
+    return request.build_absolute_uri(url) if request else url
+
+
+def _try_rebuild(directory, previous):
+    """Rebuild unless another worker holds the lock or the last build is too recent. True when rebuilt."""
+    if previous is not None and time.time() - previous.built_at < settings.CATALOG_SNAPSHOT_REBUILD_SECONDS:
+        return False
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    with open(os.path.join(directory, LOCK_NAME), 'a') as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+        build_snapshot(directory)
+    return True
+
+
+def _rebuild(directory, previous):
+    try:
+        _try_rebuild(directory, previous)
+    finally:
+        connection.close()  # the thread's own connection
+
+
+def _start_rebuild(directory, previous):
+    """Rebuild in a background thread unless this worker already is. Call with _lock held."""
+    thread = _state['rebuild']
+    if thread is not None and thread.is_alive():
+        return
+    thread = threading.Thread(target=_rebuild, args=(directory, previous), name='catalog-snapshot', daemon=True)
+    _state['rebuild'] = thread
+    thread.start()
+
+
+def _load(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _state['file'] != key:
+        _state['snapshot'], _state['file'] = CatalogSnapshot(path), key
+    return _state['snapshot']
+
+
+def get_snapshot():
+    """The current snapshot for this worker, or None when disabled or stale (use the database then)."""
+    directory = snapshot_dir()
+    if not directory:
+        return None
+    token = current_generation(directory)
+    snapshot = _state['snapshot']
+    if snapshot is not None and snapshot.token == token:
+        return snapshot
+
+    path = os.path.join(directory, SNAPSHOT_NAME)
+    with _lock:
+        snapshot = _load(path)
+        if snapshot is not None and snapshot.token == token and token is not None:
+            return snapshot
+        # The lock only covers mapping the file; this request uses the database meanwhile
+        _start_rebuild(directory, snapshot)
+    return None
+
+
+# QUERIES (the same filters and orderings ProductViewSet applies in the database)
+def in_price_range(snapshot, indexes, low=None, high=None):
+    """Keep products whose price_base lies within [low, high]; unpriced ones fail any bound, as NULL does in SQL."""
+    if low is None and high is None:
+        return list(indexes)
+    price_base = snapshot.columns['price_base']
+    low = None if low is None else low.scaleb(2)
+    high = None if high is None else high.scaleb(2)
+    return [
+        i for i in indexes
+        if price_base[i] != NULL and (low is None or price_base[i] >= low) and (high is None or price_base[i] <= high)
+    ]
+
+
+def order_products(snapshot, indexes, fields, nulls_largest=None):
+    """
+    Sort by ('price' | 'price_base' | 'name', optionally '-' prefixed) fields,
+    then id. Unpriced products sort as the database would put NULLs unless
+    `nulls_largest` says otherwise.
+    """
+    if nulls_largest is None:
+        nulls_largest = connection.features.nulls_order_largest
+    indexes = sorted(indexes, key=snapshot.columns['id'].__getitem__)
+    for field in reversed(fields):
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        if name == 'name':
+            indexes.sort(key=lambda i: snapshot.string('name', i), reverse=descending)
+            continue
+        column = snapshot.columns[name]
+        present = [i for i in indexes if column[i] != NULL]
+        present.sort(key=column.__getitem__, reverse=descending)
+        nulls = [i for i in indexes if column[i] == NULL]
+        indexes = present + nulls if nulls_largest != descending else nulls + present
+    return indexes
@@ -0,0 +1,113 @@
+"""
+Content-addressed storage for hotel and product images.
+
+Files are stored as <upload_to>/<aa>/<sha256 of the uploaded bytes><ext>,
+so the same photo uploaded for a hundred products is written (and resized)
+once and every row points at the same file. delete() is reference counted:
+a file is only removed once no Hotel or Product row uses it any more.
+`manage.py dedupe_media` moves files saved before this storage onto the
+same layout.
+"""
+import hashlib
+import io
+import os
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+PRODUCT_IMAGE_MAX_SIZE = (1200, 1200)
+
+
+def content_hash(content):
+    """sha256 hex digest of a File, read in chunks; the file is rewound afterwards."""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def is_hashed_name(name):
+    directory, filename = posixpath.split(name or '')
+    stem = os.path.splitext(filename)[0]
+    return len(stem) == 64 and posixpath.basename(directory) == stem[:2]
+
+
+def hashed_name(name, digest):
+    """<upload dir>/<aa>/<digest><ext> for `name`, which may be an upload name or already hashed."""
+    directory, filename = posixpath.split(name)
+    if is_hashed_name(name):
+        directory = posixpath.dirname(directory)
+    ext = os.path.splitext(filename)[1].lower()
+    return posixpath.join(directory, digest[:2], f'{digest}{ext}')
+
+
+def media_references(name):
+    """Number of Hotel and Product rows whose image is `name`."""
+    from .models import Hotel, Product
+
+    return Hotel.objects.filter(image=name).count() + Product.objects.filter(image=name).count()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage keyed by content hash. Saving bytes that are already
+    stored returns the existing name without writing; `max_size` resizes
+    images once, when their first copy is written.
+    """
+
+    def __init__(self, max_size=None, **kwargs):
+        super().__init__(**kwargs)
+        self.max_size = max_size
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = ContentFile(content, name)
+        name = hashed_name(self.generate_filename(name), content_hash(content))
+        if self.exists(name):
+            return name
+
+        saved = self._save(name, self.process(name, content))
+        if saved != name:
+            # Another writer stored the same bytes first; keep theirs
+            super().delete(saved)
+        return name
+
+    def process(self, name, content):
+        """Shrink images to max_size before their first write (Pillow is loaded on first use)."""
+        if not self.max_size:
+            return content
+        from PIL import Image
+
+        img = Image.open(content)
+        img_format = img.format
+        img.thumbnail(self.max_size, Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, format=img_format, optimize=True, quality=85)
+        return ContentFile(buffer.getvalue(), name)
+
+    def delete(self, name):
+        # Shared by other rows: keep the bytes
+        if name and media_references(name) == 0:
+            super().delete(name)
+
+
+hotel_storage = ContentAddressedStorage()
+product_storage = ContentAddressedStorage(max_size=PRODUCT_IMAGE_MAX_SIZE)
+
+
+# Callables keep the storage instances out of migrations
+def hotel_image_storage():
+    return hotel_storage
+
+
+def product_image_storage():
+    return product_storage
@@ -0,0 +1,86 @@
+"""
+Denormalized catalog summaries on Hotel (room/food counts, available rooms,
+lowest price per product type) for the hotel listing.
+
+Product writes mark their hotel dirty; after the transaction commits each
+dirty hotel is recomputed once with a single grouped aggregate over its own
+products (hotel_id is indexed) and the Hotel rows are written with one
+bulk_update. Listing hotels then reads plain columns instead of
+aggregating the products table per request.
+"""
+import threading
+
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+
+from .snapshot import catalog_changed
+
+SUMMARY_FIELDS = ('room_count', 'food_count', 'rooms_available', 'min_room_price', 'min_food_price')
+
+_pending = threading.local()
+
+
+def _empty_summary():
+    return {'room_count': 0, 'food_count': 0, 'rooms_available': 0, 'min_room_price': None, 'min_food_price': None}
+
+
+def compute_summaries(hotel_ids=None):
+    """{hotel_id: summary dict} for the given hotels (all hotels with products when None)."""
+    from .models import Product
+
+    products = Product.objects.filter(is_archived=False)
+    if hotel_ids is not None:
+        products = products.filter(hotel_id__in=hotel_ids)
+    rows = (
+        products.order_by().values('hotel_id', 'product_type')
+        .annotate(
+            count=Count('id'),
+            min_price=Min('price_base'),
+            rooms=Sum('available_rooms', filter=Q(available=True)),
+        )
+    )
+
+    summaries = {}
+    for row in rows:
+        summary = summaries.setdefault(row['hotel_id'], _empty_summary())
+        if row['product_type'] == 'room':
+            summary.update(room_count=row['count'], min_room_price=row['min_price'], rooms_available=row['rooms'] or 0)
+        elif row['product_type'] == 'food':
+            summary.update(food_count=row['count'], min_food_price=row['min_price'])
+    return summaries
+
+
+def refresh_hotel_summaries(hotel_ids=None):
+    """Recompute and store the summaries of `hotel_ids` (every hotel when None). Returns hotels written."""
+    from .models import Hotel
+
+    summaries = compute_summaries(hotel_ids)
+    hotels = Hotel.objects.all() if hotel_ids is None else Hotel.objects.filter(pk__in=hotel_ids)
+    updated = []
+    for hotel in hotels.only('pk', *SUMMARY_FIELDS):
+        summary = summaries.get(hotel.pk, _empty_summary())
+        if any(getattr(hotel, field) != value for field, value in summary.items()):
+            for field, value in summary.items():
+                setattr(hotel, field, value)
+            updated.append(hotel)
+    # bulk_update skips Hotel.save() and its change-log signal: summaries are derived data
+    Hotel.objects.bulk_update(updated, SUMMARY_FIELDS, batch_size=500)
+    if updated:
+        # ...but the catalog snapshot serializes them
+        catalog_changed()
+    return len(updated)
+
+
+def _flush():
+    hotel_ids = getattr(_pending, 'hotel_ids', None)
+    if hotel_ids:
+        _pending.hotel_ids = set()
+        refresh_hotel_summaries(hotel_ids)
+
+
+def schedule_refresh(*hotel_ids):
+    """Mark hotels dirty; they are recomputed once when the current transaction commits."""
+    if not hasattr(_pending, 'hotel_ids'):
+        _pending.hotel_ids = set()
+    _pending.hotel_ids.update(h for h in hotel_ids if h is not None)
+    transaction.on_commit(_flush)
@@ -2,8 +2,61 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from .models import Hotel, Category, Product, Booking
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.views import APIView
+from django.conf import settings
+from django.test import override_settings, SimpleTestCase
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+from django.test.utils import CaptureQueriesContext
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from rest_framework_simplejwt.tokens import AccessToken
+from .models import (
+    Hotel, Category, Product, Booking, HotelUser, ExchangeRate, RatePlan, BookingRollup, ArchivedBooking, CatalogChange,
+    Order, CanonicalProduct, IdempotencyKey, WebhookEndpoint, OutboxMessage,
+)
+from .pricing import quote_stay
+from .currency import recompute_base_prices, clear_rate_cache, to_base
+from .events import broker
+from .permissions import get_hotel_ids
+from .authentication import revoke_user_tokens, ClaimsJWTAuthentication
+from .throttling import StkPushThrottle, singleflight
+from .text import normalize_name
+from .bulk import bulk_update_products
+from .bookings import AllocationError, allocate_bulk
+from . import checks, geo, outbox, snapshot, summaries
+from .compression import choose_encoding
+from .renderers import FastJSONEncoder
+from .serializers import PriceField
+from .management.commands.profile_startup import measure_boot
 from decimal import Decimal
+from datetime import date, timedelta
+from django.utils import timezone
+import asyncio
+import gzip
+import hashlib
+import hmac
+import importlib
+import io
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from unittest import mock, skipUnless
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.db import DatabaseError
+from django.apps import apps as django_apps
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+from django.core.exceptions import ValidationError
 
 User = get_user_model()
 
@@ -135,3 +188,1772 @@ class BookingTests(APITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data['guest_name'], 'Test Guest')
+
+
+class HotelMenuTests(APITestCase):
+    def setUp(self):
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel', city='Test City')
+        self.drinks = Category.objects.create(name='Drinks', slug='drinks')
+        self.mains = Category.objects.create(name='Mains', slug='mains')
+        for name, price, cat in [
+            ('Tea', '50.00', self.drinks),
+            ('Coffee', '120.00', self.drinks),
+            ('Pizza', '900.00', self.mains),
+            ('Bread', '30.00', None),
+        ]:
+            Product.objects.create(
+                hotel=self.hotel, name=name, price=Decimal(price),
+                product_type='food', category=cat
+            )
+        Product.objects.create(hotel=self.hotel, name='Suite', price=Decimal('5000.00'), product_type='room')
+
+    def test_menu_grouped_by_category(self):
+        url = reverse('hotel-menu', args=[self.hotel.slug])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 4)
+
+        groups = response.data['categories']
+        self.assertEqual([g['slug'] for g in groups], ['drinks', 'mains', None])
+        drinks = groups[0]
+        self.assertEqual(drinks['count'], 2)
+        self.assertEqual(drinks['min_price'], Decimal('50.00'))
+        self.assertEqual(drinks['max_price'], Decimal('120.00'))
+        self.assertEqual([p['name'] for p in drinks['products']], ['Coffee', 'Tea'])
+
+    def test_menu_unknown_hotel(self):
+        response = self.client.get(reverse('hotel-menu', args=['missing']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='manager', password='password')
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel', city='Test City')
+        self.other = Hotel.objects.create(name='Other Hotel', slug='other-hotel')
+        HotelUser.objects.create(user=self.user, hotel=self.hotel, is_manager=True)
+        self.room = Product.objects.create(
+            hotel=self.hotel, name='Deluxe Room', price=Decimal('150.00'),
+            product_type='room', total_rooms=5, available_rooms=5
+        )
+        Product.objects.create(hotel=self.other, name='Hidden Room', price=Decimal('99.00'))
+        Booking.objects.create(product=self.room, guest_name='Alice', check_in=date(2024, 1, 10), check_out=date(2024, 1, 12))
+        Booking.objects.create(
+            product=self.room, guest_name='Bob', check_in=date(2024, 3, 1), check_out=date(2024, 3, 2), status='cancelled'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def _content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_product_export_csv_limited_to_member_hotels(self):
+        response = self.client.get(reverse('product-export'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = self._content(response).strip().splitlines()
+        self.assertTrue(lines[0].startswith('id,hotel_slug,product_type,name'))
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Deluxe Room', lines[1])
+
+    def test_booking_export_ndjson_filters(self):
+        response = self.client.get(
+            reverse('booking-export'),
+            {'export_format': 'ndjson', 'status': 'pending', 'from': '2024-01-01', 'to': '2024-02-01'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual([r['guest_name'] for r in rows], ['Alice'])
+        self.assertEqual(rows[0]['hotel_slug'], 'test-hotel')
+
+    def test_export_rejects_bad_date(self):
+        response = self.client.get(reverse('booking-export'), {'from': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CatalogSyncTests(APITestCase):
+    def setUp(self):
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel', city='Test City')
+        self.tea = Product.objects.create(hotel=self.hotel, name='Tea', price=Decimal('50.00'), product_type='food')
+        self.cake = Product.objects.create(hotel=self.hotel, name='Cake', price=Decimal('80.00'), product_type='food')
+        self.url = reverse('catalog-sync')
+
+    def test_initial_sync_returns_everything(self):
+        response = self.client.get(self.url, {'since': 0})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([h['slug'] for h in response.data['hotels']], ['test-hotel'])
+        self.assertEqual({p['name'] for p in response.data['products']}, {'Tea', 'Cake'})
+        self.assertFalse(response.data['has_more'])
+
+    def test_delta_contains_only_changes_and_tombstones(self):
+        cursor = self.client.get(self.url, {'since': 0}).data['cursor']
+
+        self.tea.price = Decimal('60.00')
+        self.tea.save()
+        self.cake.is_archived = True
+        self.cake.save()
+        gone_id = Product.objects.create(hotel=self.hotel, name='Soup', price=Decimal('10.00')).pk
+        Product.objects.filter(pk=gone_id).delete()
+
+        response = self.client.get(self.url, {'since': cursor})
+        self.assertEqual([p['name'] for p in response.data['products']], ['Tea'])
+        self.assertEqual(response.data['hotels'], [])
+        self.assertCountEqual(response.data['tombstones'], [
+            {'type': 'product', 'id': self.cake.pk, 'reason': 'archive'},
+            {'type': 'product', 'id': gone_id, 'reason': 'delete'},
+        ])
+
+        again = self.client.get(self.url, {'since': response.data['cursor']})
+        self.assertEqual(again.data['products'], [])
+        self.assertEqual(again.data['tombstones'], [])
+
+    def test_moved_product_leaves_a_tombstone_in_the_old_hotel(self):
+        other = Hotel.objects.create(name='Other Hotel', slug='other-hotel')
+        old_cursor = self.client.get(self.url, {'since': 0, 'hotel': 'test-hotel'}).data['cursor']
+        new_cursor = self.client.get(self.url, {'since': 0, 'hotel': 'other-hotel'}).data['cursor']
+
+        self.tea.hotel = other
+        self.tea.save()
+
+        response = self.client.get(self.url, {'since': old_cursor, 'hotel': 'test-hotel'})
+        self.assertEqual(response.data['products'], [])
+        self.assertEqual(response.data['tombstones'], [{'type': 'product', 'id': self.tea.pk, 'reason': 'delete'}])
+        response = self.client.get(self.url, {'since': new_cursor, 'hotel': 'other-hotel'})
+        self.assertEqual([p['name'] for p in response.data['products']], ['Tea'])
+        self.assertEqual(response.data['tombstones'], [])
+
+    def test_limit_pages_through_changes(self):
+        response = self.client.get(self.url, {'since': 0, 'limit': 1})
+        self.assertTrue(response.data['has_more'])
+        self.assertEqual(len(response.data['hotels']), 1)
+
+
+class HotelEventsTests(APITestCase):
+    def setUp(self):
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel', city='Test City')
+        self.room = Product.objects.create(
+            hotel=self.hotel, name='Test Room', price=Decimal('150.00'),
+            product_type='room', total_rooms=2, available_rooms=2
+        )
+
+    def test_snapshot_stream(self):
+        response = self.client.get(reverse('hotel-events', args=[self.hotel.slug]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('event: snapshot', body)
+        self.assertIn('"available_rooms": 2', body)
+
+    def test_room_change_published_after_commit(self):
+        with mock.patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.room.decrease_rooms()
+        hotel_id, event = publish.call_args.args
+        self.assertEqual(hotel_id, self.hotel.pk)
+        self.assertEqual(event['available_rooms'], 1)
+
+    def test_moved_product_leaves_the_old_hotel_channel(self):
+        other = Hotel.objects.create(name='Other Hotel', slug='other-hotel')
+        with mock.patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.room.hotel = other
+                self.room.save()
+        calls = [call.args for call in publish.call_args_list]
+        self.assertEqual(calls[0], (self.hotel.pk, {'id': self.room.pk, 'deleted': True}))
+        self.assertEqual(calls[1][0], other.pk)
+
+    def test_broker_delivers_across_threads(self):
+        async def listen():
+            queue = broker.subscribe(self.hotel.pk)
+            try:
+                await asyncio.to_thread(broker.publish, self.hotel.pk, {'id': 1})
+                return await asyncio.wait_for(queue.get(), timeout=2)
+            finally:
+                broker.unsubscribe(self.hotel.pk, queue)
+
+        self.assertEqual(asyncio.run(listen()), {'id': 1})
+        self.assertEqual(broker.subscriber_count(self.hotel.pk), 0)
+
+
+class CurrencyNormalizationTests(APITestCase):
+    def setUp(self):
+        clear_rate_cache()
+        self.kes_hotel = Hotel.objects.create(name='Nairobi Inn', slug='nairobi-inn')
+        self.usd_hotel = Hotel.objects.create(name='Safari Lodge', slug='safari-lodge')
+        self.kes = Product.objects.create(
+            hotel=self.kes_hotel, name='Latte', price=Decimal('300.00'), currency='KES', product_type='food'
+        )
+        self.usd = Product.objects.create(
+            hotel=self.usd_hotel, name='Latte', price=Decimal('2.00'), currency='USD', product_type='food'
+        )
+
+    def test_unknown_currency_has_no_base_price(self):
+        self.assertEqual(self.kes.price_base, Decimal('300.00'))
+        self.assertIsNone(self.usd.price_base)
+
+    def test_load_rates_recomputes_and_compare_uses_base_price(self):
+        call_command('load_fx_rates', 'USD=130', stdout=io.StringIO())
+        self.usd.refresh_from_db()
+        self.assertEqual(self.usd.price_base, Decimal('260.00'))
+
+        response = self.client.get(reverse('product-compare'), {'name': 'Latte'})
+        self.assertEqual([p['currency'] for p in response.data], ['USD', 'KES'])
+
+        response = self.client.get(reverse('product-compare'), {'name': 'Latte', 'min_price': '270'})
+        self.assertEqual([p['currency'] for p in response.data], ['KES'])
+
+    def test_rate_change_only_touches_that_currency(self):
+        call_command('load_fx_rates', 'USD=130', stdout=io.StringIO())
+        ExchangeRate.objects.filter(currency='USD').update(rate_to_base=Decimal('100'))
+        self.assertEqual(recompute_base_prices(['USD']), 1)
+        self.usd.refresh_from_db()
+        self.assertEqual(self.usd.price_base, Decimal('200.00'))
+
+    def test_bulk_recompute_rounds_like_to_base(self):
+        ExchangeRate.objects.create(currency='USD', rate_to_base=Decimal('0.25'))
+        Product.objects.filter(pk=self.usd.pk).update(price=Decimal('2.50'))
+        recompute_base_prices(['USD'])
+        self.usd.refresh_from_db()
+        self.assertEqual(self.usd.price_base, to_base(Decimal('2.50'), 'USD'))
+        self.assertEqual(self.usd.price_base, Decimal('0.63'))
+
+
+class HotelMembershipTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='manager', password='password')
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+        self.other = Hotel.objects.create(name='Other Hotel', slug='other-hotel')
+        self.room = Product.objects.create(hotel=self.hotel, name='Room', price=Decimal('100.00'))
+        self.foreign_room = Product.objects.create(hotel=self.other, name='Other Room', price=Decimal('90.00'))
+        Booking.objects.create(product=self.room, guest_name='Mine', check_in=date(2024, 1, 1), check_out=date(2024, 1, 2))
+        Booking.objects.create(
+            product=self.foreign_room, guest_name='Theirs', check_in=date(2024, 1, 1), check_out=date(2024, 1, 2)
+        )
+        HotelUser.objects.create(user=self.user, hotel=self.hotel, is_manager=True)
+
+    @mock.patch('menu_app.permissions.cache_is_shared', return_value=True)
+    def test_memberships_cached_and_invalidated(self, shared):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_hotel_ids(self.user), {self.hotel.pk})
+        with self.assertNumQueries(0):
+            get_hotel_ids(self.user)
+
+        HotelUser.objects.create(user=self.user, hotel=self.other)
+        self.assertEqual(get_hotel_ids(self.user), {self.hotel.pk, self.other.pk})
+
+    def test_memberships_not_cached_in_per_process_cache(self):
+        get_hotel_ids(self.user)
+        # Another worker's invalidation could not reach this process, so nothing is kept across requests
+        with self.assertNumQueries(1):
+            self.assertEqual(get_hotel_ids(self.user), {self.hotel.pk})
+
+    def test_booking_list_scoped_to_member_hotels(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('booking-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([b['guest_name'] for b in response.data['results']], ['Mine'])
+
+    def test_product_update_requires_membership(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('product-detail', args=[self.foreign_room.pk])
+        response = self.client.patch(url, {'description': 'hijacked'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        url = reverse('product-detail', args=[self.room.pk])
+        response = self.client.patch(url, {'description': 'Sea view'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_product_cannot_be_moved_to_another_hotel(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('product-detail', args=[self.room.pk])
+        response = self.client.patch(url, {'hotel_id': self.other.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.hotel_id, self.hotel.pk)
+
+        HotelUser.objects.create(user=self.user, hotel=self.other)
+        response = self.client.patch(url, {'hotel_id': self.other.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class StatelessJWTTests(APITestCase):
+    def setUp(self):
+        # Views bind DEFAULT_AUTHENTICATION_CLASSES at import, so switch the mode on the base class
+        patcher = mock.patch.object(APIView, 'authentication_classes', [ClaimsJWTAuthentication])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+        self.user = User.objects.create_user(username='manager', password='password')
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+        self.room = Product.objects.create(hotel=self.hotel, name='Room', price=Decimal('100.00'))
+        HotelUser.objects.create(user=self.user, hotel=self.hotel, is_manager=True)
+        cache.clear()
+
+    def _login(self):
+        response = self.client.post(
+            reverse('token_obtain_pair'), {'username': 'manager', 'password': 'password'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_token_carries_membership_claims(self):
+        access = AccessToken(self._login()['access'])
+        self.assertEqual(access['hotel_ids'], [self.hotel.pk])
+        self.assertFalse(access['is_staff'])
+
+    def test_authorises_from_claims_without_user_lookup(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self._login()['access']}")
+        # Only the booking count query; no auth_user or hoteluser lookups
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('booking-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_revoked_tokens_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self._login()['access']}")
+        with mock.patch('menu_app.authentication.time.time', return_value=time.time() + 5):
+            revoke_user_tokens(self.user.pk)
+        response = self.client.get(reverse('booking-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_issued_in_the_revocation_second_rejected(self):
+        access = AccessToken(self._login()['access'])
+        with mock.patch('menu_app.authentication.time.time', return_value=access['iat'] + 0.9):
+            revoke_user_tokens(self.user.pk)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.assertEqual(self.client.get(reverse('booking-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_stateless_auth_refused_without_shared_cache(self):
+        with override_settings(JWT_STATELESS_AUTH=True):
+            self.assertEqual([e.id for e in checks.stateless_auth_needs_shared_cache(None)], ['menu_app.E001'])
+            with mock.patch('menu_app.checks.cache_is_shared', return_value=True):
+                self.assertEqual(checks.stateless_auth_needs_shared_cache(None), [])
+
+
+class ThrottlingTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+        self.room = Product.objects.create(hotel=self.hotel, name='Room', price=Decimal('100.00'))
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'availability': '2/min'}})
+    def test_availability_token_bucket(self):
+        url = reverse('availability')
+        params = {'product': self.room.pk, 'check_in': '2024-01-01', 'check_out': '2024-01-03'}
+        codes = [self.client.get(url, params).status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'availability': '2/min'}})
+    def test_forwarded_for_does_not_escape_the_ip_bucket(self):
+        url = reverse('availability')
+        params = {'check_in': '2024-01-01', 'check_out': '2024-01-03'}
+        codes = [
+            self.client.get(url, dict(params, product=self.room.pk + i), HTTP_X_FORWARDED_FOR=f'10.0.0.{i}').status_code
+            for i in range(3)
+        ]
+        self.assertEqual(codes[2], 429)
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'availability': '2/min'}})
+    def test_rejected_request_takes_no_tokens(self):
+        url = reverse('availability')
+        params = {'product': self.room.pk, 'check_in': '2024-01-01', 'check_out': '2024-01-03'}
+        for _ in range(2):
+            self.client.get(url, params, REMOTE_ADDR='10.0.0.1')
+        # The product's bucket is empty; these rejections must not drain 10.0.0.2's own bucket
+        codes = [self.client.get(url, params, REMOTE_ADDR='10.0.0.2').status_code for _ in range(2)]
+        self.assertEqual(codes, [429, 429])
+        other = dict(params, product=self.room.pk + 1)
+        self.assertNotEqual(self.client.get(url, other, REMOTE_ADDR='10.0.0.2').status_code, 429)
+
+    @mock.patch('requests.post')
+    @mock.patch('requests.get')
+    def test_duplicate_stk_push_shares_one_call(self, mock_get, mock_post):
+        mock_get.return_value.json.return_value = {'access_token': 'token'}
+        mock_post.return_value.json.return_value = {'CheckoutRequestID': 'ws_CO_1'}
+        payload = {'phone': '254700000000', 'amount': 100, 'booking': 7}
+
+        first = self.client.post(reverse('mpesa-stk'), payload, format='json')
+        retry = self.client.post(reverse('mpesa-stk'), payload, format='json')
+
+        self.assertEqual(first.data, retry.data)
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(mock_get.call_count, 1)
+
+    def test_singleflight_coalesces_concurrent_calls(self):
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            release.wait(2)
+            return 'result'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(singleflight.do('k', slow))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, ['result'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_singleflight_waits_for_another_worker(self):
+        # Another worker holds the lock and finishes a moment later
+        cache.add('singleflight:k:lock', 'other-worker', 10)
+
+        def other_worker_finishes():
+            time.sleep(0.1)
+            cache.set('singleflight:k:other-worker', ('their result',), 10)
+            cache.delete('singleflight:k:lock')
+
+        threading.Thread(target=other_worker_finishes).start()
+        fn = mock.Mock(return_value='mine')
+        self.assertEqual(singleflight.do('k', fn), 'their result')
+        fn.assert_not_called()
+
+        # A leader that died without a result does not block the next caller for long
+        cache.add('singleflight:k:lock', 'dead-worker', 10)
+        with override_settings(SINGLEFLIGHT_WAIT_SECONDS=0.1):
+            self.assertEqual(singleflight.do('k', fn), 'mine')
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'stk_push': '2/min'}})
+    def test_simultaneous_requests_cannot_share_the_last_tokens(self):
+        throttle = StkPushThrottle()
+        request = mock.Mock(META={'REMOTE_ADDR': '10.0.0.1'}, data={'phone': '254700000000'}, query_params={})
+        # Every request reads the bucket before any of them writes it back
+        barrier = threading.Barrier(6)
+        get_many = LocMemCache.get_many
+
+        def read_together(backend, keys, *args, **kwargs):
+            values = get_many(backend, keys, *args, **kwargs)
+            barrier.wait(2)
+            return values
+
+        # Each thread has its own cache handle, so patch the backend class
+        with mock.patch.object(LocMemCache, 'get_many', autospec=True, side_effect=read_together):
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(throttle.allow_request(request, None)))
+                       for _ in range(6)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(results.count(True), 2)
+
+    def test_list_body_is_rejected_not_a_server_error(self):
+        response = self.client.post(reverse('mpesa-stk'), [{'phone': '254700000000'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_throttles_need_a_shared_cache_in_production(self):
+        self.assertEqual([e.id for e in checks.throttles_need_shared_cache(None)], ['menu_app.E002'])
+        with mock.patch('menu_app.checks.cache_is_shared', return_value=True):
+            self.assertEqual(checks.throttles_need_shared_cache(None), [])
+
+
+class RatePlanPricingTests(APITestCase):
+    def setUp(self):
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+        self.room = Product.objects.create(
+            hotel=self.hotel, name='Standard', price=Decimal('100.00'), product_type='room', total_rooms=3, available_rooms=3
+        )
+        self.suite = Product.objects.create(
+            hotel=self.hotel, name='Suite', price=Decimal('300.00'), product_type='room', total_rooms=1, available_rooms=1
+        )
+        # Fri/Sat nights cost more; a December season overrides everything
+        RatePlan.objects.create(product=self.room, name='Weekend', nightly_price=Decimal('150.00'), weekdays='4,5')
+        RatePlan.objects.create(
+            product=self.room, name='Festive', nightly_price=Decimal('200.00'),
+            start_date=date(2024, 12, 20), end_date=date(2024, 12, 31), priority=10
+        )
+        RatePlan.objects.create(product=self.suite, name='Weekly', nightly_price=Decimal('250.00'), min_nights=7)
+
+    def test_night_by_night_pricing(self):
+        # Thu 2024-03-07 to Sun 2024-03-10: Thu 100 + Fri 150 + Sat 150
+        self.assertEqual(quote_stay(self.room, date(2024, 3, 7), date(2024, 3, 10)), Decimal('400.00'))
+        # Thu 2024-12-19 to Sat 2024-12-21: Thu 100 + Fri festive 200
+        self.assertEqual(quote_stay(self.room, date(2024, 12, 19), date(2024, 12, 21)), Decimal('300.00'))
+        self.assertEqual(quote_stay(self.suite, date(2024, 3, 1), date(2024, 3, 4)), Decimal('900.00'))
+        self.assertEqual(quote_stay(self.suite, date(2024, 3, 1), date(2024, 3, 8)), Decimal('1750.00'))
+
+    def test_booking_uses_rate_plans(self):
+        booking = Booking.objects.create(
+            product=self.room, guest_name='Guest', check_in=date(2024, 3, 7), check_out=date(2024, 3, 10)
+        )
+        self.assertEqual(booking.total_price, Decimal('400.00'))
+
+    def test_quote_endpoint_prices_all_rooms_in_two_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse('product-quote'),
+                {'hotel': 'test-hotel', 'check_in': '2024-03-07', 'check_out': '2024-03-10', 'nightly': 'true'}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        totals = {row['name']: row['total_price'] for row in response.data}
+        self.assertEqual(totals, {'Standard': Decimal('400.00'), 'Suite': Decimal('900.00')})
+        self.assertEqual([n['price'] for n in response.data[0]['nightly']], [Decimal('100.00'), Decimal('150.00'), Decimal('150.00')])
+
+    def test_quote_rejects_impossible_dates_and_long_stays(self):
+        url = reverse('product-quote')
+        for check_in, check_out in [('2024-02-30', '2024-03-02'), ('0001-01-01', '9999-12-31'), ('2024-01-01', '2025-01-02')]:
+            response = self.client.get(url, {'hotel': 'test-hotel', 'check_in': check_in, 'check_out': check_out})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, check_in)
+        response = self.client.get(url, {'hotel': 'test-hotel', 'check_in': '2024-01-01', 'check_out': '2024-12-31'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class BulkBookingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='operator', password='password')
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+        self.standard = Product.objects.create(
+            hotel=self.hotel, name='Standard', price=Decimal('100.00'), product_type='room', total_rooms=10, available_rooms=10
+        )
+        self.suite = Product.objects.create(
+            hotel=self.hotel, name='Suite', price=Decimal('300.00'), product_type='room', total_rooms=2, available_rooms=2
+        )
+        self.url = reverse('booking-bulk')
+        self.client.force_authenticate(user=self.user)
+
+    def _item(self, product, quantity):
+        return {'product': product.pk, 'check_in': '2024-05-01', 'check_out': '2024-05-03', 'quantity': quantity}
+
+    def test_allocates_all_items(self):
+        payload = {'items': [self._item(self.standard, 8), self._item(self.suite, 2)]}
+        # Lock, one UPDATE, one rate query, one booking INSERT, one change-log INSERT, one webhook
+        # endpoint lookup, one rollup INSERT and two rollup UPDATEs per product (+ savepoint pair);
+        # independent of room count
+        with self.assertNumQueries(13):
+            response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 10)
+        self.assertEqual(response.data['results'][1]['bookings'][0]['total_price'], '600.00')
+
+        self.standard.refresh_from_db()
+        self.suite.refresh_from_db()
+        self.assertEqual(self.standard.available_rooms, 2)
+        self.assertEqual(self.suite.available_rooms, 0)
+        self.assertFalse(self.suite.available)
+
+    def test_all_or_nothing(self):
+        payload = {'items': [self._item(self.standard, 1), self._item(self.suite, 3)]}
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual([r['status'] for r in response.data['results']], ['ok', 'error'])
+        self.assertEqual(Booking.objects.count(), 0)
+        self.standard.refresh_from_db()
+        self.assertEqual(self.standard.available_rooms, 10)
+
+    def test_single_booking_decrements_once(self):
+        response = self.client.post(reverse('booking-list'), {
+            'product': self.suite.pk, 'guest_name': 'Guest', 'check_in': '2024-05-01', 'check_out': '2024-05-02'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.suite.refresh_from_db()
+        self.assertEqual(self.suite.available_rooms, 1)
+
+    def test_reversed_and_overlong_stays_rejected(self):
+        for check_in, check_out in [('2024-05-03', '2024-05-01'), ('2024-01-01', '2025-01-02'), ('0001-01-01', '9999-12-31')]:
+            response = self.client.post(reverse('booking-list'), {
+                'product': self.suite.pk, 'guest_name': 'Guest', 'check_in': check_in, 'check_out': check_out,
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, check_in)
+            item = dict(self._item(self.suite, 1), check_in=check_in, check_out=check_out)
+            response = self.client.post(self.url, {'items': [item]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, check_in)
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(BookingRollup.objects.exists())
+
+    def test_overlong_stays_stopped_before_rollups_outside_the_api(self):
+        with self.assertRaises(ValidationError):
+            Booking.objects.create(product=self.suite, check_in=date(2000, 1, 1), check_out=date(2030, 1, 1))
+        item = {'product': self.suite.pk, 'check_in': date(2000, 1, 1), 'check_out': date(2030, 1, 1), 'quantity': 1}
+        with self.assertRaises(AllocationError):
+            allocate_bulk([item])
+        self.assertFalse(BookingRollup.objects.exists())
+
+
+class WorkerBootTests(SimpleTestCase):
+    def test_boot_within_budget_without_heavy_imports(self):
+        result, _ = measure_boot()
+        # Pillow is only needed once an image is saved
+        self.assertNotIn('PIL', result['modules'])
+        self.assertLess(result['boot_ms'], settings.BOOT_TIME_BUDGET_MS)
+
+
+class HotelStatsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='manager', password='password')
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+        HotelUser.objects.create(user=self.user, hotel=self.hotel, is_manager=True)
+        self.room = Product.objects.create(
+            hotel=self.hotel, name='Standard', price=Decimal('100.00'), product_type='room', total_rooms=4, available_rooms=4
+        )
+        self.today = timezone.localdate()
+        self.first = Booking.objects.create(
+            product=self.room, guest_name='A', check_in=self.today, check_out=self.today + timedelta(days=2)
+        )
+        self.second = Booking.objects.create(
+            product=self.room, guest_name='B', check_in=self.today, check_out=self.today + timedelta(days=1)
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def _stats(self):
+        response = self.client.get(reverse('hotel-stats', args=['test-hotel']), {
+            'from': self.today.isoformat(), 'to': (self.today + timedelta(days=1)).isoformat()
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_stats_from_incremental_rollups(self):
+        data = self._stats()
+        self.assertEqual(data['totals']['bookings'], 2)
+        self.assertEqual(data['totals']['revenue'], Decimal('300.00'))
+        self.assertEqual([d['room_nights'] for d in data['days']], [2, 1])
+        self.assertEqual(data['days'][0]['occupancy'], 0.5)
+
+        self.second.status = 'cancelled'
+        self.second.save()
+        data = self._stats()
+        self.assertEqual(data['totals']['cancellations'], 1)
+        self.assertEqual(data['totals']['revenue'], Decimal('200.00'))
+        self.assertEqual([d['room_nights'] for d in data['days']], [1, 1])
+
+    def test_rebuild_matches_incremental(self):
+        before = self._stats()
+        BookingRollup.objects.update(bookings=0, revenue=0, room_nights=0)
+        call_command('rebuild_booking_rollups', stdout=io.StringIO())
+        self.assertEqual(self._stats(), before)
+
+    def test_edited_booking_moves_its_rollups(self):
+        suite = Product.objects.create(
+            hotel=self.hotel, name='Suite', price=Decimal('250.00'), product_type='room', total_rooms=2, available_rooms=2
+        )
+        booking = Booking.objects.get(pk=self.first.pk)
+        booking.product = suite
+        booking.check_in = self.today + timedelta(days=1)
+        booking.check_out = self.today + timedelta(days=3)
+        booking.save()
+
+        def rows():
+            return sorted(
+                BookingRollup.objects.exclude(bookings=0, revenue=0, cancellations=0, room_nights=0)
+                .values_list('product_id', 'day', 'bookings', 'revenue', 'cancellations', 'room_nights')
+            )
+
+        incremental = rows()
+        self.assertIn(suite.pk, [row[0] for row in incremental])
+        call_command('rebuild_booking_rollups', stdout=io.StringIO())
+        self.assertEqual(incremental, rows())
+
+    def test_stats_require_membership(self):
+        outsider = User.objects.create_user(username='outsider', password='password')
+        self.client.force_authenticate(user=outsider)
+        response = self.client.get(reverse('hotel-stats', args=['test-hotel']))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_impossible_dates_rejected(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('hotel-stats', args=['test-hotel']), {'from': '2024-02-30'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ArchiveBookingsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='manager', password='password')
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+        HotelUser.objects.create(user=self.user, hotel=self.hotel, is_manager=True)
+        self.room = Product.objects.create(
+            hotel=self.hotel, name='Standard', price=Decimal('100.00'), product_type='room', total_rooms=4, available_rooms=4
+        )
+        self.today = timezone.localdate()
+        past = self.today - timedelta(days=60)
+        self.old = [
+            Booking.objects.create(
+                product=self.room, guest_name=f'Old {status_}', check_in=past, check_out=past + timedelta(days=2),
+                status=status_,
+            )
+            for status_ in ('confirmed', 'cancelled', 'pending')
+        ]
+        self.current = Booking.objects.create(
+            product=self.room, guest_name='Current', check_in=self.today, check_out=self.today + timedelta(days=1),
+            status='confirmed',
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def _archive(self, *args):
+        call_command('archive_bookings', f'--before={self.today.isoformat()}', *args, stdout=io.StringIO())
+
+    def test_moves_finished_bookings_in_batches(self):
+        self.room.refresh_from_db()
+        rooms_before = self.room.available_rooms
+        rollups_before = list(BookingRollup.objects.order_by('day').values_list('bookings', 'revenue', 'room_nights'))
+
+        with mock.patch('menu_app.models.record_event') as record_event:
+            self._archive('--batch-size=1')
+        record_event.assert_not_called()  # no booking.deleted webhooks either
+
+        self.assertEqual(set(ArchivedBooking.objects.values_list('id', flat=True)), {self.old[0].pk, self.old[1].pk})
+        self.assertEqual(set(Booking.objects.values_list('id', flat=True)), {self.old[2].pk, self.current.pk})
+        archived = ArchivedBooking.objects.get(pk=self.old[0].pk)
+        self.assertEqual((archived.hotel_id, archived.product_name, archived.status), (self.hotel.pk, 'Standard', 'confirmed'))
+        # Archiving is not a cancellation: availability and stats are untouched
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.available_rooms, rooms_before)
+        self.assertEqual(
+            list(BookingRollup.objects.order_by('day').values_list('bookings', 'revenue', 'room_nights')), rollups_before
+        )
+
+    def test_rebuild_keeps_archived_stays(self):
+        def stats():
+            response = self.client.get(reverse('hotel-stats', args=['test-hotel']), {
+                'from': (self.today - timedelta(days=61)).isoformat(), 'to': self.today.isoformat(),
+            })
+            return response.data['totals'], [d['room_nights'] for d in response.data['days']]
+
+        before = stats()
+        self._archive()
+        call_command('rebuild_booking_rollups', stdout=io.StringIO())
+        self.assertEqual(stats(), before)
+
+    def test_dry_run_changes_nothing(self):
+        self._archive('--dry-run')
+        self.assertEqual(ArchivedBooking.objects.count(), 0)
+        self.assertEqual(Booking.objects.count(), 4)
+
+    def test_list_is_live_only_unless_include_archived(self):
+        self._archive()
+        response = self.client.get(reverse('booking-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({b['id'] for b in response.data['results']}, {self.old[2].pk, self.current.pk})
+
+        response = self.client.get(reverse('booking-list'), {'include_archived': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 4)
+        flags = {b['id']: b['archived'] for b in response.data['results']}
+        self.assertEqual(flags, {self.old[0].pk: True, self.old[1].pk: True, self.old[2].pk: False, self.current.pk: False})
+
+    def test_include_archived_is_scoped_to_member_hotels(self):
+        self._archive()
+        outsider = User.objects.create_user(username='outsider', password='password')
+        self.client.force_authenticate(user=outsider)
+        response = self.client.get(reverse('booking-list'), {'include_archived': 'true'})
+        self.assertEqual(response.data['count'], 0)
+
+    def test_export_includes_archived_rows(self):
+        self._archive()
+        response = self.client.get(reverse('booking-export'), {'include_archived': 'true', 'export_format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual({r['hotel_slug'] for r in rows}, {'test-hotel'})
+
+
+class AdminChangelistTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='admin', password='password', email='admin@example.com')
+        self.client.force_login(self.admin)
+        self.room_category = Category.objects.create(name='Rooms', slug='rooms')
+        self.food_category = Category.objects.create(name='Mains', slug='mains')
+        self.hotels = [Hotel.objects.create(name=f'Hotel {i}', slug=f'hotel-{i}') for i in range(3)]
+        self.room = Product.objects.create(
+            hotel=self.hotels[0], name='Standard', price=10, product_type='room', category=self.room_category
+        )
+        Product.objects.create(
+            hotel=self.hotels[0], name='Pilau', price=5, product_type='food', category=self.food_category
+        )
+
+    def _changelist_queries(self, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:menu_app_product_changelist'), params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        baseline = self._changelist_queries()
+        for hotel in self.hotels:
+            for i in range(5):
+                Product.objects.create(hotel=hotel, name=f'Room {i}', price=10, product_type='room')
+        self.assertEqual(self._changelist_queries(), baseline)
+
+    def test_slug_filter(self):
+        response = self.client.get(reverse('admin:menu_app_product_changelist'), {'category_slug': 'mains'})
+        self.assertEqual([p.name for p in response.context['cl'].result_list], ['Pilau'])
+
+    def test_change_form_uses_cached_type_choices(self):
+        url = reverse('admin:menu_app_product_change', args=[self.room.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        field = response.context['adminform'].form.fields['category']
+        self.assertEqual(list(field.queryset), [self.room_category])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertFalse(any('DISTINCT' in q['sql'] for q in ctx.captured_queries))
+
+    def test_autocomplete_scoped_to_product_type(self):
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'menu_app', 'model_name': 'product', 'field_name': 'category', 'product_type': 'food',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['text'] for r in response.json()['results']], ['Mains'])
+
+
+class ProductBulkUpdateTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        clear_rate_cache()
+        ExchangeRate.objects.create(currency='USD', rate_to_base=Decimal('130'))
+        self.user = User.objects.create_user(username='manager', password='password')
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+        self.other_hotel = Hotel.objects.create(name='Other Hotel', slug='other-hotel')
+        HotelUser.objects.create(user=self.user, hotel=self.hotel, is_manager=True)
+        self.category = Category.objects.create(name='Specials', slug='specials')
+        self.kes = Product.objects.create(hotel=self.hotel, name='Pilau', price=Decimal('500.00'), product_type='food')
+        self.usd = Product.objects.create(
+            hotel=self.hotel, name='Burger', price=Decimal('10.00'), currency='USD', product_type='food'
+        )
+        self.foreign = Product.objects.create(hotel=self.other_hotel, name='Soup', price=Decimal('200.00'), product_type='food')
+        self.client.force_authenticate(user=self.user)
+
+    def _bulk(self, payload):
+        return self.client.post(reverse('product-bulk-update'), payload, format='json')
+
+    def test_percent_change_recomputes_base_price_without_save(self):
+        with mock.patch.object(Product, 'save') as save, self.captureOnCommitCallbacks(execute=True):
+            response = self._bulk({
+                'ids': [self.kes.pk, self.usd.pk], 'price_percent': '10', 'category': self.category.pk,
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'updated': 2, 'hotels': 1})
+        save.assert_not_called()
+
+        self.kes.refresh_from_db()
+        self.usd.refresh_from_db()
+        self.assertEqual((self.kes.price, self.kes.price_base), (Decimal('550.00'), Decimal('550.00')))
+        self.assertEqual((self.usd.price, self.usd.price_base), (Decimal('11.00'), Decimal('1430.00')))
+        self.assertEqual(self.kes.category, self.category)
+        logged = CatalogChange.objects.filter(entity='product', object_id__in=[self.kes.pk, self.usd.pk])
+        self.assertEqual(logged.count(), 2 + 2)
+
+    def test_one_event_per_hotel(self):
+        with mock.patch.object(broker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            self._bulk({'ids': [self.kes.pk, self.usd.pk], 'available': False})
+        publish.assert_called_once_with(self.hotel.pk, {'bulk': True, 'count': 2})
+        self.assertFalse(Product.objects.filter(pk__in=[self.kes.pk, self.usd.pk], available=True).exists())
+
+    def test_price_cut_never_goes_negative(self):
+        self._bulk({'ids': [self.kes.pk], 'price_delta': '-900'})
+        self.kes.refresh_from_db()
+        self.assertEqual(self.kes.price, Decimal('0.00'))
+
+    def test_rejects_products_of_other_hotels(self):
+        response = self._bulk({'ids': [self.kes.pk, self.foreign.pk], 'is_archived': True})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.data['ids'], [self.foreign.pk])
+        self.assertFalse(Product.objects.filter(is_archived=True).exists())
+
+    def test_rejects_conflicting_price_changes(self):
+        response = self._bulk({'ids': [self.kes.pk], 'price_percent': '5', 'price': '100'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_admin_bulk_edit_action(self):
+        admin_user = User.objects.create_superuser(username='admin', password='password', email='admin@example.com')
+        self.client.force_login(admin_user)
+        url = reverse('admin:menu_app_product_changelist')
+        selected = {'action': 'bulk_edit', '_selected_action': [self.kes.pk, self.foreign.pk], 'index': 0}
+
+        response = self.client.post(url, selected)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '2 products selected')
+
+        response = self.client.post(url, {**selected, 'apply': 'Apply', 'price_mode': 'price', 'price_value': '99'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            set(Product.objects.filter(price=Decimal('99')).values_list('pk', flat=True)), {self.kes.pk, self.foreign.pk}
+        )
+
+
+class ContentAddressedMediaTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+
+    def _image(self, size=(10, 10), color='red', name='dish.jpg'):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', size, color).save(buffer, format='JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def _product(self, name, image=None):
+        return Product.objects.create(hotel=self.hotel, name=name, price=10, product_type='food', image=image)
+
+    def _stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, f), self.media_root)
+            for root, _, files in os.walk(self.media_root) for f in files
+        )
+
+    def test_identical_uploads_share_one_file(self):
+        data = self._image().read()
+        first = self._product('Pilau', SimpleUploadedFile('a.jpg', data))
+        second = self._product('Pilau', SimpleUploadedFile('copy of a.JPG', data))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^product_images/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(self._stored_files(), [first.image.name])
+
+    def test_delete_is_reference_counted(self):
+        data = self._image().read()
+        first = self._product('Pilau', SimpleUploadedFile('a.jpg', data))
+        second = self._product('Pilau', SimpleUploadedFile('b.jpg', data))
+        name = first.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self._stored_files(), [name])
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self._stored_files(), [])
+
+    def test_first_write_is_resized(self):
+        from PIL import Image
+
+        product = self._product('Platter', self._image(size=(2400, 1200)))
+        with Image.open(product.image.path) as img:
+            self.assertEqual(img.size, (1200, 600))
+
+    def test_dedupe_media_collapses_legacy_files(self):
+        data = self._image().read()
+        os.makedirs(os.path.join(self.media_root, 'product_images'))
+        for legacy in ('a.jpg', 'a_copy.jpg'):
+            with open(os.path.join(self.media_root, 'product_images', legacy), 'wb') as f:
+                f.write(data)
+        first, second = self._product('Pilau'), self._product('Pilau')
+        Product.objects.filter(pk=first.pk).update(image='product_images/a.jpg')
+        Product.objects.filter(pk=second.pk).update(image='product_images/a_copy.jpg')
+
+        out = io.StringIO()
+        call_command('dedupe_media', stdout=out)
+        self.assertIn('1 duplicate(s)', out.getvalue())
+
+        names = set(Product.objects.filter(pk__in=[first.pk, second.pk]).values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self._stored_files(), sorted(names))
+
+
+class MediaServingTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_ACCEL_REDIRECT=None, MEDIA_SENDFILE=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.data = bytes(range(256)) * 4
+        # Hotel images are stored without resizing, so the served bytes are the raw test bytes
+        self.hotel = Hotel.objects.create(
+            name='Test Hotel', slug='test-hotel', image=SimpleUploadedFile('lobby.jpg', self.data)
+        )
+        self.url = reverse('media', args=[self.hotel.image.name])
+
+    def test_serializer_returns_versioned_url(self):
+        response = self.client.get(reverse('hotel-menu', args=['test-hotel']))
+        self.assertTrue(response.data['hotel']['image'].endswith(self.url))
+        self.assertRegex(self.url, r'^/media/hotels/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+
+    def test_immutable_response_and_revalidation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+        self.assertEqual(b''.join(response.streaming_content), self.data[10:20])
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=-4'})
+        self.assertEqual(b''.join(response.streaming_content), self.data[-4:])
+
+        response = self.client.get(self.url, headers={'Range': f'bytes={len(self.data)}-'})
+        self.assertEqual(response.status_code, 416)
+
+    def test_accel_redirect_offload(self):
+        with override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.hotel.image.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_paths_outside_media_root_are_not_served(self):
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/product_images/missing.jpg').status_code, 404)
+
+
+class NameNormalizationTests(APITestCase):
+    def setUp(self):
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+
+    def test_folds_accents_punctuation_and_variants(self):
+        self.assertEqual(normalize_name('Café-Latté!'), 'cafe latte')
+        self.assertEqual(normalize_name('  CAFE   latte '), 'cafe latte')
+        self.assertEqual(normalize_name('Chapatti & Kuku'), 'chapati chicken')
+        self.assertEqual(normalize_name(None), '')
+
+    def test_rename_bulk_create_and_update_stay_consistent(self):
+        product = Product.objects.create(hotel=self.hotel, name='Latte', price=10, product_type='food')
+        product.name = 'Café Mocha'
+        product.save()
+        self.assertEqual(product.normalized_name, 'cafe mocha')
+
+        Product.objects.bulk_create([Product(hotel=self.hotel, name='Maandazi (2 pcs)', price=5, product_type='food')])
+        self.assertTrue(Product.objects.filter(normalized_name='mandazi 2 pcs').exists())
+
+        Product.objects.filter(pk=product.pk).update(name='Espresso')
+        response = self.client.get(reverse('product-compare'), {'name': 'ESPRESSO'})
+        self.assertEqual([p['id'] for p in response.data], [product.pk])
+
+    def test_bulk_update_and_expression_updates_keep_names_consistent(self):
+        products = [Product.objects.create(hotel=self.hotel, name=f'Latte {i}', price=10, product_type='food') for i in range(2)]
+        for product in products:
+            product.name = product.name.replace('Latte', 'Café Mocha')
+        Product.objects.bulk_update(products, ['name'])
+        self.assertEqual(
+            sorted(Product.objects.values_list('normalized_name', flat=True)), ['cafe mocha 0', 'cafe mocha 1']
+        )
+        with self.assertRaises(TypeError):
+            Product.objects.update(name=Concat(F('name'), Value(' (new)')))
+
+    def test_migration_renormalizes_existing_rows(self):
+        product = Product.objects.create(hotel=self.hotel, name='Chapatti', price=10, product_type='food')
+        Product.objects.filter(pk=product.pk).update(normalized_name='chapatti')
+        migration = importlib.import_module('menu_app.migrations.0018_renormalize_names')
+        migration.renormalize(django_apps, None)
+        product.refresh_from_db()
+        self.assertEqual(product.normalized_name, 'chapati')
+
+    def test_renormalize_names_command(self):
+        products = [
+            Product.objects.create(hotel=self.hotel, name=f'Crème Brûlée {i}', price=10, product_type='food')
+            for i in range(5)
+        ]
+        # Rows written before the current rules (or by raw SQL) carry stale keys
+        Product.objects.filter(pk__in=[p.pk for p in products]).update(normalized_name='creme brulee')
+
+        out = io.StringIO()
+        call_command('renormalize_names', '--batch-size=2', '--model=product', stdout=out)
+        self.assertIn('Product: 5 row(s) updated', out.getvalue())
+        self.assertEqual(
+            sorted(Product.objects.values_list('normalized_name', flat=True)),
+            [f'creme brulee {i}' for i in range(5)],
+        )
+
+        out = io.StringIO()
+        call_command('renormalize_names', stdout=out)
+        self.assertIn('Product: 0 row(s) updated', out.getvalue())
+
+
+class NearbyHotelsTests(APITestCase):
+    def setUp(self):
+        self.cbd = Hotel.objects.create(name='CBD', slug='cbd', latitude='-1.286389', longitude='36.817223')
+        self.westlands = Hotel.objects.create(
+            name='Westlands', slug='westlands', latitude='-1.265000', longitude='36.803000'
+        )
+        self.mombasa = Hotel.objects.create(name='Mombasa', slug='mombasa', latitude='-4.043477', longitude='39.668206')
+        Hotel.objects.create(name='Nowhere', slug='nowhere')
+
+    def test_geohash_maintained_on_save(self):
+        self.assertEqual(self.cbd.geohash, geo.encode(-1.286389, 36.817223))
+        self.westlands.latitude = self.westlands.longitude = None
+        self.westlands.save()
+        self.assertEqual(self.westlands.geohash, '')
+
+    def test_nearby_sorted_by_distance(self):
+        response = self.client.get(reverse('hotel-nearby'), {'lat': '-1.2864', 'lng': '36.8172', 'radius': '10'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([h['slug'] for h in response.data], ['cbd', 'westlands'])
+        self.assertLess(response.data[0]['distance_km'], 0.01)
+        self.assertAlmostEqual(response.data[1]['distance_km'], 2.86, places=1)
+
+        response = self.client.get(reverse('hotel-nearby'), {'lat': '-3.2', 'lng': '38.6', 'radius': '200', 'limit': 1})
+        self.assertEqual([h['slug'] for h in response.data], ['mombasa'])
+
+    def test_invalid_parameters(self):
+        for params in (
+            {'lat': '1'}, {'lat': 'x', 'lng': '1'}, {'lat': '91', 'lng': '0'}, {'lat': '0', 'lng': '0', 'radius': '0'},
+        ):
+            response = self.client.get(reverse('hotel-nearby'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_covering_cells_contain_every_point_in_radius(self):
+        rng = random.Random(44)
+        for _ in range(300):
+            lat, lng = rng.uniform(-80, 80), rng.uniform(-179, 179)
+            radius = rng.choice([0.5, 2, 10, 50])
+            cells = geo.covering_cells(lat, lng, radius)
+            # A point on the circle's rim, placed with the spherical destination formula
+            bearing, angle = rng.uniform(0, 2 * math.pi), radius / geo.EARTH_RADIUS_KM
+            phi = math.radians(lat)
+            point_phi = math.asin(math.sin(phi) * math.cos(angle) + math.cos(phi) * math.sin(angle) * math.cos(bearing))
+            point_lng = lng + math.degrees(math.atan2(
+                math.sin(bearing) * math.sin(angle) * math.cos(phi), math.cos(angle) - math.sin(phi) * math.sin(point_phi)
+            ))
+            point_hash = geo.encode(math.degrees(point_phi), (point_lng + 180) % 360 - 180)
+            self.assertTrue(any(point_hash.startswith(c) for c in cells), (lat, lng, radius, bearing))
+
+    def test_covering_cells_wide_enough_at_high_latitude(self):
+        # A circle just narrower than a cell at its centre's latitude, centred on a cell's western edge
+        lat_span, lng_span = geo.cell_size(5)
+        lat, lng = 70.0, -180.0 + round(216.0 / lng_span) * lng_span + lng_span * 1e-6
+        radius = lng_span * 111.32 * math.cos(math.radians(lat)) * 0.9999
+        west = lng - math.degrees(math.asin(math.sin(radius / geo.EARTH_RADIUS_KM) / math.cos(math.radians(lat))))
+        point_hash = geo.encode(lat, west)
+        self.assertTrue(any(point_hash.startswith(c) for c in geo.covering_cells(lat, lng, radius)))
+
+
+class HotelSummaryTests(APITestCase):
+    def setUp(self):
+        clear_rate_cache()
+        self.user = User.objects.create_user(username='operator', password='password')
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.standard = Product.objects.create(
+                hotel=self.hotel, name='Standard', price=Decimal('100.00'), product_type='room', total_rooms=10, available_rooms=10
+            )
+            self.suite = Product.objects.create(
+                hotel=self.hotel, name='Suite', price=Decimal('300.00'), product_type='room', total_rooms=2, available_rooms=2
+            )
+            self.pilau = Product.objects.create(hotel=self.hotel, name='Pilau', price=Decimal('500.00'), product_type='food')
+
+    def _summary(self):
+        self.hotel.refresh_from_db()
+        return {field: getattr(self.hotel, field) for field in summaries.SUMMARY_FIELDS}
+
+    def test_product_writes_keep_summary_current(self):
+        self.assertEqual(self._summary(), {
+            'room_count': 2, 'food_count': 1, 'rooms_available': 12,
+            'min_room_price': Decimal('100.00'), 'min_food_price': Decimal('500.00'),
+        })
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.standard.is_archived = True
+            self.standard.save()
+        self.assertEqual(self._summary()['room_count'], 1)
+        self.assertEqual(self._summary()['min_room_price'], Decimal('300.00'))
+
+        other = Hotel.objects.create(name='Other Hotel', slug='other-hotel')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pilau.hotel = other
+            self.pilau.save()
+        self.assertEqual(self._summary()['food_count'], 0)
+        self.assertIsNone(self._summary()['min_food_price'])
+        other.refresh_from_db()
+        self.assertEqual((other.food_count, other.min_food_price), (1, Decimal('500.00')))
+
+    def test_bookings_and_bulk_updates_refresh_summary(self):
+        self.client.force_authenticate(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('booking-bulk'), {'items': [
+                {'product': self.standard.pk, 'check_in': '2024-05-01', 'check_out': '2024-05-03', 'quantity': 3},
+            ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self._summary()['rooms_available'], 9)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.suite.pk).update(available_rooms=0)  # raw update: no signals
+            bulk_update_products(Product.objects.filter(pk=self.standard.pk), {'price_percent': Decimal('-50')})
+        self.assertEqual(self._summary()['min_room_price'], Decimal('50.00'))
+        self.assertEqual(self._summary()['rooms_available'], 7)
+
+    def test_fx_recompute_and_command_refresh_summary(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                hotel=self.hotel, name='Burger', price=Decimal('1.00'), currency='USD', product_type='food'
+            )
+        self.assertEqual(self._summary()['min_food_price'], Decimal('500.00'))
+        ExchangeRate.objects.create(currency='USD', rate_to_base=Decimal('130'))
+        recompute_base_prices(['USD'])
+        self.assertEqual(self._summary()['min_food_price'], Decimal('130.00'))
+
+        Hotel.objects.filter(pk=self.hotel.pk).update(room_count=0, food_count=0)
+        out = io.StringIO()
+        call_command('refresh_hotel_summaries', '--hotel', 'test-hotel', stdout=out)
+        self.assertIn('1 hotel(s)', out.getvalue())
+        self.assertEqual((self._summary()['room_count'], self._summary()['food_count']), (2, 2))
+
+    def test_hotel_list_reads_summary_columns_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('hotel-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('menu_app_product' in q['sql'] for q in queries.captured_queries))
+        hotels = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual(hotels[0]['room_count'], 2)
+        self.assertEqual(hotels[0]['rooms_available'], 12)
+        self.assertEqual(hotels[0]['min_room_price'], '100.00')
+        self.assertEqual(hotels[0]['price_currency'], 'KES')
+
+
+class FoodOrderTests(APITestCase):
+    def setUp(self):
+        clear_rate_cache()
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+        self.other_hotel = Hotel.objects.create(name='Other Hotel', slug='other-hotel')
+        self.pilau = Product.objects.create(hotel=self.hotel, name='Pilau', price=Decimal('450.00'), product_type='food')
+        self.chai = Product.objects.create(hotel=self.hotel, name='Chai', price=Decimal('80.00'), product_type='food')
+        self.room = Product.objects.create(hotel=self.hotel, name='Standard', price=Decimal('3000.00'), product_type='room')
+        self.chef = User.objects.create_user(username='chef', password='password')
+        HotelUser.objects.create(user=self.chef, hotel=self.hotel)
+
+    def _order(self, items, hotel='test-hotel', table='7'):
+        return self.client.post(reverse('order-list'), {'hotel': hotel, 'table': table, 'items': items}, format='json')
+
+    def _feed(self, user=None, **headers):
+        if user is not None:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(user)}'
+        response = self.client.get(reverse('kitchen-feed', args=[self.hotel.slug]), **headers)
+        body = b''.join(response.streaming_content).decode() if response.streaming else ''
+        return response, body
+
+    def test_guest_places_order_with_constant_queries(self):
+        with CaptureQueriesContext(connection) as small:
+            response = self._order([{'product': self.pilau.pk, 'quantity': 2, 'price': '450.00'}])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_price'], '900.00')
+        self.assertEqual(response.data['items'][0]['product_name'], 'Pilau')
+
+        items = [{'product': p.pk, 'quantity': 1} for p in (self.pilau, self.chai) for _ in range(10)]
+        with CaptureQueriesContext(connection) as large:
+            response = self._order(items)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['items']), 20)
+        self.assertEqual(response.data['total_price'], '5300.00')
+        self.assertEqual(len(large), len(small))
+
+    def test_stale_price_or_wrong_item_rejects_whole_order(self):
+        response = self._order([
+            {'product': self.pilau.pk, 'quantity': 1, 'price': '400.00'},
+            {'product': self.chai.pk, 'quantity': 1},
+            {'product': self.room.pk, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual([r['status'] for r in response.data['results']], ['error', 'ok', 'error'])
+        self.assertIn('450.00', response.data['results'][0]['error'])
+
+        response = self._order([{'product': self.pilau.pk, 'quantity': 1}], hotel='other-hotel')
+        self.assertEqual(response.data['results'][0]['error'], 'Product not found.')
+        self.assertFalse(Order.objects.exists())
+
+    def test_new_order_published_on_kitchen_channel_after_commit(self):
+        with mock.patch.object(broker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            response = self._order([{'product': self.chai.pk, 'quantity': 1}])
+        publish.assert_called_once_with(f'kitchen:{self.hotel.pk}', {'order': response.data['id']})
+
+    def test_kitchen_feed_sends_open_tickets_then_resumes_from_cursor(self):
+        first = self._order([{'product': self.pilau.pk, 'quantity': 1}]).data['id']
+        served = self._order([{'product': self.chai.pk, 'quantity': 1}]).data['id']
+        Order.objects.filter(pk=served).update(status='served')
+
+        self.assertEqual(self._feed()[0].status_code, 401)
+        self.assertEqual(self._feed(User.objects.create_user(username='other'))[0].status_code, 403)
+
+        response, body = self._feed(self.chef)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn(f'id: {first}\nevent: tickets', body)
+        tickets = json.loads(body.split('data: ')[1])
+        self.assertEqual([t['id'] for t in tickets], [first])
+
+        later = [self._order([{'product': self.chai.pk, 'quantity': 2}], table=str(n)).data['id'] for n in range(3)]
+        response, body = self._feed(self.chef, HTTP_LAST_EVENT_ID=str(served))
+        self.assertEqual(body.count('event: tickets'), 1)
+        self.assertEqual([t['id'] for t in json.loads(body.split('data: ')[1])], later)
+        self.assertIn(f'id: {later[-1]}', body)
+
+    def test_members_update_status_in_one_call(self):
+        ids = [self._order([{'product': self.chai.pk, 'quantity': 1}]).data['id'] for _ in range(3)]
+        url = reverse('order-set-status')
+
+        self.client.force_authenticate(user=User.objects.create_user(username='other'))
+        response = self.client.post(url, {'ids': ids, 'status': 'ready'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.chef)
+        with mock.patch.object(broker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'ids': ids, 'status': 'ready'}, format='json')
+        self.assertEqual(response.data['updated'], 3)
+        publish.assert_called_once_with(f'kitchen:{self.hotel.pk}', {'status': 'ready', 'ids': ids})
+        self.assertEqual(set(Order.objects.values_list('status', flat=True)), {'ready'})
+
+        response = self.client.get(reverse('order-list'), {'status': 'ready'})
+        self.assertEqual(response.data['count'], 3)
+
+
+class CompressionAndRenderingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='manager', password='password')
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+        HotelUser.objects.create(user=self.user, hotel=self.hotel, is_manager=True)
+        Product.objects.bulk_create([
+            Product(hotel=self.hotel, name=f'Dish {i}', price=Decimal('350.00'), product_type='food',
+                    description='Grilled tilapia with ugali and sukuma wiki.')
+            for i in range(30)
+        ])
+
+    def _menu_page(self, **headers):
+        return self.client.get(reverse('product-list'), {'hotel': 'test-hotel', 'product_type': 'food'}, **headers)
+
+    def test_json_compressed_when_accepted_and_large_enough(self):
+        plain = self._menu_page()
+        response = self._menu_page(HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertLess(len(response.content), len(plain.content) / 4)
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+        response = self._menu_page(HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get(reverse('hotel-detail', args=[self.hotel.pk]), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streaming_export_compressed_above_threshold_only(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('product-export'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertEqual(len(body.strip().splitlines()), 31)
+
+        with override_settings(COMPRESSION_MIN_BYTES=10 ** 6):
+            response = self.client.get(reverse('product-export'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content).decode(), body)
+
+    def test_event_stream_left_alone(self):
+        response = self.client.get(reverse('hotel-events', args=[self.hotel.slug]), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_encoding_negotiation(self):
+        with mock.patch('menu_app.compression._brotli', False):
+            self.assertEqual(choose_encoding('br, gzip'), 'gzip')
+            self.assertIsNone(choose_encoding('br'))
+        with mock.patch('menu_app.compression._brotli', mock.Mock()):
+            self.assertEqual(choose_encoding('gzip, br'), 'br')
+            self.assertEqual(choose_encoding('*'), 'br')
+            self.assertEqual(choose_encoding('br;q=0, *'), 'gzip')
+        self.assertIsNone(choose_encoding('identity'))
+
+    def test_fast_encoders_match_drf_output(self):
+        data = {
+            'price': Decimal('12.50'), 'at': timezone.now(), 'day': date(2024, 5, 1),
+            'id': uuid.uuid4(), 'nested': [Decimal('1'), {'x': None}],
+        }
+        self.assertEqual(json.dumps(data, cls=FastJSONEncoder), json.dumps(data, cls=JSONEncoder))
+
+        fast, drf = PriceField(max_digits=10, decimal_places=2), serializers.DecimalField(max_digits=10, decimal_places=2)
+        for value in (Decimal('450.00'), Decimal('450'), Decimal('1.5'), Decimal('-3.10'), Decimal('0.005'), 2.5):
+            self.assertEqual(fast.to_representation(value), drf.to_representation(value), value)
+
+    @skipUnless(settings.MSGPACK_ENABLED, 'msgpack is not installed')
+    def test_messagepack_negotiated_through_accept(self):
+        import msgpack
+
+        response = self._menu_page(HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['count'], 30)
+
+
+
+class CatalogSnapshotTests(APITestCase):
+    def setUp(self):
+        clear_rate_cache()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        override = override_settings(CATALOG_SNAPSHOT_DIR=directory, CATALOG_SNAPSHOT_REBUILD_SECONDS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        snapshot._state.update(snapshot=None, file=None)
+        self.addCleanup(snapshot._state.update, snapshot=None, file=None)
+        # Rebuild in the request's thread: a background thread's connection cannot see the test transaction
+        self.start_rebuild = snapshot._start_rebuild
+        patcher = mock.patch.object(snapshot, '_start_rebuild', snapshot._try_rebuild)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        ExchangeRate.objects.create(currency='USD', rate_to_base=Decimal('130'))
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel', city='Nairobi')
+        self.other = Hotel.objects.create(name='Other Hotel', slug='other-hotel')
+        category = Category.objects.create(name='Mains', slug='mains')
+        canonical = CanonicalProduct.objects.create(name='Pilau', sku='PIL')
+        for i, (price, currency) in enumerate([('500.00', 'KES'), ('4.00', 'USD'), ('450.00', 'KES'), ('9.00', 'GBP')]):
+            Product.objects.create(
+                hotel=self.hotel, name=f'Dish {i}', sku=f'DISH-{i}', price=Decimal(price), currency=currency,
+                product_type='food', category=category, canonical=canonical, extra_meta={'spicy': i % 2 == 0},
+            )
+        Product.objects.create(hotel=self.hotel, name='Standard', price=Decimal('3000.00'), product_type='room',
+                               total_rooms=10, available_rooms=4)
+        Product.objects.create(hotel=self.other, name='Pilau Special', sku='dish-1', price=Decimal('480.00'), product_type='food')
+        Product.objects.create(hotel=self.hotel, name='Old Dish', price=Decimal('1.00'), product_type='food', is_archived=True)
+
+    def _get(self, url, params):
+        with override_settings(CATALOG_SNAPSHOT_DIR=None):
+            expected = self.client.get(url, params)
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected.json())
+        return response.json()
+
+    def test_listing_served_from_snapshot_matches_database(self):
+        url = reverse('product-list')
+        for params in [
+            {'hotel': 'TEST-HOTEL', 'product_type': 'food'},
+            {'hotel': 'test-hotel', 'product_type': 'food', 'ordering': 'price_base'},
+            {'hotel': 'test-hotel', 'product_type': 'food', 'ordering': '-price,name'},
+            {'hotel': 'test-hotel', 'product_type': 'food', 'min_price': '460', 'max_price': '600'},
+            {'hotel': 'test-hotel', 'product_type': 'rooms'},
+            {'hotel': 'missing-hotel', 'product_type': 'food'},
+            {'hotel': 'test-hotel'},
+        ]:
+            self._get(url, params)
+
+        data = self._get(url, {'hotel': 'test-hotel', 'product_type': 'food', 'ordering': 'price_base', 'min_price': '0'})
+        self.assertEqual([p['name'] for p in data['results']], ['Dish 2', 'Dish 0', 'Dish 1'])
+        with self.assertNumQueries(0):
+            self.client.get(url, {'hotel': 'test-hotel', 'product_type': 'food'})
+
+    def test_compare_served_from_snapshot(self):
+        url = reverse('product-compare')
+        data = self._get(url, {'sku': 'DISH-1'})
+        self.assertEqual([(p['hotel_slug'], p['price']) for p in data], [('other-hotel', '480.00'), ('test-hotel', '4.00')])
+        self._get(url, {'name': '  dish 0 '})
+        self._get(url, {'sku': 'dish-1', 'max_price': '500'})
+        with self.assertNumQueries(0):
+            self.client.get(url, {'sku': 'DISH-1'})
+
+    def test_catalog_writes_make_snapshot_stale(self):
+        url = reverse('product-list')
+        params = {'hotel': 'test-hotel', 'product_type': 'food'}
+        self._get(url, params)
+        token = snapshot.current_generation(settings.CATALOG_SNAPSHOT_DIR)
+
+        product = Product.objects.get(sku='DISH-0')
+        product.price = Decimal('520.00')
+        product.save()
+        self.assertNotEqual(snapshot.current_generation(settings.CATALOG_SNAPSHOT_DIR), token)
+        data = self._get(url, params)
+        self.assertEqual(data['results'][0]['price'], '520.00')
+
+        Product.objects.filter(pk=product.pk).update(available=False)
+        self.assertFalse(self._get(url, params)['results'][0]['available'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hotel.name = 'Renamed Hotel'
+            self.hotel.save()
+        self.assertEqual(self._get(url, params)['results'][0]['hotel']['name'], 'Renamed Hotel')
+
+    def test_stale_snapshot_falls_back_to_database_between_rebuilds(self):
+        url = reverse('product-list')
+        params = {'hotel': 'test-hotel', 'product_type': 'food'}
+        self._get(url, params)
+        with override_settings(CATALOG_SNAPSHOT_REBUILD_SECONDS=3600):
+            Product.objects.filter(sku='DISH-0').update(price=Decimal('999.00'))
+            self.assertIsNone(snapshot.get_snapshot())
+            data = self.client.get(url, params).json()
+        self.assertEqual(data['results'][0]['price'], '999.00')
+        self.assertIsNone(snapshot.get_snapshot())  # starts the rebuild
+        self.assertIsNotNone(snapshot.get_snapshot())
+
+    def test_stale_snapshot_rebuilt_without_blocking_requests(self):
+        release = threading.Event()
+        with mock.patch.object(snapshot, '_start_rebuild', self.start_rebuild), \
+                mock.patch.object(snapshot, '_try_rebuild', lambda directory, previous: release.wait(5)):
+            self.assertIsNone(snapshot.get_snapshot())
+            self.assertIsNone(snapshot.get_snapshot())
+            thread = snapshot._state['rebuild']
+            self.assertTrue(thread.is_alive())
+            release.set()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+
+
+class IdempotencyKeyTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='guest', password='password')
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+        self.room = Product.objects.create(
+            hotel=self.hotel, name='Standard', price=Decimal('100.00'), product_type='room', total_rooms=5, available_rooms=5
+        )
+        self.booking = {
+            'product': self.room.pk, 'guest_name': 'Guest', 'check_in': '2024-06-01', 'check_out': '2024-06-03', 'pax': 2,
+        }
+        self.client.force_authenticate(user=self.user)
+
+    def _book(self, key, data=None):
+        return self.client.post(reverse('booking-list'), data or self.booking, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retried_booking_replays_stored_response(self):
+        first = self._book('key-1')
+        retry = self._book('key-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.status_code, retry.data), (201, first.data))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Booking.objects.count(), 1)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.available_rooms, 4)
+
+        self.assertEqual(self._book('key-1', dict(self.booking, pax=3)).status_code, 422)
+        self.assertEqual(self._book('key-2').status_code, 201)
+        other = User.objects.create_user(username='other', password='password')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self._book('key-1').status_code, 201)
+        self.assertEqual(Booking.objects.count(), 3)
+
+        # Without the header nothing changes
+        self.client.post(reverse('booking-list'), self.booking, format='json')
+        self.assertEqual(Booking.objects.count(), 4)
+
+    @mock.patch('menu_app.views.send_stk_push')
+    def test_checkout_retry_does_not_push_again_unless_it_failed(self, send):
+        url = '/api/mpesa/checkout/'
+        payload = {'phone': '254700000000', 'amount': 100, 'booking': 7}
+        send.return_value = ({'errorMessage': 'Daraja unavailable'}, 502)
+        self.assertEqual(self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY='pay-1').status_code, 502)
+        send.return_value = ({'CheckoutRequestID': 'ws_CO_1'}, 200)
+        first = self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+        cache.clear()  # past the single-flight window: only the key prevents a second push
+        retry = self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+        self.assertEqual(retry.data, {'CheckoutRequestID': 'ws_CO_1'})
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(send.call_count, 2)
+        self.assertEqual(first.data, retry.data)
+
+    @mock.patch('menu_app.views.send_stk_push')
+    def test_anonymous_clients_do_not_share_keys(self, send):
+        url = '/api/mpesa/checkout/'
+        payload = {'phone': '254700000000', 'amount': 100, 'booking': 7}
+        self.client.force_authenticate(user=None)
+        send.return_value = ({'CheckoutRequestID': 'ws_CO_1'}, 200)
+        self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY='pay-1', REMOTE_ADDR='10.0.0.1')
+        cache.clear()
+        send.return_value = ({'CheckoutRequestID': 'ws_CO_2'}, 200)
+        other = self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY='pay-1', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(other.data, {'CheckoutRequestID': 'ws_CO_2'})
+        self.assertNotIn('Idempotent-Replayed', other)
+
+    def test_duplicate_waits_for_request_in_progress(self):
+        self._book('key-1')
+        # As if the first request were still running
+        row = IdempotencyKey.objects.get(key='key-1')
+        IdempotencyKey.objects.filter(pk=row.pk).update(status_code=None, response_body=None)
+
+        def first_request_finishes(seconds):
+            IdempotencyKey.objects.filter(pk=row.pk).update(status_code=201, response_body={'id': 99})
+
+        with mock.patch('menu_app.idempotency.time.sleep', side_effect=first_request_finishes) as sleep:
+            response = self._book('key-1')
+        self.assertEqual((response.status_code, response.data), (201, {'id': 99}))
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(Booking.objects.count(), 1)
+
+        IdempotencyKey.objects.filter(pk=row.pk).update(status_code=None, response_body=None)
+        with override_settings(IDEMPOTENCY_WAIT_SECONDS=0):
+            response = self._book('key-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+
+        # A claim whose worker died is taken over
+        IdempotencyKey.objects.filter(pk=row.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self._book('key-1').status_code, 201)
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_expired_keys_are_purged_and_reusable(self):
+        self._book('old')
+        self._book('fresh')
+        IdempotencyKey.objects.filter(key='old').update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = io.StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Deleted 1 expired', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['fresh'])
+
+        IdempotencyKey.objects.filter(key='fresh').update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertNotIn('Idempotent-Replayed', self._book('fresh'))
+        self.assertEqual(Booking.objects.count(), 3)
+
+
+
+class _WebhookStub(BaseHTTPRequestHandler):
+    def do_POST(self):
+        stub = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with stub.lock:
+            stub.received.append((dict(self.headers), body))
+            code = stub.responses.pop(0) if stub.responses else 200
+            stub.active += 1
+            stub.peak = max(stub.peak, stub.active)
+        time.sleep(stub.delay)
+        with stub.lock:
+            stub.active -= 1
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class OutboxTests(APITestCase):
+    def setUp(self):
+        self.stub = ThreadingHTTPServer(('127.0.0.1', 0), _WebhookStub)
+        self.stub.lock, self.stub.received, self.stub.responses = threading.Lock(), [], []
+        self.stub.active = self.stub.peak = 0
+        self.stub.delay = 0
+        threading.Thread(target=self.stub.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        self.addCleanup(self.stub.server_close)
+        self.addCleanup(self.stub.shutdown)
+        url = f'http://127.0.0.1:{self.stub.server_address[1]}/hook'
+
+        self.user = User.objects.create_user(username='guest', password='password')
+        self.hotel = Hotel.objects.create(name='Test Hotel', slug='test-hotel')
+        self.other = Hotel.objects.create(name='Other Hotel', slug='other-hotel')
+        self.room = Product.objects.create(
+            hotel=self.hotel, name='Standard', price=Decimal('100.00'), product_type='room', total_rooms=20, available_rooms=20
+        )
+        self.endpoint = WebhookEndpoint.objects.create(name='Channel manager', url=url, secret='s3cret', hotel=self.hotel)
+        WebhookEndpoint.objects.create(name='Other hotel', url=url, hotel=self.other)
+        WebhookEndpoint.objects.create(name='Payments', url=url, event_types=['payment.completed'])
+
+    def _book(self):
+        self.client.force_authenticate(user=self.user)
+        return self.client.post(reverse('booking-list'), {
+            'product': self.room.pk, 'guest_name': 'Guest', 'check_in': '2024-06-01', 'check_out': '2024-06-03',
+        }, format='json')
+
+    def _relay(self):
+        out = io.StringIO()
+        call_command('relay_outbox', '--once', stdout=out)
+        return out.getvalue()
+
+    def test_booking_event_is_written_with_the_booking(self):
+        booking_id = self._book().data['id']
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.endpoint, message.event_type), (self.endpoint, 'booking.created'))
+        self.assertEqual(message.payload['id'], booking_id)
+
+        with mock.patch('menu_app.models.record_event', side_effect=DatabaseError('outbox unavailable')):
+            with self.assertRaises(DatabaseError):
+                self._book()
+        self.assertEqual(Booking.objects.count(), 1)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.available_rooms, 19)
+
+        self.client.post(reverse('booking-bulk'), {'items': [
+            {'product': self.room.pk, 'check_in': '2024-07-01', 'check_out': '2024-07-02', 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(OutboxMessage.objects.filter(event_type='booking.created').count(), 3)
+
+    def test_relay_delivers_signed_events(self):
+        self._book()
+        self.assertIn('Delivered 1, will retry 0, failed 0.', self._relay())
+        headers, body = self.stub.received[0]
+        event = json.loads(body)
+        self.assertEqual((event['type'], event['data']['guest_name']), ('booking.created', 'Guest'))
+        self.assertEqual(headers['Idempotency-Key'], event['id'])
+        signature = hmac.new(b's3cret', body, hashlib.sha256).hexdigest()
+        self.assertEqual(headers['X-Signature'], f'sha256={signature}')
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), ('delivered', 1))
+        self.assertEqual(self._relay(), '')
+
+    def test_failed_deliveries_back_off_then_fail(self):
+        self._book()
+        self.stub.responses = [503, 200]
+        self._relay()
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts, message.last_error[:8]), ('pending', 1, 'HTTP 503'))
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        self.assertEqual(self._relay(), '')  # not due yet
+
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        self._relay()
+        self.assertEqual(OutboxMessage.objects.get().status, 'delivered')
+
+        self._book()
+        self.stub.responses = [500]
+        with override_settings(OUTBOX_MAX_ATTEMPTS=1):
+            self.assertIn('failed 1', self._relay())
+        self.assertEqual(OutboxMessage.objects.filter(status='failed').count(), 1)
+
+    def test_concurrency_is_limited_per_endpoint(self):
+        self.stub.delay = 0.05
+        for _ in range(6):
+            self._book()
+        self._relay()
+        self.assertEqual(len(self.stub.received), 6)
+        self.assertLessEqual(self.stub.peak, self.endpoint.max_concurrency)
+
+        self.stub.peak = 0
+        WebhookEndpoint.objects.filter(pk=self.endpoint.pk).update(max_concurrency=1)
+        for _ in range(3):
+            self._book()
+        self._relay()
+        self.assertEqual(self.stub.peak, 1)
+
+    def test_claimed_messages_are_not_claimed_twice(self):
+        self._book()
+        self.assertEqual(len(outbox.claim_batch(10)), 1)
+        self.assertEqual(outbox.claim_batch(10), [])
+        # The lease runs out when a relay dies mid-batch
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(len(outbox.claim_batch(10)), 1)
+
+    def test_relay_only_records_outcomes_it_still_holds_the_claim_for(self):
+        self._book()
+        messages = outbox.claim_batch(10)
+        OutboxMessage.objects.update(claim='another-relay')
+        self.assertEqual(outbox.relay_batch(messages)['delivered'], 1)
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts, message.claim), ('pending', 0, 'another-relay'))
+
+    def test_batch_stops_sending_before_its_lease_runs_out(self):
+        self._book()
+        with override_settings(OUTBOX_LEASE_SECONDS=1):
+            messages = outbox.claim_batch(10)
+        self.assertEqual(outbox.relay_batch(messages)['released'], 1)
+        self.assertEqual(self.stub.received, [])
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts, message.claim), ('pending', 0, ''))
+        self.assertEqual(len(outbox.claim_batch(10)), 1)
+
+    @override_settings(MPESA_CALLBACK_TOKEN='tok')
+    @mock.patch('menu_app.views.send_stk_push')
+    def test_mpesa_callback_queues_payment_event_once(self, send):
+        send.return_value = ({'CheckoutRequestID': 'ws_CO_1'}, 200)
+        self.client.post(reverse('mpesa-stk'), {'phone': '254700000000', 'amount': 100, 'booking': 7}, format='json')
+        callback = {'Body': {'stkCallback': {
+            'MerchantRequestID': 'm-1', 'CheckoutRequestID': 'ws_CO_1', 'ResultCode': 0, 'ResultDesc': 'Success',
+            'CallbackMetadata': {'Item': [{'Name': 'Amount', 'Value': 100}, {'Name': 'MpesaReceiptNumber', 'Value': 'QX1'}]},
+        }}}
+        url = reverse('mpesa-callback') + '?token=tok'
+
+        self.assertEqual(self.client.post(reverse('mpesa-callback'), callback, format='json').status_code, 403)
+        forged = {'Body': {'stkCallback': dict(callback['Body']['stkCallback'], CheckoutRequestID='ws_CO_forged')}}
+        self.assertEqual(self.client.post(url, forged, format='json').status_code, 200)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+        for _ in range(2):  # Daraja retries
+            self.assertEqual(self.client.post(url, callback, format='json').status_code, 200)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.event_type, 'payment.completed')
+        self.assertEqual((message.payload['receipt'], message.payload['booking']), ('QX1', 7))
+        self.assertEqual(message.event_id, uuid.uuid5(uuid.NAMESPACE_URL, 'mpesa:ws_CO_1'))
+        self.assertEqual(self.client.post(url, {'bad': 1}, format='json').status_code, 200)
+
+        with override_settings(MPESA_CALLBACK_TOKEN='', MPESA_CALLBACK_IPS=['196.201.214.200']):
+            self.assertEqual(self.client.post(reverse('mpesa-callback'), callback, format='json').status_code, 403)
@@ -0,0 +1,51 @@
+"""
+Name normalization shared by every writer and reader of `normalized_name`.
+
+normalize_name() folds case and accents (NFKD, combining marks dropped),
+turns punctuation and symbols into spaces, maps common Swahili/English
+spelling variants of menu words onto one form and collapses whitespace.
+"Café-Latté", "cafe latte" and "CAFE  LATTE!" all become "cafe latte", so
+an equality lookup on the indexed column matches them all.
+
+Changing the rules below changes stored values: run
+`manage.py renormalize_names` afterwards so lookups stay consistent.
+Migration 0018 did this once for rows written before these rules existed.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+# Token -> canonical spelling; keep keys already folded (lowercase, no accents)
+NAME_VARIANTS = {
+    'chapatti': 'chapati',
+    'chapo': 'chapati',
+    'maandazi': 'mandazi',
+    'sambusa': 'samosa',
+    'sambusas': 'samosa',
+    'samosas': 'samosa',
+    'pilaf': 'pilau',
+    'nyamachoma': 'nyama choma',
+    'chips': 'fries',
+    'chipsi': 'fries',
+    'kahawa': 'coffee',
+    'chai': 'tea',
+    'kuku': 'chicken',
+    'samaki': 'fish',
+    'juisi': 'juice',
+    'expresso': 'espresso',
+    'capuccino': 'cappuccino',
+}
+
+_SEPARATORS = re.compile(r'[\W_]+')
+_MAX_LENGTH = 255
+
+
+@lru_cache(maxsize=65536)
+def normalize_name(value):
+    """Return the lookup form of a product/canonical name ('' for None)."""
+    if not value:
+        return ''
+    folded = unicodedata.normalize('NFKD', value).casefold()
+    folded = ''.join(ch for ch in folded if not unicodedata.combining(ch))
+    tokens = _SEPARATORS.sub(' ', folded).split()
+    return ' '.join(NAME_VARIANTS.get(token, token) for token in tokens)[:_MAX_LENGTH]
@@ -0,0 +1,202 @@
+"""
+Throttles and single-flight request coalescing for the public endpoints
+(M-Pesa STK push, availability check).
+
+Both keep their state in Django's default cache, which must be shared by
+every worker (see the menu_app.E002 deploy check): sync gunicorn workers
+serve one request each, so only the cache can see two requests at once.
+
+Rates use DRF's "<n>/<period>" format from
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']: a client may make n requests in
+any sliding period, so short bursts pass while the sustained rate is capped,
+as with a bucket of n tokens refilled over the period. Requests are counted
+with cache.incr, which is atomic, so simultaneous retries each see a
+different count instead of all reading the same one. The client address is
+REMOTE_ADDR unless REST_FRAMEWORK['NUM_PROXIES'] says how many proxies'
+X-Forwarded-For entries to trust.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'5/min' -> (5, 60); None -> (None, None)."""
+    if rate is None:
+        return None, None
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+def client_ip(request):
+    """The client's address: REMOTE_ADDR, or DRF's X-Forwarded-For reading when NUM_PROXIES is set."""
+    # X-Forwarded-For is client-controlled unless a known number of proxies appended to it
+    if api_settings.NUM_PROXIES is None:
+        return request.META.get('REMOTE_ADDR')
+    return BaseThrottle().get_ident(request)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    scope = None
+    # Request attributes each get their own bucket; a request must pass all of them
+    key_fields = ('ip',)
+
+    def __init__(self):
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope) if self.scope else None
+        self.capacity, self.period = parse_rate(rate)
+        self._wait = None
+
+    def get_ident(self, request):
+        return client_ip(request)
+
+    def get_identities(self, request):
+        # A JSON list (or any non-object body) carries no phone/booking/product
+        data = request.data if isinstance(request.data, dict) else {}
+        identities = []
+        for field in self.key_fields:
+            if field == 'ip':
+                value = self.get_ident(request)
+            else:
+                value = data.get(field) or request.query_params.get(field)
+            if value:
+                identities.append(f'{field}:{value}')
+        return identities
+
+    def allow_request(self, request, view):
+        if self.capacity is None:
+            return True
+        window, elapsed = divmod(time.time(), self.period)
+        window = int(window)
+        # The previous window's count fades out as this one fills: a sliding period
+        weight = 1 - elapsed / self.period
+        keys = [f'throttle:{self.scope}:{identity}' for identity in self.get_identities(request)]
+        previous = cache.get_many([f'{key}:{window - 1}' for key in keys])
+        taken = []
+        for key in keys:
+            counter = f'{key}:{window}'
+            cache.add(counter, 0, self.period * 2)
+            count = cache.incr(counter)
+            taken.append(counter)
+            earlier = previous.get(f'{key}:{window - 1}', 0)
+            used = earlier * weight + count
+            if used > self.capacity:
+                # Hand back what this request took, so a rejected request costs nothing
+                for counter in taken:
+                    try:
+                        cache.decr(counter)
+                    except ValueError:
+                        pass  # expired meanwhile
+                remaining = self.period - elapsed
+                self._wait = remaining if not earlier else min(remaining, (used - self.capacity) * self.period / earlier)
+                return False
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class StkPushThrottle(TokenBucketThrottle):
+    scope = 'stk_push'
+    key_fields = ('ip', 'phone', 'booking')
+
+
+class AvailabilityThrottle(TokenBucketThrottle):
+    scope = 'availability'
+    key_fields = ('ip', 'product')
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time across all workers; concurrent
+    callers with the same key wait and receive the first caller's result.
+    Threads of one process wait on an Event; other workers wait on a lock
+    taken with cache.add and read the result the leader leaves under the
+    lock's token. A caller whose leader fails or takes longer than
+    SINGLEFLIGHT_WAIT_SECONDS runs the call itself. With `ttl`, the result
+    is also kept in the cache so retries shortly after still share it;
+    `cache_if` decides which results are worth keeping (e.g. successes only).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, ttl=0, cache_if=None):
+        cache_key = f'singleflight:{key}'
+        if ttl:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'event': threading.Event(), 'result': None, 'error': None}
+
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = self._shared(cache_key, fn, ttl, cache_if)
+            return call['result']
+        except Exception as exc:
+            call['error'] = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call['event'].set()
+
+    def _shared(self, cache_key, fn, ttl, cache_if):
+        """Run `fn` once for all workers calling with `cache_key` at the same time."""
+        wait = settings.SINGLEFLIGHT_WAIT_SECONDS
+        lock_key = f'{cache_key}:lock'
+        token = uuid.uuid4().hex
+        if not cache.add(lock_key, token, wait):
+            found, result = self._await_leader(cache_key, lock_key, wait)
+            if found:
+                return result
+            cache.add(lock_key, token, wait)  # the leader gave up; lead unless someone else already does
+        try:
+            result = fn()
+            # Handed to this flight's waiters even when it is not worth keeping for later retries
+            cache.set(f'{cache_key}:{token}', (result,), wait)
+            if ttl and (cache_if is None or cache_if(result)):
+                cache.set(cache_key, result, ttl)
+            return result
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    def _await_leader(self, cache_key, lock_key, wait):
+        """(True, result) once another worker's call finishes, else (False, None)."""
+        leader = cache.get(lock_key)
+        deadline = time.monotonic() + wait
+        delay = 0.02
+        while leader is not None:
+            shared = cache.get(f'{cache_key}:{leader}')
+            if shared is not None:
+                return True, shared[0]
+            if cache.get(lock_key) != leader:
+                # Released: either the result was stored just now or the call failed
+                shared = cache.get(f'{cache_key}:{leader}')
+                return (True, shared[0]) if shared is not None else (False, None)
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 0.25)
+        return False, None
+
+
+singleflight = SingleFlight()
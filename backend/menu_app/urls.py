@@ -1,15 +1,22 @@
 from django.urls import path, include
 from rest_framework import routers
-from .views import HotelViewSet, ProductViewSet, CategoryViewSet, CanonicalViewSet, ProductCSVUploadView, BookingViewSet, AvailabilityCheck, mpesa_stk_push
+from .views import HotelViewSet, ProductViewSet, CategoryViewSet, CanonicalViewSet, ProductCSVUploadView, BookingViewSet, AvailabilityCheck, mpesa_stk_push, mpesa_callback, HotelMenuView, CatalogSyncView, hotel_events, HotelStatsView, OrderViewSet, kitchen_feed
 router = routers.DefaultRouter()
 router.register(r'hotels', HotelViewSet)
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'categories', CategoryViewSet)
 router.register(r'canonicals', CanonicalViewSet)
 router.register(r'bookings', BookingViewSet, basename='booking')
+router.register(r'orders', OrderViewSet, basename='order')
 urlpatterns = router.urls + [
+    path('hotels/<slug:slug>/menu/', HotelMenuView.as_view(), name='hotel-menu'),
+    path('hotels/<slug:slug>/events/', hotel_events, name='hotel-events'),
+    path('hotels/<slug:slug>/kitchen/', kitchen_feed, name='kitchen-feed'),
+    path('hotels/<slug:slug>/stats/', HotelStatsView.as_view(), name='hotel-stats'),
     path('products/upload-csv/', ProductCSVUploadView.as_view(), name='products-upload-csv'),
     path('availability/', AvailabilityCheck.as_view(), name='availability'),
+    path('sync/', CatalogSyncView.as_view(), name='catalog-sync'),
     path('payments/mpesa/stk_push/', mpesa_stk_push, name='mpesa-stk'),
     path("mpesa/checkout/", mpesa_stk_push),
+    path("mpesa/callback/", mpesa_callback, name='mpesa-callback'),
 ]
@@ -1,22 +1,68 @@
-from rest_framework import viewsets, permissions, filters, status
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework import viewsets, mixins, permissions, filters, status
+from rest_framework.decorators import action, api_view, permission_classes, throttle_classes
 from rest_framework.views import APIView
+from rest_framework.request import Request
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError, APIException
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, F, Sum, Value
 from django.conf import settings
-from .models import Hotel, Product, Category, CanonicalProduct, Booking
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.http import StreamingHttpResponse, Http404, JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from .models import (
+    Hotel, Product, Category, CanonicalProduct, Booking, CatalogChange, BookingRollup, ArchivedBooking, Order,
+    MpesaCheckout,
+)
+from .models import product_event
+from .permissions import get_hotel_ids, is_hotel_member, IsHotelMemberOrReadOnly
+from .pricing import quote_products
+from .throttling import AvailabilityThrottle, StkPushThrottle, singleflight
+from .events import broker, format_sse
+from .exports import (
+    streaming_export, PRODUCT_EXPORT_FIELDS, BOOKING_EXPORT_FIELDS, ARCHIVED_BOOKING_EXPORT_FIELDS, EXPORT_FORMATS
+)
 from .serializers import (
     HotelSerializer,
     ProductSerializer,
     CategorySerializer,
     CanonicalProductSerializer,
-    BookingSerializer
+    BookingSerializer,
+    MenuItemSerializer,
+    ArchivedBookingSerializer,
+    BookingSummarySerializer,
+    BulkBookingSerializer,
+    ProductBulkUpdateSerializer,
+    OrderSerializer,
+    OrderCreateSerializer,
+    OrderStatusSerializer
+)
+from .bookings import allocate_bulk, AllocationError
+from .bulk import bulk_update_products
+from .orders import (
+    place_order, set_order_status, ticket_batches, kitchen_channel, OrderError, KITCHEN_BATCH_WINDOW
 )
-import csv, io, requests, base64
-from datetime import datetime
-from decimal import Decimal
+from .mpesa import send_stk_push
+from .idempotency import idempotent
+from .outbox import record_event
+from .text import normalize_name
+from .snapshot import get_snapshot, in_price_range, order_products
+from .geo import covering_cells, haversine_km, CELL_END
+import io
+from datetime import timedelta
+from itertools import groupby
+import asyncio
+import hmac
+import logging
+import uuid
+from decimal import Decimal, InvalidOperation
+
+logger = logging.getLogger(__name__)
 
 
 # HELPERS
@@ -32,12 +78,208 @@ def normalize_type(value: str):
     return v
 
 
+def price_range(request):
+    """?min_price=&max_price= (in settings.BASE_CURRENCY) as Decimals; a missing bound is None."""
+    bounds = []
+    for param in ('min_price', 'max_price'):
+        raw = request.query_params.get(param)
+        try:
+            bounds.append(Decimal(raw) if raw else None)
+        except InvalidOperation:
+            raise ValidationError({param: 'Must be a number.'})
+    return bounds
+
+
+def price_range_filter(qs, request):
+    """Apply ?min_price=&max_price= against the indexed price_base column."""
+    low, high = price_range(request)
+    if low is not None:
+        qs = qs.filter(price_base__gte=low)
+    if high is not None:
+        qs = qs.filter(price_base__lte=high)
+    return qs
+
+
+def export_filters(request):
+    """
+    Read the shared export query params (?hotel=&from=&to=&status=&export_format=).
+    `format` is reserved by DRF for renderer negotiation, hence `export_format`.
+    """
+    params = request.query_params
+    export_format = (params.get('export_format') or 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"export_format must be one of: {', '.join(EXPORT_FORMATS)}")
+
+    dates = {}
+    for key in ('from', 'to'):
+        raw = params.get(key)
+        if raw:
+            value = parse_date(raw)
+            if value is None:
+                raise ValueError(f"Invalid date for '{key}', expected YYYY-MM-DD")
+            dates[key] = value
+
+    statuses = [s.strip() for s in (params.get('status') or '').split(',') if s.strip()]
+    return {
+        'hotel': params.get('hotel') or params.get('hotel_slug'),
+        'from': dates.get('from'),
+        'to': dates.get('to'),
+        'statuses': statuses,
+        'export_format': export_format,
+    }
+
+
 
 # HOTEL VIEWSET
 class HotelViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Hotel.objects.all()
     serializer_class = HotelSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    NEARBY_DEFAULT_RADIUS_KM = 5
+    NEARBY_MAX_RADIUS_KM = 200
+    NEARBY_MAX_LIMIT = 100
+
+    @action(detail=False, methods=['get'], url_path='nearby')
+    def nearby(self, request):
+        """
+        GET /api/hotels/nearby/?lat=-1.28&lng=36.82&radius=5&limit=20
+        Hotels within `radius` km, nearest first. Candidates come from the geohash
+        cells around the point (index range scans); exact distances only for those.
+        """
+        params = request.query_params
+        try:
+            lat, lng = float(params['lat']), float(params['lng'])
+            radius = float(params.get('radius', self.NEARBY_DEFAULT_RADIUS_KM))
+            limit = int(params.get('limit', 20))
+        except KeyError:
+            return Response({"detail": "lat and lng are required"}, status=400)
+        except ValueError:
+            return Response({"detail": "lat, lng, radius and limit must be numbers"}, status=400)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return Response({"detail": "lat/lng out of range"}, status=400)
+        if not 0 < radius <= self.NEARBY_MAX_RADIUS_KM:
+            return Response({"detail": f"radius must be between 0 and {self.NEARBY_MAX_RADIUS_KM} km"}, status=400)
+        limit = min(max(limit, 1), self.NEARBY_MAX_LIMIT)
+
+        qs = Hotel.objects.exclude(geohash='')
+        cells = covering_cells(lat, lng, radius)
+        if cells is not None:
+            in_cells = Q()
+            for cell in cells:
+                in_cells |= Q(geohash__gte=cell, geohash__lt=cell + CELL_END)
+            qs = qs.filter(in_cells)
+
+        matches = []
+        for hotel in qs:
+            distance = haversine_km(lat, lng, float(hotel.latitude), float(hotel.longitude))
+            if distance <= radius:
+                matches.append((distance, hotel))
+        matches.sort(key=lambda m: (m[0], m[1].pk))
+
+        context = self.get_serializer_context()
+        return Response([
+            dict(HotelSerializer(hotel, context=context).data, distance_km=round(distance, 3))
+            for distance, hotel in matches[:limit]
+        ])
+
+
+# HOTEL MENU (grouped by category, unpaginated)
+class HotelMenuView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, slug):
+        product_type = normalize_type(request.query_params.get('product_type')) or 'food'
+
+        products = list(
+            Product.objects.filter(
+                hotel__slug=slug,
+                product_type=product_type,
+                is_archived=False
+            )
+            .select_related('hotel', 'category', 'canonical')
+            .order_by(F('category__name').asc(nulls_last=True), 'category_id', 'name', 'id')
+        )
+
+        hotel = products[0].hotel if products else get_object_or_404(Hotel, slug=slug)
+        context = {'request': request}
+
+        categories = []
+        for category, items in groupby(products, key=lambda p: p.category):
+            items = list(items)
+            prices = [p.price for p in items]
+            categories.append({
+                'id': category.id if category else None,
+                'name': category.name if category else 'Other',
+                'slug': category.slug if category else None,
+                'count': len(items),
+                'min_price': min(prices),
+                'max_price': max(prices),
+                'products': MenuItemSerializer(items, many=True, context=context).data,
+            })
+
+        return Response({
+            'hotel': HotelSerializer(hotel, context=context).data,
+            'product_type': product_type,
+            'count': len(products),
+            'categories': categories,
+        })
+
+
+# HOTEL DASHBOARD STATS (served from BookingRollup, never scans Booking)
+class HotelStatsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    DEFAULT_DAYS = 30
+
+    def get(self, request, slug):
+        hotel = get_object_or_404(Hotel, slug=slug)
+        if not (request.user.is_staff or is_hotel_member(request, hotel.pk)):
+            raise PermissionDenied("You are not a member of that hotel.")
+
+        params = request.query_params
+        try:
+            date_to = parse_date(params.get('to') or '') or timezone.localdate()
+            date_from = parse_date(params.get('from') or '') or date_to - timedelta(days=self.DEFAULT_DAYS - 1)
+        except ValueError:
+            return Response({'detail': "'from' and 'to' must be valid dates (YYYY-MM-DD)"}, status=400)
+        if date_from > date_to:
+            return Response({'detail': "'from' must be on or before 'to'"}, status=400)
+
+        rollups = BookingRollup.objects.filter(hotel=hotel, day__gte=date_from, day__lte=date_to)
+        totals_fields = {
+            'bookings': Sum('bookings'),
+            'revenue': Sum('revenue'),
+            'cancellations': Sum('cancellations'),
+            'room_nights': Sum('room_nights'),
+        }
+        capacity = Product.objects.filter(
+            hotel=hotel, product_type='room', is_archived=False
+        ).aggregate(rooms=Sum('total_rooms'))['rooms'] or 0
+
+        days = []
+        for row in rollups.values('day').annotate(**totals_fields).order_by('day'):
+            row['occupancy'] = round(row['room_nights'] / capacity, 4) if capacity else None
+            days.append(row)
+
+        room_types = list(
+            rollups.values('product', name=F('product__name'))
+            .annotate(**totals_fields)
+            .order_by('-revenue', 'product')
+        )
+
+        totals = rollups.aggregate(**totals_fields)
+        totals = {k: v or 0 for k, v in totals.items()}
+        span = (date_to - date_from).days + 1
+        totals['occupancy'] = round(totals['room_nights'] / (capacity * span), 4) if capacity else None
+
+        return Response({
+            'hotel': hotel.slug,
+            'from': date_from,
+            'to': date_to,
+            'room_capacity': capacity,
+            'totals': totals,
+            'days': days,
+            'room_types': room_types,
+        })
 
 
 # CATEGORY VIEWSET
@@ -58,68 +300,206 @@ class CanonicalViewSet(viewsets.ModelViewSet):
 # PRODUCT VIEWSET
 class ProductViewSet(viewsets.ModelViewSet):
     serializer_class = ProductSerializer
-    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    permission_classes = [IsHotelMemberOrReadOnly]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description', 'normalized_name', 'sku']
-    ordering_fields = ['price', 'name']
+    ordering_fields = ['price', 'price_base', 'name']
 
     def get_serializer(self, *args, **kwargs):
         kwargs['context'] = self.get_serializer_context()
         return super().get_serializer(*args, **kwargs)
 
+    def list_params(self):
+        params = self.request.query_params
+        return params.get('hotel') or params.get('hotel_slug'), normalize_type(params.get('product_type'))
+
     def get_queryset(self):
         pk = self.kwargs.get('pk')
         if pk:
             return Product.objects.filter(pk=pk)
 
-        hotel_slug = (
-            self.request.query_params.get('hotel') or
-            self.request.query_params.get('hotel_slug')
-        )
-        raw_type = self.request.query_params.get('product_type')
-        product_type = normalize_type(raw_type)
+        hotel_slug, product_type = self.list_params()
 
         # If neither hotel_slug nor product_type present, return empty to avoid mixing types
         if not hotel_slug or not product_type:
             return Product.objects.none()
 
-        return Product.objects.filter(
+        qs = Product.objects.filter(
             hotel__slug__iexact=hotel_slug,
             product_type__iexact=product_type,
             is_archived=False
         )
+        return price_range_filter(qs, self.request)
+
+    def list(self, request, *args, **kwargs):
+        """Served from the shared catalog snapshot when it is current; ?search= always queries the database."""
+        snapshot = None if request.query_params.get('search') else get_snapshot()
+        if snapshot is None:
+            return super().list(request, *args, **kwargs)
+
+        hotel_slug, product_type = self.list_params()
+        hotel = snapshot.hotel_index(hotel_slug) if hotel_slug and product_type else None
+        indexes = snapshot.hotel_products(hotel, product_type) if hotel is not None else []
+        indexes = in_price_range(snapshot, indexes, *price_range(request))
+        ordering = [
+            f for f in (request.query_params.get(filters.OrderingFilter.ordering_param) or '').split(',')
+            if f.strip().lstrip('-') in self.ordering_fields
+        ]
+        indexes = order_products(snapshot, indexes, [f.strip() for f in ordering])
+
+        page = self.paginate_queryset(indexes)
+        rows = page if page is not None else indexes
+        data = [snapshot.product(i).represent(request) for i in rows]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
 
     def perform_create(self, serializer):
         pt = normalize_type(serializer.validated_data.get("product_type"))
         serializer.validated_data["product_type"] = pt
 
         hotel = serializer.validated_data['hotel']
-        if not hotel.users.filter(user=self.request.user).exists():
+        if not is_hotel_member(self.request, hotel.pk):
             raise PermissionDenied("You are not a member of that hotel.")
         serializer.save()
 
+    def perform_update(self, serializer):
+        # The object permission covers the current hotel; moving the product needs membership of the new one too
+        hotel = serializer.validated_data.get('hotel')
+        if hotel is not None and hotel.pk != serializer.instance.hotel_id and not is_hotel_member(self.request, hotel.pk):
+            raise PermissionDenied("You are not a member of that hotel.")
+        serializer.save()
+
+    @action(detail=False, methods=['post'], url_path='bulk_update', permission_classes=[permissions.IsAuthenticated])
+    def bulk_update(self, request):
+        """
+        POST /api/products/bulk_update/  {"ids": [1, 2, ...], "price_percent": 10, "available": true, ...}
+        Accepts one of price_percent / price_delta / price, plus available, is_archived and category.
+        Every product must belong to one of the user's hotels; otherwise nothing is changed.
+        """
+        serializer = ProductBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        changes = dict(serializer.validated_data)
+        ids = set(changes.pop('ids'))
+
+        found = dict(Product.objects.filter(pk__in=ids).values_list('pk', 'hotel_id'))
+        missing = sorted(ids - set(found))
+        if missing:
+            return Response({"detail": "Unknown products.", "ids": missing}, status=400)
+        if not request.user.is_staff:
+            member_of = get_hotel_ids(request.user, request)
+            forbidden = sorted(pk for pk, hotel_id in found.items() if hotel_id not in member_of)
+            if forbidden:
+                return Response(
+                    {"detail": "You are not a member of the hotels of these products.", "ids": forbidden},
+                    status=status.HTTP_403_FORBIDDEN,
+                )
+
+        per_hotel = bulk_update_products(Product.objects.filter(pk__in=ids), changes)
+        return Response({'updated': sum(per_hotel.values()), 'hotels': len(per_hotel)})
+
     @action(detail=False, methods=['get'], url_path='compare')
     def compare(self, request):
         sku = request.query_params.get('sku')
         name = request.query_params.get('name')
 
-        qs = Product.objects.filter(is_archived=False)
+        if not sku and not name:
+            return Response({"detail": "Provide ?sku=... or ?name=..."}, status=400)
+
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            indexes = snapshot.lookup('sku', sku.lower()) if sku else snapshot.lookup('name', normalize_name(name))
+            indexes = in_price_range(snapshot, indexes, *price_range(request))
+            indexes = order_products(snapshot, indexes, ['price_base', 'price'], nulls_largest=True)
+            return Response([snapshot.product(i).represent(request) for i in indexes])
 
+        qs = Product.objects.filter(is_archived=False)
         if sku:
             qs = qs.filter(sku__iexact=sku)
-        elif name:
-            norm = ''.join(e for e in name.lower() if e.isalnum() or e.isspace()).strip()
-            qs = qs.filter(normalized_name=norm)
         else:
-            return Response({"detail": "Provide ?sku=... or ?name=..."}, status=400)
+            qs = qs.filter(normalized_name=normalize_name(name))
 
+        # Compare across currencies on the base-currency price; unconvertible prices sort last
+        qs = price_range_filter(qs, request)
         serializer = ProductSerializer(
-            qs.select_related('hotel', 'category').order_by('price'),
+            qs.select_related('hotel', 'category', 'canonical')
+              .order_by(F('price_base').asc(nulls_last=True), 'price'),
             many=True,
             context={'request': request}
         )
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], url_path='quote')
+    def quote(self, request):
+        """
+        GET /api/products/quote/?hotel=<slug>&check_in=YYYY-MM-DD&check_out=YYYY-MM-DD
+        Prices the stay for every available room in the hotel from its rate plans.
+        """
+        hotel_slug = request.query_params.get('hotel') or request.query_params.get('hotel_slug')
+        try:
+            check_in = parse_date(request.query_params.get('check_in') or '')
+            check_out = parse_date(request.query_params.get('check_out') or '')
+        except ValueError:
+            return Response({"detail": "check_in and check_out must be valid dates"}, status=400)
+        if not (hotel_slug and check_in and check_out):
+            return Response({"detail": "Provide ?hotel=, ?check_in= and ?check_out= (YYYY-MM-DD)"}, status=400)
+        if check_out < check_in:
+            return Response({"detail": "check_out must not be before check_in"}, status=400)
+        # Each room's calendar has one entry per night
+        if (check_out - check_in).days > settings.MAX_QUOTE_NIGHTS:
+            return Response({"detail": f"Stays are quoted for at most {settings.MAX_QUOTE_NIGHTS} nights"}, status=400)
+
+        rooms = list(Product.objects.filter(
+            hotel__slug=hotel_slug, product_type='room', is_archived=False, available=True
+        ).only('id', 'name', 'price', 'currency', 'available_rooms').order_by('price', 'id'))
+        quotes = quote_products(rooms, check_in, check_out)
+        include_nightly = request.query_params.get('nightly') in ('1', 'true')
+
+        results = []
+        for room in rooms:
+            total, calendar = quotes[room.pk]
+            row = {
+                'product': room.pk,
+                'name': room.name,
+                'currency': room.currency,
+                'available_rooms': room.available_rooms,
+                'nights': len(calendar),
+                'total_price': total,
+            }
+            if include_nightly:
+                row['nightly'] = [
+                    {'date': check_in + timedelta(days=i), 'price': price} for i, price in enumerate(calendar)
+                ]
+            results.append(row)
+        return Response(results)
+
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[permissions.IsAuthenticated])
+    def export(self, request):
+        try:
+            opts = export_filters(request)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
+
+        qs = Product.objects.all()
+        if not request.user.is_staff:
+            qs = qs.filter(hotel_id__in=get_hotel_ids(request.user, request))
+        if opts['hotel']:
+            qs = qs.filter(hotel__slug=opts['hotel'])
+        if opts['from']:
+            qs = qs.filter(updated_at__date__gte=opts['from'])
+        if opts['to']:
+            qs = qs.filter(updated_at__date__lte=opts['to'])
+        product_type = normalize_type(request.query_params.get('product_type'))
+        if product_type:
+            qs = qs.filter(product_type=product_type)
+        # Product "status" is its archive state: ?status=active or ?status=archived
+        if opts['statuses'] == ['active']:
+            qs = qs.filter(is_archived=False)
+        elif opts['statuses'] == ['archived']:
+            qs = qs.filter(is_archived=True)
+
+        return streaming_export(qs, PRODUCT_EXPORT_FIELDS, opts['export_format'], 'products')
+
     @action(detail=True, methods=['post'], parser_classes=[MultiPartParser], url_path='upload_image')
     def upload_image(self, request, pk=None):
         product = self.get_object()
@@ -141,6 +521,8 @@ class ProductCSVUploadView(APIView):
         if not f:
             return Response({'detail': 'file required'}, status=400)
 
+        import csv
+
         content = f.read().decode('utf-8')
         reader = csv.DictReader(io.StringIO(content))
 
@@ -148,7 +530,7 @@ class ProductCSVUploadView(APIView):
 
         for row in reader:
             hotel = Hotel.objects.filter(slug=row['hotel_slug']).first()
-            if not hotel:
+            if not hotel or not is_hotel_member(request, hotel.pk):
                 skipped += 1
                 continue
 
@@ -177,6 +559,8 @@ class ProductCSVUploadView(APIView):
 
 # AVAILABILITY CHECK
 class AvailabilityCheck(APIView):
+    throttle_classes = [AvailabilityThrottle]
+
     def get(self, request):
         product_id = request.query_params.get('product')
         check_in = request.query_params.get('check_in')
@@ -185,56 +569,433 @@ class AvailabilityCheck(APIView):
         if not (product_id and check_in and check_out):
             return Response({'detail': 'Missing fields'}, status=400)
 
-        qs = Booking.objects.filter(
-            product_id=product_id,
-            status__in=['pending', 'confirmed']
-        ).filter(~(Q(check_out__lte=check_in) | Q(check_in__gte=check_out)))
+        def overlapping_exists():
+            return Booking.objects.filter(
+                product_id=product_id,
+                status__in=['pending', 'confirmed']
+            ).filter(~(Q(check_out__lte=check_in) | Q(check_in__gte=check_out))).exists()
+
+        # Identical concurrent checks share one query
+        taken = singleflight.do(f'availability:{product_id}:{check_in}:{check_out}', overlapping_exists)
+        return Response({'available': not taken})
+
+
+
+# DELTA SYNC (kiosks / POS tablets)
+class CatalogSyncView(APIView):
+    """
+    GET /api/sync/?since=<cursor>[&hotel=<slug>][&limit=]
+    Returns hotels, categories and products changed after `since`, plus tombstones
+    for deletions and archived products. Reads only the change log rows past the
+    cursor, so a poll costs O(changes), not O(catalog).
+    """
+    permission_classes = [permissions.AllowAny]
+    DEFAULT_LIMIT = 500
+    MAX_LIMIT = 5000
+
+    def get(self, request):
+        try:
+            since = int(request.query_params.get('since') or 0)
+            limit = min(int(request.query_params.get('limit') or self.DEFAULT_LIMIT), self.MAX_LIMIT)
+        except ValueError:
+            return Response({'detail': 'since and limit must be integers'}, status=400)
+        if since < 0 or limit < 1:
+            return Response({'detail': 'since must be >= 0 and limit >= 1'}, status=400)
+
+        changes = CatalogChange.objects.filter(id__gt=since)
+        hotel_slug = request.query_params.get('hotel') or request.query_params.get('hotel_slug')
+        if hotel_slug:
+            hotel = get_object_or_404(Hotel, slug=hotel_slug)
+            changes = changes.filter(Q(hotel_id=hotel.pk) | Q(hotel_id__isnull=True))
+
+        rows = list(changes.order_by('id').values_list('id', 'entity', 'object_id', 'action')[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        # Keep only the latest action per object within this page
+        latest = {}
+        for _, entity, object_id, action in rows:
+            latest[(entity, object_id)] = action
+
+        upserts = {'hotel': [], 'category': [], 'product': []}
+        tombstones = []
+        for (entity, object_id), action in latest.items():
+            if action == 'upsert':
+                upserts[entity].append(object_id)
+            else:
+                tombstones.append({'type': entity, 'id': object_id, 'reason': action})
 
-        return Response({'available': not qs.exists()})
+        context = {'request': request}
+        products = (
+            Product.objects.filter(pk__in=upserts['product'], is_archived=False)
+            .select_related('hotel', 'category', 'canonical')
+        )
+        return Response({
+            'cursor': rows[-1][0] if rows else since,
+            'has_more': has_more,
+            'hotels': HotelSerializer(
+                Hotel.objects.filter(pk__in=upserts['hotel']), many=True, context=context
+            ).data,
+            'categories': CategorySerializer(
+                Category.objects.filter(pk__in=upserts['category']), many=True
+            ).data,
+            'products': ProductSerializer(products, many=True, context=context).data,
+            'tombstones': tombstones,
+        })
+
+
+# LIVE HOTEL EVENTS (Server-Sent Events)
+SSE_HEARTBEAT_SECONDS = 15
+SSE_RETRY_MS = 3000
 
 
+async def hotel_events(request, slug):
+    """
+    GET /api/hotels/<slug>/events/
+    Sends a `snapshot` of current availability, then `product` events as rooms
+    and prices change. Served as a long-lived async stream under ASGI; under WSGI
+    the snapshot is sent and the stream closes so EventSource reconnects
+    instead of pinning a sync worker.
+    """
+    hotel_id = await Hotel.objects.filter(slug=slug).values_list('pk', flat=True).afirst()
+    if hotel_id is None:
+        raise Http404("Hotel not found")
+
+    snapshot = [
+        product_event(p) async for p in Product.objects.filter(hotel_id=hotel_id, is_archived=False).only(
+            'id', 'product_type', 'price', 'currency', 'available',
+            'available_rooms', 'total_rooms', 'is_archived'
+        )
+    ]
+
+    async def stream():
+        queue = broker.subscribe(hotel_id)
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            yield format_sse('snapshot', snapshot)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse('product', event)
+        finally:
+            broker.unsubscribe(hotel_id, queue)
+
+    def snapshot_only():
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        yield format_sse('snapshot', snapshot)
+
+    body = stream() if isinstance(request, ASGIRequest) else snapshot_only()
+    response = StreamingHttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# KITCHEN DISPLAY FEED (Server-Sent Events, new tickets in batches)
+def kitchen_access(request, hotel_id):
+    """Authenticate a plain Django request with the API's authenticators; None when allowed, else a status code."""
+    drf_request = Request(request, authenticators=APIView().get_authenticators())
+    try:
+        user = drf_request.user
+    except APIException:
+        return 401
+    if not user or not user.is_authenticated:
+        return 401
+    if user.is_staff or is_hotel_member(drf_request, hotel_id):
+        return None
+    return 403
+
+
+async def kitchen_feed(request, slug):
+    """
+    GET /api/hotels/<slug>/kitchen/  (hotel members)
+    Sends open tickets first, then `tickets` batches of new orders and `status`
+    events as orders move on. Each batch carries the last order id as the SSE
+    id, so a reconnecting display (Last-Event-ID, or ?after=<id>) receives
+    exactly the orders it missed. Under WSGI the pending batches are sent and
+    the stream closes; the display then reconnects every SSE_RETRY_MS.
+    """
+    hotel_id = await Hotel.objects.filter(slug=slug).values_list('pk', flat=True).afirst()
+    if hotel_id is None:
+        raise Http404("Hotel not found")
+    denied = await sync_to_async(kitchen_access)(request, hotel_id)
+    if denied:
+        return JsonResponse({"detail": "You are not a member of that hotel."}, status=denied)
+
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('after')
+    try:
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return JsonResponse({"detail": "after must be an order id"}, status=400)
+
+    def serialize(batch):
+        return format_sse('tickets', OrderSerializer(batch, many=True).data, event_id=batch[-1].pk)
+
+    # Subscribe before reading the backlog so orders placed in between are not missed
+    queue = broker.subscribe(kitchen_channel(hotel_id)) if isinstance(request, ASGIRequest) else None
+    backlog = []
+    if cursor is None:
+        # First connect: every open ticket, then continue after the newest order
+        latest = await Order.objects.filter(hotel_id=hotel_id).order_by('-id').values_list('pk', flat=True).afirst()
+        cursor = latest or 0
+        async for batch in ticket_batches(hotel_id, 0, until=cursor, open_only=True):
+            backlog.append(serialize(batch))
+        if not backlog:
+            backlog.append(format_sse('tickets', [], event_id=cursor))
+    else:
+        async for batch in ticket_batches(hotel_id, cursor):
+            backlog.append(serialize(batch))
+            cursor = batch[-1].pk
+
+    async def stream(cursor):
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            for chunk in backlog:
+                yield chunk
+            while True:
+                try:
+                    events = [await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)]
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    # A lost event (another worker, a broker hiccup) must not hide an order for good
+                    async for batch in ticket_batches(hotel_id, cursor):
+                        yield serialize(batch)
+                        cursor = batch[-1].pk
+                    continue
+                # Let the rest of a rush arrive, then answer all of it with one query
+                await asyncio.sleep(KITCHEN_BATCH_WINDOW)
+                while not queue.empty():
+                    events.append(queue.get_nowait())
+                for event in events:
+                    if 'status' in event:
+                        yield format_sse('status', event)
+                if any('order' in event for event in events):
+                    async for batch in ticket_batches(hotel_id, cursor):
+                        yield serialize(batch)
+                        cursor = batch[-1].pk
+        finally:
+            broker.unsubscribe(kitchen_channel(hotel_id), queue)
+
+    def backlog_only():
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        yield from backlog
+
+    body = stream(cursor) if queue is not None else backlog_only()
+    response = StreamingHttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 
 # BOOKINGS
 class BookingViewSet(viewsets.ModelViewSet):
+    """
+    Bookings of the user and of their hotels, from the live table only.
+    Finished stays moved out by `manage.py archive_bookings` are included in
+    list and export with ?include_archived=true.
+    """
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
         user = self.request.user
         if user.is_authenticated:
+            # IN (member hotel ids) instead of a DISTINCT over the product/hotel/hoteluser join
             return Booking.objects.filter(
-                Q(user=user) | Q(product__hotel__users__user=user)
-            ).distinct()
+                Q(user_id=user.pk) | Q(product__hotel_id__in=get_hotel_ids(user, self.request))
+            )
         return Booking.objects.none()
 
+    def include_archived(self):
+        return self.request.query_params.get('include_archived') in ('1', 'true')
+
+    def get_archived_queryset(self, all_hotels=False):
+        user = self.request.user
+        if not user.is_authenticated:
+            return ArchivedBooking.objects.none()
+        if all_hotels:
+            return ArchivedBooking.objects.all()
+        return ArchivedBooking.objects.filter(
+            Q(user_id=user.pk) | Q(hotel_id__in=get_hotel_ids(user, self.request))
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.include_archived():
+            return super().list(request, *args, **kwargs)
+
+        # Page over (id, created_at, archived) keys of both tables, then load just that page's rows
+        live = self.filter_queryset(self.get_queryset()).annotate(archived=Value(False))
+        archived = self.get_archived_queryset().annotate(archived=Value(True))
+        keys = live.values_list('id', 'created_at', 'archived').union(
+            archived.values_list('id', 'created_at', 'archived'), all=True
+        ).order_by('-created_at', '-id')
+
+        page = self.paginate_queryset(keys)
+        rows = page if page is not None else list(keys)
+        live_ids = [pk for pk, _, is_archived in rows if not is_archived]
+        archived_ids = [pk for pk, _, is_archived in rows if is_archived]
+        by_key = {}
+        for booking in Booking.objects.filter(pk__in=live_ids).select_related('product__hotel'):
+            by_key[(booking.pk, False)] = dict(BookingSerializer(booking).data, archived=False)
+        for booking in ArchivedBooking.objects.filter(pk__in=archived_ids):
+            by_key[(booking.pk, True)] = dict(ArchivedBookingSerializer(booking).data, archived=True)
+
+        data = [by_key[(pk, is_archived)] for pk, _, is_archived in rows if (pk, is_archived) in by_key]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @idempotent('bookings')
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save()
 
+    @action(detail=False, methods=['post'], url_path='bulk', permission_classes=[permissions.IsAuthenticated])
+    @idempotent('bookings-bulk')
+    def bulk(self, request):
+        """
+        POST /api/bookings/bulk/  {"items": [{"product": 1, "check_in": ..., "check_out": ..., "quantity": 3}, ...]}
+        All items are allocated in one transaction or none are.
+        """
+        serializer = BulkBookingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['items']
 
-# M-PESA REAL INTEGRATION
-def get_mpesa_access_token():
-    consumer_key = getattr(settings, "MPESA_CONSUMER_KEY", None)
-    consumer_secret = getattr(settings, "MPESA_CONSUMER_SECRET", None)
+        try:
+            bookings = allocate_bulk(items, user=request.user)
+        except AllocationError as exc:
+            return Response({'created': 0, 'results': exc.results}, status=status.HTTP_409_CONFLICT)
 
-    if not consumer_key or not consumer_secret:
-        return None
+        results, position = [], 0
+        for index, item in enumerate(items):
+            created = bookings[position:position + item['quantity']]
+            position += item['quantity']
+            results.append({
+                'index': index,
+                'status': 'created',
+                'bookings': BookingSummarySerializer(created, many=True).data,
+            })
+        return Response({'created': len(bookings), 'results': results}, status=status.HTTP_201_CREATED)
 
-    url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-    try:
-        response = requests.get(url, auth=(consumer_key, consumer_secret), timeout=10)
-        response.raise_for_status()
-        return response.json().get("access_token")
-    except requests.RequestException:
-        return None
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[permissions.IsAuthenticated])
+    def export(self, request):
+        try:
+            opts = export_filters(request)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
+
+        user = request.user
+        qs = Booking.objects.all()
+        if not user.is_staff:
+            qs = qs.filter(Q(user_id=user.pk) | Q(product__hotel_id__in=get_hotel_ids(user, request)))
+        if opts['hotel']:
+            qs = qs.filter(product__hotel__slug=opts['hotel'])
+        if opts['from']:
+            qs = qs.filter(check_in__gte=opts['from'])
+        if opts['to']:
+            qs = qs.filter(check_in__lte=opts['to'])
+        if opts['statuses']:
+            qs = qs.filter(status__in=opts['statuses'])
 
+        extra = []
+        if self.include_archived():
+            archived = self.get_archived_queryset(all_hotels=user.is_staff)
+            if opts['hotel']:
+                archived = archived.filter(hotel__slug=opts['hotel'])
+            if opts['from']:
+                archived = archived.filter(check_in__gte=opts['from'])
+            if opts['to']:
+                archived = archived.filter(check_in__lte=opts['to'])
+            if opts['statuses']:
+                archived = archived.filter(status__in=opts['statuses'])
+            extra.append((archived, ARCHIVED_BOOKING_EXPORT_FIELDS))
 
+        return streaming_export(qs, BOOKING_EXPORT_FIELDS, opts['export_format'], 'bookings', extra=extra)
+
+
+# FOOD ORDERS
+class OrderViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Anyone may place an order (POST /api/orders/); guests see their own orders
+    and hotel members see their hotels' orders (?hotel=<slug>&status=new,preparing).
+    """
+    serializer_class = OrderSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get_permissions(self):
+        if self.action == 'create':
+            return [permissions.AllowAny()]
+        return super().get_permissions()
+
+    def get_queryset(self):
+        user = self.request.user
+        if not user.is_authenticated:
+            return Order.objects.none()
+        qs = Order.objects.prefetch_related('items').order_by('-id')
+        if not user.is_staff:
+            qs = qs.filter(Q(user_id=user.pk) | Q(hotel_id__in=get_hotel_ids(user, self.request)))
+        hotel = self.request.query_params.get('hotel')
+        if hotel:
+            qs = qs.filter(hotel__slug=hotel)
+        statuses = self.request.query_params.get('status')
+        if statuses:
+            qs = qs.filter(status__in=statuses.split(','))
+        return qs
+
+    def create(self, request):
+        """
+        POST /api/orders/  {"hotel": "<slug>", "table": "12", "items": [{"product": 1, "quantity": 2, "price": "350.00"}]}
+        All items are validated against the menu with one query; any stale price or
+        unavailable item rejects the whole order with per-item results (409).
+        """
+        serializer = OrderCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            order = place_order(
+                data['hotel'], data['items'], user=request.user,
+                table=data['table'], guest_name=data['guest_name'], note=data['note'],
+            )
+        except OrderError as exc:
+            return Response({'results': exc.results}, status=status.HTTP_409_CONFLICT)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='status', permission_classes=[permissions.IsAuthenticated])
+    def set_status(self, request):
+        """POST /api/orders/status/  {"ids": [1, 2], "status": "ready"} (hotel members, one UPDATE for all)"""
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) for pk in ids):
+            return Response({"detail": "ids must be a non-empty list of order ids"}, status=400)
+        serializer = OrderStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        hotel_ids = set(Order.objects.filter(pk__in=ids).values_list('hotel_id', flat=True))
+        if not request.user.is_staff and not hotel_ids <= get_hotel_ids(request.user, request):
+            raise PermissionDenied("You are not a member of that hotel.")
+        updated = set_order_status(Order.objects.filter(pk__in=ids), serializer.validated_data['status'])
+        return Response({'updated': updated})
+
+
+# M-PESA REAL INTEGRATION (Daraja client lives in mpesa.py and loads `requests` on first use)
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([StkPushThrottle])
+@idempotent('mpesa-checkout')
 def mpesa_stk_push(request):
     """
     REAL M-PESA STK PUSH (sandbox)
-    Expects JSON: { "phone": "2547XXXXXXXX", "amount": 100 }
+    Expects JSON: { "phone": "2547XXXXXXXX", "amount": 100, "booking": 12 (optional) }
+    Duplicate pushes for the same phone/amount/booking, in flight or within
+    MPESA_STK_DEDUP_SECONDS of a success, share one Daraja call; with an
+    Idempotency-Key header a retry gets the first response however late it comes.
     """
+    if not isinstance(request.data, dict):
+        return Response({"detail": "Expected a JSON object"}, status=400)
     phone = request.data.get('phone')
     try:
         amount = int(request.data.get('amount', 1))
@@ -244,63 +1005,83 @@ def mpesa_stk_push(request):
     if not phone:
         return Response({"detail": "phone required"}, status=400)
 
-    access_token = get_mpesa_access_token()
-    if not access_token:
-        return Response({"detail": "Could not get access token"}, status=500)
-
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-
-    shortcode = getattr(settings, "MPESA_SHORTCODE", None)
-    passkey = getattr(settings, "MPESA_PASSKEY", None)
-    callback_url = getattr(settings, "MPESA_CALLBACK_URL", None)
+    booking = request.data.get('booking')
+    reference = f"Booking {booking}" if booking else "Booking Payment"
 
-    if not (shortcode and passkey and callback_url):
-        return Response({"detail": "M-Pesa configuration incomplete"}, status=500)
+    data, status_code = singleflight.do(
+        f'stk:{phone}:{amount}:{booking or ""}',
+        lambda: send_stk_push(phone, amount, reference),
+        ttl=getattr(settings, 'MPESA_STK_DEDUP_SECONDS', 30),
+        cache_if=lambda result: result[1] == 200,
+    )
+    checkout_id = data.get('CheckoutRequestID') if status_code == 200 and isinstance(data, dict) else None
+    if checkout_id:
+        # Only callbacks for pushes recorded here are accepted
+        MpesaCheckout.objects.get_or_create(checkout_request_id=checkout_id, defaults={
+            'phone': phone, 'amount': amount, 'booking_id': int(booking) if str(booking).isdigit() else None,
+        })
+    return Response(data, status=status_code)
 
-    data_to_encode = f"{shortcode}{passkey}{timestamp}"
-    password = base64.b64encode(data_to_encode.encode()).decode()
 
-    stk_url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-
-    payload = {
-        "BusinessShortCode": shortcode,
-        "Password": password,
-        "Timestamp": timestamp,
-        "TransactionType": "CustomerPayBillOnline",
-        "Amount": amount,
-        "PartyA": phone,
-        "PartyB": shortcode,
-        "PhoneNumber": phone,
-        "CallBackURL": callback_url,
-        "AccountReference": "Booking Payment",
-        "TransactionDesc": "Hotel Booking"
-    }
-
-    headers = {"Authorization": f"Bearer {access_token}"}
-
-    try:
-        response = requests.post(stk_url, json=payload, headers=headers, timeout=10)
-        response.raise_for_status()
-        return Response(response.json())
-    except requests.RequestException as exc:
-        # Return useful info for debugging
-        return Response({"detail": "M-Pesa request failed", "error": str(exc)}, status=502)
+def mpesa_callback_allowed(request):
+    token = settings.MPESA_CALLBACK_TOKEN
+    if token and not hmac.compare_digest(request.query_params.get('token', ''), token):
+        return False
+    allowed_ips = settings.MPESA_CALLBACK_IPS
+    return not allowed_ips or request.META.get('REMOTE_ADDR') in allowed_ips
 
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def mpesa_callback(request):
     """
-    M-Pesa will POST the transaction result here.
-    Save/verify transaction here as needed.
+    M-Pesa will POST the transaction result here (at MPESA_CALLBACK_URL, with its token).
+    A result for an STK push we initiated is stored on its MpesaCheckout and
+    queued as a payment.completed / payment.failed outbox event in the same
+    transaction; webhooks are sent by `manage.py relay_outbox`. Daraja's
+    retries of a callback already handled are acknowledged and skipped.
     """
-    # Minimal placeholder: log to console (or better: save to DB)
-    try:
-        # Request body structure varies; keep raw payload for now
-        payload = request.data
-        # Example: you can inspect payload['Body']['stkCallback'] for result
-        print("M-PESA CALLBACK RECEIVED:", payload)
-    except Exception as e:
-        print("Error processing callback:", e)
+    if not mpesa_callback_allowed(request):
+        logger.warning("Rejected M-Pesa callback from %s", request.META.get('REMOTE_ADDR'))
+        return Response({"detail": "Forbidden"}, status=403)
+
+    payload = request.data
+    body = payload.get('Body') if isinstance(payload, dict) else None
+    callback = body.get('stkCallback') if isinstance(body, dict) else None
+    checkout_id = callback.get('CheckoutRequestID') if isinstance(callback, dict) else None
+    if not checkout_id:
+        return Response({"status": "received"})
 
+    metadata = {
+        item.get('Name'): item.get('Value')
+        for item in (callback.get('CallbackMetadata') or {}).get('Item', [])
+        if isinstance(item, dict)
+    }
+    result_code = callback.get('ResultCode')
+    with transaction.atomic():
+        checkout = MpesaCheckout.objects.select_for_update().filter(checkout_request_id=checkout_id).first()
+        if checkout is None:
+            logger.warning("M-Pesa callback for unknown CheckoutRequestID %s", checkout_id)
+            return Response({"status": "received"})
+        if checkout.completed_at is not None:
+            return Response({"status": "received"})
+        checkout.result_code = result_code if isinstance(result_code, int) else -1
+        checkout.completed_at = timezone.now()
+        checkout.save(update_fields=['result_code', 'completed_at'])
+        event = {
+            'checkout_request_id': checkout_id,
+            'merchant_request_id': callback.get('MerchantRequestID'),
+            'booking': checkout.booking_id,
+            'result_code': result_code,
+            'result_desc': callback.get('ResultDesc'),
+            'amount': metadata.get('Amount'),
+            'receipt': metadata.get('MpesaReceiptNumber'),
+            'phone': metadata.get('PhoneNumber'),
+        }
+        record_event(
+            'payment.completed' if result_code == 0 else 'payment.failed', event,
+            # Stable per push, so receivers can dedupe however often it is queued
+            event_id=uuid.uuid5(uuid.NAMESPACE_URL, f'mpesa:{checkout_id}'),
+        )
+    logger.info("M-Pesa callback for %s: result %s", checkout_id, result_code)
     return Response({"status": "received"})
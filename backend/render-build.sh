@@ -7,6 +7,9 @@ pip install --upgrade pip
 # Install dependencies
 pip install -r requirements.txt
 
+# Refuse to deploy a misconfigured production setup (e.g. no shared cache)
+python backend/manage.py check --deploy --fail-level ERROR
+
 # Collect static files
 python backend/manage.py collectstatic --noinput
 